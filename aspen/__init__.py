@@ -85,7 +85,7 @@ def serve(website, host='0.0.0.0', port='8080'):
     """Serve a website.
     """
     import os
-    from wsgiref.simple_server import make_server
+    from .server import make_server
 
     port = int(os.environ.get('PORT', port))
     server = make_server(host, port, website)
@@ -44,7 +44,12 @@ from first import first as _first
 from .. import log as _log
 from .. import log_dammit as _log_dammit
 from .. import dispatcher, resources, body_parsers, typecasting
+from ..http import compression
+from ..backcompat import md5 as _md5
 from ..http.request import Request
+from ..http.resource import DYNAMIC_ENCODINGS as _DYNAMIC_ENCODINGS
+from ..http.resource import Static
+from ..http.resource import is_not_modified as _is_not_modified
 from ..http.response import Response
 from ..dispatcher import DispatchResult, DispatchStatus
 
@@ -92,6 +97,7 @@ def dispatch_request_to_filesystem(website, request):
                                 , directory_default     = directory_default
                                 , favicon_default       = website.find_ours('favicon.ico')
                                 , redirect              = website.redirect
+                                , tree                  = website.dispatch_tree
                                  )
 
     for k, v in result.wildcards.iteritems():
@@ -182,6 +188,79 @@ def delegate_error_to_simplate(website, state, response, request=None, resource=
     return {'response': response, 'exception': None}
 
 
+def hash_body_into_etag(website, response, request=None, resource=None):
+    """Give a dynamic response a weak ETag from its body, and 304 if it matches.
+
+    This is off unless the etag_dynamic knob is set. If the response already
+    has an ETag (page one can set one, say from a row version), we use that
+    instead of hashing. Static resources are skipped: they do their own.
+    With compress_dynamic, a client's ETag may have -gzip on it (see
+    compress_response_for_client), which still matches.
+
+    """
+    if not website.etag_dynamic or request is None or response.code != 200:
+        return
+    if isinstance(resource, Static):
+        return
+    etag = response.headers.get('ETag')
+    if etag is None:
+        body = response.body
+        if not isinstance(body, basestring):
+            return
+        if isinstance(body, unicode):
+            body = body.encode(response.charset)
+        etag = response.headers['ETag'] = b'W/"%s"' % _md5(body).hexdigest()
+    encodings = _DYNAMIC_ENCODINGS if website.compress_dynamic else ()
+    if _is_not_modified(request, etag, None, encodings):
+        response.code = 304
+        response.body = b''
+
+
+def compress_response_for_client(website, response, request=None, resource=None):
+    """Gzip the response body if the client accepts it and it's worth it.
+
+    This is off unless the compress_dynamic knob is set. Static resources
+    are skipped: they do their own compression (see compress_static). Bodies
+    that are strings are only compressed if they're at least compress_min_size
+    bytes long. Other iterable bodies are compressed a chunk at a time as they
+    are sent. File bodies are never compressed.
+
+    """
+    if not website.compress_dynamic or request is None:
+        return
+    if isinstance(resource, Static) or response.code in (204, 206, 304) or response.code < 200:
+        return
+    if 'Content-Encoding' in response.headers or hasattr(response.body, 'read'):
+        return
+    media_type = response.headers.get('Content-Type')
+    if media_type is None or not compression.is_compressible(media_type,
+                                                             website.compress_media_types):
+        return
+
+    body = response.body
+    if isinstance(body, basestring):
+        if isinstance(body, unicode):
+            body = body.encode(response.charset)
+        if len(body) < website.compress_min_size:
+            return
+    compression.add_vary(response.headers, b'Accept-Encoding')
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if compression.negotiate_encoding(accept_encoding, ['gzip']) is None:
+        return
+
+    if isinstance(body, bytes):
+        response.body = compression.gzip_compress(body, 6)
+    else:
+        encode = lambda chunk: chunk.encode(response.charset) if isinstance(chunk, unicode) else chunk
+        response.body = compression.gzip_stream(encode(chunk) for chunk in body)
+    response.headers['Content-Encoding'] = b'gzip'
+    if 'Content-Length' in response.headers:
+        response.headers.pop('Content-Length')
+    etag = response.headers.get('ETag')
+    if etag is not None and etag.endswith(b'"'):
+        response.headers['ETag'] = etag[:-1] + b'-gzip"'  # see _DYNAMIC_ENCODINGS
+
+
 def log_traceback_for_exception(website, exception):
     tb = traceback.format_exc()
     _log_dammit(tb)
@@ -0,0 +1,46 @@
+"""
+aspen.caching
++++++++++++++
+
+Cache the rendered output of simplates.
+
+A simplate opts in by declaring a cache policy in page zero::
+
+    __cache__ = {'ttl': 3600, 'querystring': ['page'], 'cookies': ['lang']}
+    [---]
+    ...
+
+Then, for GET and HEAD requests, its 200 responses are kept in the website's
+output_cache for ttl seconds, and served from there without running page one
+or rendering a template. See CachePolicy for what goes into the cache key.
+
+The output cache stores responses in the website's cache backend, which is in
+the process's memory by default, but can be shared between processes (see
+aspen.caching.backends). Use website.cache to cache your own values there, too.
+
+Responses can be tagged, with tags in __cache__ or by adding to
+response.cache_tags in page one. Tags are sent to clients in a Surrogate-Key
+header, and Website.invalidate_tags drops every cached response with any of
+the given tags::
+
+    __cache__ = {'ttl': 3600, 'tags': ['posts']}
+    [---]
+    post = get_post(request.line.uri.path['id'])
+    response.cache_tags.add('post-%d' % post.id)
+    [---]
+    ...
+
+    # elsewhere, after editing a post
+    website.invalidate_tags(['post-%d' % post.id])
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .output import CachedResponse, OutputCache
+from .policy import CachePolicy
+
+# Shut up, PyFlakes.
+CachedResponse, OutputCache, CachePolicy
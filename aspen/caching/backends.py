@@ -0,0 +1,415 @@
+"""
+aspen.caching.backends
+~~~~~~~~~~~~~~~~~~~~~~
+
+Storage for cached values, in-process or shared between worker processes.
+
+A backend maps string keys to picklable values, each with an optional time to
+live and optional tags. Invalidating a tag drops every value that was set with
+it. We implement tags with versions: each tag has a random version stored in
+the backend itself, entries remember the versions of their tags as of when
+they were set, and an entry is only good as long as those still match. So
+invalidating a tag is a single write, no matter how many entries it touches.
+
+We ship three backends:
+
+    - MemoryBackend is an LRU dict, private to the process.
+    - MmapBackend is a fixed-size hash table in a memory-mapped file, shared by
+      every process on a host that maps the same file, and locked with
+      fcntl.lockf.
+    - FilesystemBackend stores one pickle per key in a directory, which can be
+      shared by processes on one host, or on several via a network filesystem.
+      Every so often it prunes expired files, and then the oldest ones.
+
+The cache_backend knob selects one for Website.cache: memory, mmap:<path>, or
+filesystem:<path>.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import binascii
+import errno
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from hashlib import sha1
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from ..exceptions import ConfigurationError
+
+
+Envelope = namedtuple('Envelope', 'value expires tags')
+"""
+    value - what was set
+    expires - the time after which value is gone, or None for never
+    tags - a tuple of (tag, version) tuples
+"""
+
+TAG_PREFIX = '\0tag:'
+
+
+class Backend(object):
+    """Abstract base for cache backends.
+
+    Subclasses implement _load, _store, _remove, and _clear, which traffic in
+    Envelope objects. We take care of expiry and tags on top of those.
+
+    """
+
+    def get(self, key, default=None):
+        """Given a key, return its value, or default if it's missing or stale.
+        """
+        envelope = self._load(key)
+        if envelope is None:
+            return default
+        if not self._is_good(envelope):
+            self._remove(key)
+            return default
+        return envelope.value
+
+    def set(self, key, value, ttl=None, tags=()):
+        """Given a key, a value, a number of seconds or None, and a list of tags, store value.
+        """
+        expires = None if ttl is None else time.time() + ttl
+        versions = tuple((tag, self._tag_version(tag, create=True)) for tag in tags)
+        self._store(key, Envelope(value, expires, versions))
+
+    def delete(self, key):
+        """Given a key, drop its value, if any.
+        """
+        self._remove(key)
+
+    def clear(self):
+        """Drop everything.
+        """
+        self._clear()
+
+    def ttl(self, key):
+        """Given a key, return the number of seconds it has left, or None for forever.
+
+        Raise KeyError if there's no value for key.
+
+        """
+        envelope = self._load(key)
+        if envelope is None or not self._is_good(envelope):
+            raise KeyError(key)
+        if envelope.expires is None:
+            return None
+        return max(envelope.expires - time.time(), 0)
+
+    def invalidate_tag(self, tag):
+        """Given a tag, drop every value that was set with it.
+        """
+        self._store(TAG_PREFIX + tag, Envelope(self._new_version(), None, ()))
+
+    def _is_good(self, envelope):
+        if envelope.expires is not None and envelope.expires <= time.time():
+            return False
+        for tag, version in envelope.tags:
+            if self._tag_version(tag) != version:
+                return False
+        return True
+
+    def _tag_version(self, tag, create=False):
+        envelope = self._load(TAG_PREFIX + tag)
+        if envelope is not None:
+            return envelope.value
+        if not create:
+            return None  # lost, so whatever had it is invalid
+        version = self._new_version()
+        self._store(TAG_PREFIX + tag, Envelope(version, None, ()))
+        return version
+
+    def _new_version(self):
+        return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+    def _load(self, key):
+        """Override. Given a key, return an Envelope or None.
+        """
+        raise NotImplementedError
+
+    def _store(self, key, envelope):
+        """Override. Given a key and an Envelope, store the envelope.
+        """
+        raise NotImplementedError
+
+    def _remove(self, key):
+        """Override. Given a key, remove its envelope, if any.
+        """
+        raise NotImplementedError
+
+    def _clear(self):
+        """Override. Remove all envelopes.
+        """
+        raise NotImplementedError
+
+
+# Memory
+# ======
+
+class MemoryBackend(Backend):
+    """An in-process backend with LRU eviction.
+
+    We hold at most max_entries envelopes (tag versions count). If that's zero
+    we hold nothing.
+
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key):
+        with self._lock:
+            envelope = self._entries.pop(key, None)
+            if envelope is not None:
+                self._entries[key] = envelope  # most recently used
+            return envelope
+
+    def _store(self, key, envelope):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = envelope
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared memory
+# =============
+# The file is divided into nslots slots of slot_size bytes. A key hashes to
+# exactly one slot, and a newer key that hashes to the same slot evicts an
+# older one. Each slot starts with a header: the SHA-1 of its key, and the
+# length of the pickled envelope that follows. Readers and writers lock just
+# the slot they're using.
+
+SLOT_HEADER = struct.Struct(str('!20sI'))
+
+
+def _digest(key):
+    return sha1(key.encode('utf8') if isinstance(key, unicode) else key).digest()
+
+
+class MmapBackend(Backend):
+    """A backend in a memory-mapped file, shared by processes on one host.
+
+    Envelopes that don't fit in a slot aren't stored.
+
+    """
+
+    def __init__(self, path, nslots=1024, slot_size=64 * 1024):
+        if fcntl is None:
+            raise ConfigurationError("MmapBackend needs fcntl, which this platform lacks.")
+        self.path = path
+        self.nslots = nslots
+        self.slot_size = slot_size
+        size = nslots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()  # lockf doesn't exclude threads in one process
+        with self._locked(0, 0, exclusive=True):
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)  # sparse, and zeroed
+        self._map = mmap.mmap(self._fd, size)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _locked(self, offset, length, exclusive):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _slot(self, key):
+        digest = _digest(key)
+        index = struct.unpack(str('!I'), digest[:4])[0] % self.nslots
+        return digest, index * self.slot_size
+
+    def _load(self, key):
+        digest, offset = self._slot(key)
+        with self._locked(offset, self.slot_size, exclusive=False):
+            theirs, length = SLOT_HEADER.unpack_from(self._map, offset)
+            if theirs != digest or length == 0:
+                return None
+            start = offset + SLOT_HEADER.size
+            payload = self._map[start:start+length]
+        try:
+            return pickle.loads(payload)
+        except Exception:
+            return None  # torn by a crashed writer, say
+
+    def _store(self, key, envelope):
+        digest, offset = self._slot(key)
+        payload = pickle.dumps(envelope, pickle.HIGHEST_PROTOCOL)
+        if SLOT_HEADER.size + len(payload) > self.slot_size:
+            self._remove(key)  # don't leave an older value behind
+            return
+        with self._locked(offset, self.slot_size, exclusive=True):
+            start = offset + SLOT_HEADER.size
+            self._map[start:start+len(payload)] = payload
+            SLOT_HEADER.pack_into(self._map, offset, digest, len(payload))
+
+    def _remove(self, key):
+        digest, offset = self._slot(key)
+        with self._locked(offset, self.slot_size, exclusive=True):
+            theirs, length = SLOT_HEADER.unpack_from(self._map, offset)
+            if theirs == digest:
+                SLOT_HEADER.pack_into(self._map, offset, b'\0' * 20, 0)
+
+    def _clear(self):
+        with self._locked(0, 0, exclusive=True):
+            for index in range(self.nslots):
+                SLOT_HEADER.pack_into(self._map, index * self.slot_size, b'\0' * 20, 0)
+
+
+# Filesystem
+# ==========
+
+class FilesystemBackend(Backend):
+    """A backend that stores each envelope in a file in a directory.
+
+    Every prune_every writes (by this instance) we prune the directory: we
+    drop expired files, and then the least recently written ones until at
+    most max_entries are left (tag versions count). Each file starts with its
+    expiry time, pickled on its own, so pruning doesn't read whole values.
+
+    """
+
+    suffix = '.cache'
+
+    def __init__(self, directory, max_entries=1000, prune_every=100):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = itertools.count(1)
+        self.evictions = 0
+        try:
+            os.makedirs(directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+    def path_for(self, key):
+        """Given a key, return the filesystem path of its file.
+        """
+        return os.path.join(self.directory, binascii.hexlify(_digest(key)).decode('ascii') + self.suffix)
+
+    def prune(self):
+        """Drop expired files, and then the oldest ones, down to max_entries.
+        """
+        now, entries = time.time(), []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as fh:
+                    expires = pickle.load(fh)
+                    mtime = os.fstat(fh.fileno()).st_mtime
+            except IOError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+                continue  # pruned by another process
+            except Exception:
+                expires, mtime = 0, 0  # torn or otherwise corrupt
+            if expires is not None and expires <= now:
+                self._unlink(path)
+            else:
+                entries.append((mtime, path))
+        entries.sort()
+        for mtime, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            self._unlink(path)
+            self.evictions += 1
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def _load(self, key):
+        try:
+            with open(self.path_for(key), 'rb') as fh:
+                pickle.load(fh)  # expires, for prune
+                return pickle.load(fh)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+        except Exception:
+            pass  # torn or otherwise corrupt; treat as missing
+        return None
+
+    def _store(self, key, envelope):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(envelope.expires, fh, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(envelope, fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.path_for(key))
+        except:
+            os.unlink(tmp)
+            raise
+        if next(self._writes) % self.prune_every == 0:
+            self.prune()
+
+    def _remove(self, key):
+        self._unlink(self.path_for(key))
+
+    def _clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                self._unlink(os.path.join(self.directory, name))
+
+
+def make_backend(spec, max_entries=1000):
+    """Given a backend spec (see parse.cache_backend), return a Backend.
+
+    max_entries sizes a MemoryBackend or a FilesystemBackend.
+
+    """
+    name, _, path = spec.partition(':')
+    if name == 'memory':
+        return MemoryBackend(max_entries)
+    elif name == 'mmap':
+        return MmapBackend(path)
+    elif name == 'filesystem':
+        return FilesystemBackend(path, max_entries)
+    raise ValueError("Unknown cache backend: %r." % spec)
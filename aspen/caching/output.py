@@ -0,0 +1,198 @@
+"""
+aspen.caching.output
+~~~~~~~~~~~~~~~~~~~~
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+import traceback
+from collections import namedtuple
+from hashlib import sha1
+
+from .backends import MemoryBackend
+from ..http.response import Response
+from ..logging import log_dammit
+
+
+class CachedResponse(namedtuple('CachedResponse', 'code headers body charset expires stale_until')):
+    """A snapshot of a Response.
+
+    expires is the time (a float) after which it's stale, and stale_until is
+    the time after which it's too stale to serve at all.
+
+    """
+
+    @classmethod
+    def capture(cls, response, ttl, stale=0):
+        """Given a Response and numbers of seconds, return a CachedResponse or None.
+
+        None means that the response isn't cacheable: it's not a 200, it sets
+        cookies, or its body isn't a string.
+
+        """
+        if response.code != 200 or response.headers.cookie or 'Set-Cookie' in response.headers:
+            return None
+        if not isinstance(response.body, basestring):
+            return None
+        headers = tuple( (name, value)
+                         for name, values in response.headers.iteritems()
+                         for value in values
+                        )
+        expires = time.time() + ttl
+        return cls(response.code, headers, response.body, response.charset, expires, expires + stale)
+
+    def apply(self, response):
+        """Given a Response, make it like us, and return it.
+        """
+        response.code = self.code
+        response.body = self.body
+        response.charset = self.charset
+        seen = set()
+        for name, value in self.headers:
+            if name in seen:
+                response.headers.add(name, value)
+            else:
+                response.headers[name] = value
+                seen.add(name)
+        return response
+
+
+class Flight(object):
+    """A render in progress, for other threads to wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.cached = None  # the CachedResponse, if the render was cacheable
+
+
+class OutputCache(object):
+    """Cache CachedResponse objects in a Backend (a MemoryBackend by default).
+
+    Keys are tuples of strings, Nones, and such tuples (see CachePolicy), which
+    we hash to make backend keys.
+
+    Use serve to render through the cache. It coalesces concurrent misses for
+    the same key into one render, and it serves stale responses (within
+    their stale window) while re-rendering them in a background thread. Both
+    of those happen per-process, even if the backend is shared.
+
+    """
+
+    def __init__(self, backend=None):
+        self.backend = MemoryBackend() if backend is None else backend
+        self._flights = {}  # key to Flight
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.stale_hits = self.coalesced = 0
+
+    def __contains__(self, key):
+        return self.backend.get(self.backend_key(key)) is not None
+
+    def backend_key(self, key):
+        """Given an output cache key, return a backend key.
+        """
+        return 'output:' + sha1(json.dumps(key).encode('utf8')).hexdigest()
+
+    def _lookup(self, key, now):
+        cached = self.backend.get(self.backend_key(key))
+        if cached is not None and cached.stale_until <= now:
+            cached = None  # the backend's clock is a little ahead of ours, say
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def get(self, key):
+        """Given a key, return a CachedResponse or None.
+
+        The response may be stale. Compare its expires to time.time() to find
+        out.
+
+        """
+        return self._lookup(key, time.time())
+
+    def set(self, key, response, ttl, stale=0):
+        """Given a key, a Response, and numbers of seconds, store the response if we can.
+
+        We tag it in the backend with response.cache_tags.
+
+        Return the CachedResponse, or None if the response wasn't cacheable.
+
+        """
+        cached = CachedResponse.capture(response, ttl, stale)
+        if cached is None:
+            return None
+        self.backend.set(self.backend_key(key), cached, ttl + stale, response.cache_tags)
+        return cached
+
+    def delete(self, key):
+        self.backend.delete(self.backend_key(key))
+
+    def serve(self, key, response, render, ttl, stale=0):
+        """Given a key, a Response, a render function, and numbers of seconds, return a Response.
+
+        The render function takes a Response, fills it in, and returns it (or
+        raises). We call it on response if we don't have a fresh or stale
+        response for key, unless another thread is already rendering key, in
+        which case we wait for it and use its response, if it was cacheable.
+        If all we have is a stale response, we serve that and re-render in the
+        background, unless another thread is already doing so.
+
+        """
+        now = time.time()
+        cached = self._lookup(key, now)
+        with self._lock:
+            flight = self._flights.get(key)
+            if cached is not None:
+                if cached.expires <= now:
+                    self.stale_hits += 1
+                    if flight is None:
+                        self._flights[key] = flight = Flight()
+                        self._revalidate_in_background(key, flight, render, response.charset,
+                                                       ttl, stale)
+                return cached.apply(response)
+            leader = flight is None
+            if leader:
+                self._flights[key] = flight = Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.cached is not None:
+                return flight.cached.apply(response)
+            return render(response)  # the leader's response wasn't shareable
+
+        try:
+            response = render(response)
+            flight.cached = self.set(key, response, ttl, stale)
+            return response
+        finally:
+            self._land(key, flight)
+
+    def _revalidate_in_background(self, key, flight, render, charset, ttl, stale):
+        def revalidate():
+            try:
+                flight.cached = self.set(key, render(Response(charset=charset)), ttl, stale)
+            except Exception:
+                log_dammit("Couldn't re-render a stale response for the output cache:")
+                log_dammit(traceback.format_exc())
+            finally:
+                self._land(key, flight)
+        thread = threading.Thread(target=revalidate, name='OutputCache-revalidate')
+        thread.daemon = True
+        thread.start()
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
@@ -0,0 +1,96 @@
+"""
+aspen.caching.policy
+~~~~~~~~~~~~~~~~~~~~
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+
+class CachePolicy(object):
+    """Model a simplate's declaration of how to cache its output.
+
+    ttl - how many seconds to keep a response for
+    querystring - a list of querystring keys to key on, or None for the whole
+        querystring (the default)
+    cookies - a list of cookie names to key on (by default, none)
+    stale - how many seconds past ttl we may keep serving a response while
+        it's re-rendered in the background (stale-while-revalidate; by
+        default, zero)
+    tags - a list of cache tags for every response (see Website.invalidate_tags);
+        page one can add more per response, to response.cache_tags
+
+    The cache key always includes the simplate's identity (its filesystem path
+    and a hash of its source, so that editing it starts afresh), the URL path,
+    and the negotiated media type.
+
+    """
+
+    KEYS = ('ttl', 'querystring', 'cookies', 'stale', 'tags')
+
+    def __init__(self, ttl, querystring=None, cookies=(), stale=0, tags=()):
+        self.ttl = ttl
+        self.querystring = querystring
+        self.cookies = cookies
+        self.stale = stale
+        self.tags = tags
+
+    @classmethod
+    def from_declaration(cls, declaration):
+        """Given the value of __cache__ from page zero, return a CachePolicy.
+
+        Raise TypeError or ValueError if the declaration is bogus.
+
+        """
+        if not isinstance(declaration, dict):
+            raise TypeError("__cache__ must be a dict, not %s." % type(declaration).__name__)
+        unknown = sorted(set(declaration) - set(cls.KEYS))
+        if unknown:
+            raise ValueError("Unknown key(s) in __cache__: %s." % ', '.join(unknown))
+        if 'ttl' not in declaration:
+            raise ValueError("__cache__ must have a ttl.")
+
+        ttl = declaration['ttl']
+        if not isinstance(ttl, (int, long, float)) or ttl <= 0:
+            raise ValueError("__cache__['ttl'] must be a positive number of seconds.")
+
+        querystring = declaration.get('querystring')
+        if querystring is not None:
+            querystring = _list_of_strings(querystring, 'querystring')
+
+        cookies = _list_of_strings(declaration.get('cookies', ()), 'cookies')
+
+        stale = declaration.get('stale', 0)
+        if not isinstance(stale, (int, long, float)) or stale < 0:
+            raise ValueError("__cache__['stale'] must be a non-negative number of seconds.")
+
+        tags = _list_of_strings(declaration.get('tags', ()), 'tags')
+        if any(not tag or len(tag.split()) != 1 for tag in tags):
+            raise ValueError("__cache__['tags'] can't be empty or contain whitespace.")
+
+        return cls(ttl, querystring, cookies, stale, tags)
+
+    def key_for(self, namespace, request, media_type):
+        """Given a namespace (a tuple), a Request, and a media type, return a cache key.
+        """
+        uri = request.line.uri
+        key = list(namespace) + [uri.path.raw, media_type]
+        if self.querystring is None:
+            key.append(uri.querystring.raw)
+        else:
+            for name in self.querystring:
+                key.append(tuple(uri.querystring.all(name)) if name in uri.querystring else ())
+        cookie = request.headers.cookie
+        for name in self.cookies:
+            morsel = cookie.get(name)
+            key.append(None if morsel is None else morsel.value)
+        return tuple(key)
+
+
+def _list_of_strings(value, name):
+    if isinstance(value, basestring):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not all(isinstance(v, basestring) for v in value):
+        raise TypeError("__cache__[%r] must be a list of strings." % name)
+    return tuple(value)
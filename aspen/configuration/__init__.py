@@ -23,25 +23,47 @@ from ..utils import ascii_dammit
 from ..typecasting import defaults as default_typecasters
 import aspen.body_parsers
 from ..simplates.renderers import factories
+from ..dispatcher import DispatchTree
+from ..http import compression
+from ..simplates.bytecode import BytecodeCache
+from ..caching import OutputCache
+from ..caching.backends import make_backend
 
 default_indices = lambda: ['index.html', 'index.json', 'index',
                            'index.html.spt', 'index.json.spt', 'index.spt']
+default_compress_media_types = lambda: list(compression.MEDIA_TYPES)
 
     # 'name':               (default,               from_unicode)
 KNOBS = \
     { 'base_url':           ('',                    parse.identity)
+    , 'bytecode_cache_dir': (None,                  parse.identity)
+    , 'cache_backend':      ('memory',              parse.cache_backend)
     , 'changes_reload':     (False,                 parse.yes_no)
     , 'charset_dynamic':    ('UTF-8',               parse.charset)
     , 'charset_static':     (None,                  parse.charset)
+    , 'compress_dynamic':   (False,                 parse.yes_no)
+    , 'compress_media_types':(default_compress_media_types, parse.list_)
+    , 'compress_min_size':  (1024,                  int)
+    , 'compress_static':    (False,                 parse.yes_no)
+    , 'etag_dynamic':       (False,                 parse.yes_no)
     , 'indices':            (default_indices,       parse.list_)
+    , 'json_compact':       (False,                 parse.yes_no)
+    , 'json_stream':        (False,                 parse.yes_no)
     , 'list_directories':   (False,                 parse.yes_no)
     , 'logging_threshold':  (0,                     int)
     , 'media_type_default': ('text/plain',          parse.media_type)
     , 'media_type_json':    ('application/json',    parse.media_type)
+    , 'output_cache_size':  (1000,                  int)
+    , 'precompile_dispatch':(False,                 parse.yes_no)
+    , 'precompile_simplates':(False,                parse.yes_no)
     , 'project_root':       (None,                  parse.identity)
     , 'renderer_default':   ('stdlib_percent',      parse.renderer)
+    , 'resource_cache_size':(0,                     int)
     , 'show_tracebacks':    (False,                 parse.yes_no)
+    , 'simplate_fast_locals':(False,                parse.yes_no)
+    , 'stream_static_above':(1048576,               int)
     , 'colorize_tracebacks':(True,                  parse.yes_no)
+    , 'watch_files':        (False,                 parse.yes_no)
     , 'www_root':           (None,                  parse.identity)
      }
 
@@ -205,6 +227,21 @@ class Configurable(object):
 
         self.www_root = os.path.realpath(self.www_root)
 
+        # dispatch tree
+        self.dispatch_tree = None
+        if self.precompile_dispatch:
+            self.dispatch_tree = DispatchTree(self.www_root, self.indices)
+
+        # bytecode cache
+        self.bytecode_cache = None
+        if self.bytecode_cache_dir is not None:
+            self.bytecode_cache_dir = os.path.realpath(self.bytecode_cache_dir)
+            self.bytecode_cache = BytecodeCache(self.bytecode_cache_dir)
+
+        # cache backend, and the output cache for simplates that declare __cache__
+        self.cache = make_backend(self.cache_backend, self.output_cache_size)
+        self.output_cache = OutputCache(self.cache)
+
         # load bodyparsers
         self.body_parsers = {
             "application/x-www-form-urlencoded": aspen.body_parsers.formdata,
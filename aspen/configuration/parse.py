@@ -63,6 +63,17 @@ def list_(value):
 
     return (extend, out)
 
+def cache_backend(value):
+    typecheck(value, unicode)
+    name, colon, path = value.partition(':')
+    if name == 'memory' and not colon:
+        return value
+    if name in ('mmap', 'filesystem'):
+        if not path:
+            raise ValueError("%s needs a path, like %s:/path/to/cache" % (name, name))
+        return value
+    raise ValueError("must be memory, mmap:<path>, or filesystem:<path>")
+
 def renderer(value):
     typecheck(value, unicode)
     if value not in RENDERERS:
@@ -73,7 +73,7 @@ DispatchResult = namedtuple('DispatchResult', 'status match wildcards detail ext
 
 
 def dispatch_abstract(listnodes, is_leaf, traverse, find_index, noext_matched,
-                      startnode, nodepath, redirect):
+                      startnode, nodepath, redirect, describe=None):
     """Given a list of nodenames (in 'nodepath'), return a DispatchResult.
 
     We try to traverse the directed graph rooted at 'startnode' using the
@@ -94,6 +94,10 @@ def dispatch_abstract(listnodes, is_leaf, traverse, find_index, noext_matched,
 
        redirect(location) - redirect to trailing slashes where appropriate
 
+       describe(joinedpath) - (optional) returns a (subnodes,
+        wild_leaf_ns, wild_nonleaf_ns) triple for the specified joined path;
+        if not given, this is computed from listnodes and is_leaf
+
     Wildcards nodenames start with %. Non-leaf wildcards are used as keys in
     wildvals and their actual path names are used as their values. In general,
     the rule for matching is 'most specific wins': $foo looks for isfile($foo)
@@ -108,6 +112,9 @@ def dispatch_abstract(listnodes, is_leaf, traverse, find_index, noext_matched,
     is_leaf_node = lambda n: is_leaf(traverse(curnode, n))
     lastnode_ext = splitext(nodepath[-1])[1]
 
+    if describe is None:
+        describe = lambda joinedpath: describe_node(listnodes, is_leaf, traverse, joinedpath)
+
     def get_wildleaf_fallback():
         wildleaf_fallback = lastnode_ext in wildleafs or None in wildleafs
         if wildleaf_fallback:
@@ -122,17 +129,10 @@ def dispatch_abstract(listnodes, is_leaf, traverse, find_index, noext_matched,
         # check all the possibilities:
         # node.html, node.html.spt, node.spt, node.html/, %node.html/ %*.html.spt, %*.spt
 
-        # don't serve hidden files
-        subnodes = set([ n for n in listnodes(curnode) if not n.startswith('.') ])
+        subnodes, wild_leaf_ns, wild_nonleaf_ns = describe(curnode)
 
         node_noext, node_ext = splitext(node)
 
-        # only maybe because non-spt files aren't wild
-        maybe_wild_nodes = [ n for n in sorted(subnodes) if n.startswith("%") ]
-
-        wild_leaf_ns = [ n for n in maybe_wild_nodes if is_leaf_node(n) and is_spt(n) ]
-        wild_nonleaf_ns = [ n for n in maybe_wild_nodes if not is_leaf_node(n) ]
-
         # store all the fallback possibilities
         remaining = reduce(posixpath.join, nodepath[depth:])
         for n in wild_leaf_ns:
@@ -259,25 +259,133 @@ def dispatch_abstract(listnodes, is_leaf, traverse, find_index, noext_matched,
     return DispatchResult(DispatchStatus.okay, curnode, wildvals, "Found.", {}, True)
 
 
-def match_index(indices, indir):
+def describe_node(listnodes, is_leaf, traverse, joinedpath):
+    """Given the dispatch_abstract callables and a joined path, return a triple.
+
+    The triple is (subnodes, wild_leaf_ns, wild_nonleaf_ns), which is what
+    dispatch_abstract needs to know about each node it traverses.
+
+    """
+    # don't serve hidden files
+    subnodes = set([ n for n in listnodes(joinedpath) if not n.startswith('.') ])
+
+    # only maybe because non-spt files aren't wild
+    maybe_wild_nodes = [ n for n in sorted(subnodes) if n.startswith("%") ]
+
+    is_leaf_node = lambda n: is_leaf(traverse(joinedpath, n))
+    wild_leaf_ns = [ n for n in maybe_wild_nodes if is_leaf_node(n) and n.endswith(".spt") ]
+    wild_nonleaf_ns = [ n for n in maybe_wild_nodes if not is_leaf_node(n) ]
+
+    return subnodes, wild_leaf_ns, wild_nonleaf_ns
+
+
+def match_index(indices, indir, is_leaf=os.path.isfile):
     """return the full path of the first index in indir, or None if not found"""
     for filename in indices:
         index = os.path.join(indir, filename)
-        if os.path.isfile(index):
+        if is_leaf(index):
             return index
     return None
 
 
-def is_first_index(indices, basedir, name):
+def is_first_index(indices, basedir, name, is_leaf=os.path.isfile):
     """is the supplied name the first existing index in the basedir ?"""
     for i in indices:
         if i == name:
             return True
-        if os.path.isfile(os.path.join(basedir, i)):
+        if is_leaf(os.path.join(basedir, i)):
             return False
     return False
 
 
+DispatchNode = namedtuple('DispatchNode', 'subnodes wild_leaf_ns wild_nonleaf_ns index')
+"""
+    subnodes - a frozenset of the names in a directory, not including hidden ones
+    wild_leaf_ns - a sorted tuple of the %wildcard simplates in a directory
+    wild_nonleaf_ns - a sorted tuple of the %wildcard non-leaf nodes in a directory
+    index - the full path of the first index file in a directory, or None
+"""
+
+EMPTY_NODE = DispatchNode(frozenset(), (), (), None)
+
+
+class DispatchTree(object):
+    """Represent a www_root as an immutable tree in memory.
+
+    We walk the filesystem once, at instantiation time, and precompute
+    everything that dispatch_abstract would otherwise work out with os.listdir
+    and os.path.isfile at every level of every request path. Pass an instance
+    to dispatch as ``tree`` to dispatch without touching the filesystem. If
+    files are added or removed under startdir you need a new tree.
+
+    """
+
+    def __init__(self, startdir, indices):
+        self.startdir = startdir
+        self.indices = tuple(indices)
+
+        nodes, leaves = {}, set()
+        for dirpath, dirnames, filenames in os.walk(startdir, followlinks=True):
+            # don't serve hidden files
+            dirnames[:] = [ n for n in dirnames if not n.startswith('.') ]
+            names = dirnames + [ n for n in filenames if not n.startswith('.') ]
+            for name in names:
+                if os.path.isfile(os.path.join(dirpath, name)):
+                    leaves.add(os.path.join(dirpath, name))
+            nodes[dirpath] = names
+
+        self._leaves = frozenset(leaves)
+        self._nodes = {}
+        for dirpath, names in nodes.iteritems():
+            is_leaf_node = lambda n: os.path.join(dirpath, n) in leaves
+            wild = [ n for n in sorted(names) if n.startswith("%") ]
+            index = None
+            for filename in self.indices:
+                if os.path.join(dirpath, filename) in leaves:
+                    index = os.path.join(dirpath, filename)
+                    break
+            self._nodes[dirpath] = DispatchNode( frozenset(names)
+                                               , tuple(n for n in wild if is_leaf_node(n)
+                                                                      and n.endswith(".spt"))
+                                               , tuple(n for n in wild if not is_leaf_node(n))
+                                               , index
+                                                )
+
+    def _node(self, joinedpath):
+        if joinedpath.endswith(os.sep) and joinedpath != os.sep:
+            joinedpath = joinedpath[:-1]
+        return self._nodes.get(joinedpath, EMPTY_NODE)
+
+    def listnodes(self, joinedpath):
+        return self._node(joinedpath).subnodes
+
+    def is_leaf(self, joinedpath):
+        return joinedpath in self._leaves
+
+    def describe(self, joinedpath):
+        node = self._node(joinedpath)
+        return node.subnodes, node.wild_leaf_ns, node.wild_nonleaf_ns
+
+    def find_index(self, joinedpath):
+        return self._node(joinedpath).index
+
+    def is_stale(self, fspath):
+        """Given a filesystem path under startdir that may have changed, return a boolean.
+
+        True means that the change may be one of structure (something was
+        created, deleted, or moved), so you need a new tree. Modifying a
+        file we already know about doesn't count. A directory counts, since
+        (as for a watcher) it means anything under it may have changed.
+
+        """
+        relative = os.path.relpath(fspath, self.startdir)
+        if any(part.startswith('.') and part not in ('.', '..') for part in relative.split(os.sep)):
+            return False  # hidden, so it isn't in any tree
+        if fspath in self._leaves:
+            return not os.path.isfile(fspath)
+        return fspath in self._nodes or os.path.exists(fspath)
+
+
 def update_neg_type(media_type_default, capture_accept, filename):
     media_type = mimetypes.guess_type(filename, strict=False)[0]
     if media_type is None:
@@ -287,19 +395,30 @@ def update_neg_type(media_type_default, capture_accept, filename):
 
 
 def dispatch(indices, media_type_default, pathparts, uripath, querystring, startdir,
-        directory_default, favicon_default, redirect):
+        directory_default, favicon_default, redirect, tree=None):
     """Concretize dispatch_abstract.
+
+    If tree is a DispatchTree for startdir and indices then we dispatch
+    against it instead of against the filesystem.
+
     """
 
     # Set up the real environment for the dispatcher.
     # ===============================================
 
     capture_accept = {}
-    listnodes = os.listdir
-    is_leaf = os.path.isfile
     traverse = os.path.join
-    find_index = lambda x: match_index(indices, x)
     noext_matched = lambda x: update_neg_type(media_type_default, capture_accept, x)
+    if tree is None:
+        listnodes = os.listdir
+        is_leaf = os.path.isfile
+        find_index = lambda x: match_index(indices, x)
+        describe = None
+    else:
+        listnodes = tree.listnodes
+        is_leaf = tree.is_leaf
+        find_index = tree.find_index
+        describe = tree.describe
 
 
     # Dispatch!
@@ -313,6 +432,7 @@ def dispatch(indices, media_type_default, pathparts, uripath, querystring, start
                               , startdir
                               , pathparts
                               , redirect
+                              , describe
                                )
 
     debug(lambda: "dispatch_abstract returned: " + repr(result))
@@ -324,7 +444,7 @@ def dispatch(indices, media_type_default, pathparts, uripath, querystring, start
         debug(lambda: "result.match is true" )
         matchbase, matchname = result.match.rsplit(os.path.sep,1)
         if pathparts[-1] != '' and matchname in indices and \
-                is_first_index(indices, matchbase, matchname):
+                is_first_index(indices, matchbase, matchname, is_leaf):
             # asked for something that maps to a default index file; redirect to / per issue #175
             debug( lambda: "found default index '%s' maps into %r"
                  % (pathparts[-1], indices)
@@ -0,0 +1,175 @@
+"""
+aspen.http.compression
+~~~~~~~~~~~~~~~~~~~~~~
+
+Content-coding negotiation and helpers (http://tools.ietf.org/html/rfc7231#section-5.3.4).
+
+We always support gzip. We support br (Brotli) as well if the brotli library
+is installed.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import zlib
+from io import BytesIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Encodings we can produce, in our order of preference, and the filename
+# suffixes of their precompressed sidecar files.
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+# Compression levels (qualities, for Brotli): moderate ones for compressing
+# while serving, and the maximum for compressing ahead of time (precompress).
+# Brotli at 11 is many times slower than at 5, for a few percent smaller.
+
+LEVELS = {'br': 5, 'gzip': 6}
+MAX_LEVELS = {'br': 11, 'gzip': 9}
+
+
+# Media types that are worth compressing, by default. See is_compressible for
+# the wildcards.
+
+MEDIA_TYPES = [ 'text/*'
+              , '*/*+json'
+              , '*/*+xml'
+              , 'application/javascript'
+              , 'application/json'
+              , 'application/x-javascript'
+              , 'application/xml'
+              , 'image/x-icon'
+               ]
+
+
+def is_compressible(media_type, allowed=MEDIA_TYPES):
+    """Given a media type and a list of allowed ones, return a boolean.
+
+    Allowed media types can be exact (application/json), or they can have a
+    wildcard subtype (text/*), or they can be */* plus a structured syntax
+    suffix (*/*+xml). Parameters on media_type are ignored.
+
+    """
+    media_type = media_type.split(';')[0].strip().lower()
+    for pattern in allowed:
+        if pattern == media_type:
+            return True
+        elif pattern.startswith('*/*+') and media_type.endswith(pattern[3:]):
+            return True
+        elif pattern.endswith('/*') and media_type.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+def add_vary(headers, name):
+    """Given response headers and a request header name, add the name to Vary.
+    """
+    vary = headers.get('Vary')
+    if vary is None:
+        headers['Vary'] = name
+    elif name.lower() not in [v.strip().lower() for v in vary.split(b',')]:
+        headers['Vary'] = vary + b', ' + name
+
+
+def parse_accept_encoding(header):
+    """Given an Accept-Encoding header value, return a dict of content-coding to qvalue.
+    """
+    if isinstance(header, bytes):
+        header = header.decode('ascii', 'ignore')
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(header, available):
+    """Given an Accept-Encoding header value and a sequence of encodings, return one or None.
+
+    The encodings in available should be in our order of preference, which
+    breaks ties between equal qvalues. None means to use no encoding (the
+    identity encoding), and is what you get if header is None.
+
+    """
+    if header is None or not available:
+        return None
+    accepted = parse_accept_encoding(header)
+    if 'x-gzip' in accepted and 'gzip' not in accepted:
+        accepted['gzip'] = accepted['x-gzip']
+    star = accepted.get('*', 0.0)
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, star)
+        if q > best_q:
+            best, best_q = encoding, q
+    if best is not None and accepted.get('identity', 0.0) > best_q:
+        return None
+    return best
+
+
+def compress(encoding, data, level=None):
+    """Given an encoding, a bytestring, and a level, return a compressed bytestring.
+
+    The level defaults to the encoding's entry in LEVELS.
+
+    """
+    if level is None and encoding in LEVELS:
+        level = LEVELS[encoding]
+    if encoding == 'gzip':
+        return gzip_compress(data, level)
+    elif encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=level)
+    raise ValueError("Can't compress with %r." % encoding)
+
+
+def gzip_compress(data, compresslevel=9):
+    """Given a bytestring, return it gzipped.
+
+    The gzip header has no filename and a zero timestamp, so that compressing
+    the same bytes always gives the same result.
+
+    """
+    buf = BytesIO()
+    fh = gzip.GzipFile(filename='', mode='wb', fileobj=buf, compresslevel=compresslevel, mtime=0)
+    try:
+        fh.write(data)
+    finally:
+        fh.close()
+    return buf.getvalue()
+
+
+def gzip_stream(chunks, compresslevel=6):
+    """Given an iterable of bytestrings, yield them gzipped, a chunk at a time.
+
+    Each chunk is flushed through the compressor, so that a streamed body
+    reaches the client as it's produced rather than when zlib's buffer fills.
+
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if not chunk:
+            continue
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,138 @@
+"""
+aspen.http.ranges
+~~~~~~~~~~~~~~~~~
+
+Support for byte range requests (http://tools.ietf.org/html/rfc7233).
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import binascii
+import os
+
+from ..utils import from_rfc822
+
+
+# We serve at most this many ranges (after coalescing) in one response, and
+# the whole resource instead of more, per
+# http://tools.ietf.org/html/rfc7233#section-6.1.
+MAX_RANGES = 16
+
+
+def parse_range(header, size):
+    """Given a Range header value and a resource size, return a list or None.
+
+    The list contains (start, stop) tuples (slice-style, so stop is exclusive)
+    for each satisfiable range in the header, in the order given. It's empty
+    if no range is satisfiable, in which case you want to respond with 416.
+    We return None if the header is malformed or uses a unit other than
+    bytes, because then the spec says to ignore it.
+
+    """
+    try:
+        header = header.decode('ascii') if isinstance(header, bytes) else header
+    except UnicodeDecodeError:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue  # "bytes=0-1,,5-6" is allowed, odd as it is
+        first, dash, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:                   # suffix range: the last n bytes
+            n = int(last)
+            if n == 0 or size == 0:
+                continue
+            ranges.append((max(size - n, 0), size))
+        else:
+            start = int(first)
+            stop = int(last) + 1 if last else size
+            if last and stop <= start:
+                return None             # "5-1" is a syntax error, not just unsatisfiable
+            if start >= size:
+                continue
+            ranges.append((start, min(stop, size)))
+    return ranges
+
+
+def coalesce_ranges(ranges):
+    """Given a list of (start, stop) tuples as from parse_range, return a list of them.
+
+    Ranges that overlap or abut are merged, so that no byte is sent twice.
+    If any are merged then the result is in order of start, otherwise it's
+    the list we were given, in the client's order.
+
+    """
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return ranges if len(merged) == len(ranges) else merged
+
+
+def if_range_matches(if_range, etag, last_modified):
+    """Given an If-Range header value, an entity tag, and a datetime, return a boolean.
+
+    An entity tag in If-Range must match strongly, and a date must match
+    exactly (http://tools.ietf.org/html/rfc7233#section-3.2).
+
+    """
+    if_range = if_range.strip()
+    if if_range.startswith(b'"') or if_range.startswith(b'W/'):
+        return if_range == etag and not etag.startswith(b'W/')
+    try:
+        return from_rfc822(if_range) == last_modified
+    except ValueError:
+        return False
+
+
+def content_range(start, stop, size):
+    """Given a slice-style range and a size, return a Content-Range header value.
+    """
+    return b'bytes %d-%d/%d' % (start, stop - 1, size)
+
+
+def multipart_byteranges(ranges, size, content_type, read):
+    """Assemble a multipart/byteranges body.
+
+    Given a list of (start, stop) tuples, the size of the whole resource, its
+    Content-Type, and a function that takes (start, stop) and returns an
+    iterable of byte strings, return a three-tuple: the Content-Type of the
+    multipart message, its length, and an iterable of byte strings. Nothing is
+    read until the iterable is consumed.
+
+    """
+    boundary = binascii.hexlify(os.urandom(16))
+    heads = []
+    for start, stop in ranges:
+        heads.append( b'--%s\r\nContent-Type: %s\r\nContent-Range: %s\r\n\r\n'
+                    % (boundary, content_type.encode('ascii'), content_range(start, stop, size))
+                     )
+    tail = b'--%s--\r\n' % boundary
+    length = sum(len(head) + (stop - start) + 2 for head, (start, stop) in zip(heads, ranges))
+    length += len(tail)
+
+    def body():
+        for head, (start, stop) in zip(heads, ranges):
+            yield head
+            for chunk in read(start, stop):
+                yield chunk
+            yield b'\r\n'
+        yield tail
+
+    return b'multipart/byteranges; boundary=%s' % boundary, length, body()
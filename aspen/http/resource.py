@@ -1,33 +1,277 @@
-from .response import Response
+import datetime
+import os
+import stat
+
+from . import compression
+from .ranges import MAX_RANGES, coalesce_ranges, content_range, if_range_matches
+from .ranges import multipart_byteranges, parse_range
+from .response import FILE_BLOCK_SIZE, Response
+from ..backcompat import md5
+from ..caching import CachePolicy
 from ..simplates import Simplate, SimplateDefaults, SimplateException
+from ..utils import from_rfc822, to_rfc822, utc
+
+
+def etag_matches(etag, if_none_match, encodings=()):
+    """Given an entity tag, an If-None-Match header value, and encodings, return a boolean.
+
+    This is the weak comparison from
+    http://tools.ietf.org/html/rfc7232#section-3.2. The entity tag also
+    matches itself with any of the encodings as a suffix (foo-gzip for foo),
+    the way compress_response_for_client changes it.
+
+    """
+    if if_none_match.strip() == b'*':
+        return True
+    unweaken = lambda tag: tag[2:] if tag.startswith(b'W/') else tag
+    etag = unweaken(etag)
+    candidates = [etag] + [b'%s-%s"' % (etag[:-1], encoding) for encoding in encodings]
+    return any(unweaken(tag.strip()) in candidates for tag in if_none_match.split(b','))
+
+
+def is_not_modified(request, etag, last_modified=None, encodings=()):
+    """Given a Request, an entity tag, a datetime or None, and encodings, return a boolean.
+
+    This is True if the request is conditional and the client's copy of the
+    resource is current, meaning that we can respond with a 304. Per
+    http://tools.ietf.org/html/rfc7232#section-6, If-None-Match trumps
+    If-Modified-Since. See etag_matches for encodings.
+
+    """
+    if request.line.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(etag, if_none_match, encodings)
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return last_modified <= from_rfc822(if_modified_since)
+        except ValueError:
+            pass
+    return False
+
+
+# Encodings that compress_response_for_client may add to a dynamic ETag.
+DYNAMIC_ENCODINGS = (b'gzip',)
 
 
 class Static(object):
     """Model a static HTTP resource.
+
+    We compute a strong entity tag and a last-modified date at load time, and
+    answer conditional requests with a 304.
+
+    If raw is None then the file is too big to keep in memory (see the
+    stream_static_above knob), and we respond with an open file instead, for
+    the WSGI server to send via wsgi.file_wrapper. In that case the entity tag
+    is computed from the file's mtime and size rather than its contents.
+
+    If the compress_static knob is set then we also negotiate Accept-Encoding.
+    A sidecar file next to ours with an encoding's suffix (foo.css.gz next to
+    foo.css) is taken to be that encoding of our contents, unless it's older
+    than we are (as with precompress), in which case it's stale. Failing that, if
+    we're in memory and our media type is compressible, we compress ourselves
+    once, here, so the compressed bytes live in the resource cache with us.
+    Sidecars of files too big for memory are streamed from disk.
+
     """
 
-    def __init__(self, website, fspath, raw, media_type):
+    def __init__(self, website, fspath, raw, media_type, mtime=None):
         self.website = website
+        self.fspath = fspath
         self.raw = raw
         self.media_type = media_type
         if media_type == 'application/json':
             self.media_type = self.website.media_type_json
+        self.default_media_type = self.media_type  # for error simplates, as with Dynamic
+        if mtime is None or raw is None:
+            st = os.stat(fspath)
+            mtime = st[stat.ST_MTIME] if mtime is None else mtime
+        self.last_modified = datetime.datetime.fromtimestamp(mtime, tz=utc)
+        if raw is None:
+            self.etag = b'"%x-%x"' % (int(mtime), st.st_size)
+        else:
+            self.etag = b'"%s"' % md5(raw).hexdigest()
+
+        self.encoded = {}   # encoding to bytes
+        self.sidecars = {}  # encoding to the fspath of a sidecar too big for memory
+        if website.compress_static:
+            for encoding in compression.ENCODINGS:
+                sidecar = fspath + compression.SUFFIXES[encoding]
+                if os.path.isfile(sidecar) and os.stat(sidecar)[stat.ST_MTIME] >= mtime:
+                    if raw is None:
+                        self.sidecars[encoding] = sidecar
+                    else:
+                        with open(sidecar, 'rb') as fh:
+                            self.encoded[encoding] = fh.read()
+                elif raw is not None and compression.is_compressible(self.media_type, website.compress_media_types):
+                    encoded = compression.compress(encoding, raw)
+                    if len(encoded) < len(raw):
+                        self.encoded[encoding] = encoded
+        self.encodings = [e for e in compression.ENCODINGS if e in self.encoded or e in self.sidecars]
 
     def respond(self, context):
         response = context.get('response', Response())
-        # XXX Perform HTTP caching here.
-        assert type(self.raw) is str # sanity check
-        response.body = self.raw
-        response.headers['Content-Type'] = self.media_type
+        request = context.get('request')
+        encoding = self.negotiate_encoding(request, response)
+        etag = self.etag
+        if encoding is not None:
+            etag = b'%s-%s"' % (etag[:-1], encoding.encode('ascii'))
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = to_rfc822(self.last_modified)
+        response.headers['Accept-Ranges'] = b'bytes'
+        if request is not None and is_not_modified(request, etag, self.last_modified):
+            response.code = 304
+            response.body = b''
+            return response
+
+        content_type = self.media_type
         if self.media_type.startswith('text/'):
             charset = self.website.charset_static
             if charset is None:
                 pass # Let the browser guess.
             else:
                 response.charset = charset
-                response.headers['Content-Type'] += '; charset=' + charset
+                content_type += '; charset=' + charset
+        response.headers['Content-Type'] = content_type
+
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding.encode('ascii')
+            if encoding in self.encoded:
+                response.body = self.encoded[encoding]
+            else:
+                fh = open(self.sidecars[encoding], 'rb')
+                response.body = fh
+                response.headers['Content-Length'] = str(os.fstat(fh.fileno()).st_size)
+            return response
+
+        if self.raw is None:
+            fh = open(self.fspath, 'rb')
+            size = os.fstat(fh.fileno()).st_size
+            read = lambda start, stop: read_window(self.fspath, start, stop)
+        else:
+            assert type(self.raw) is str # sanity check
+            fh = None
+            size = len(self.raw)
+            read = lambda start, stop: [self.raw[start:stop]]
+
+        ranges = self.get_ranges(request, size)
+        if ranges is None:
+            if fh is None:
+                response.body = self.raw
+            else:
+                response.body = fh
+                response.headers['Content-Length'] = str(size)
+            return response
+        if fh is not None:
+            fh.close()  # we'll reopen it for each window
+        if not ranges:
+            response.code = 416
+            response.body = b''
+            response.headers['Content-Range'] = b'bytes */%d' % size
+        elif len(ranges) == 1:
+            start, stop = ranges[0]
+            response.code = 206
+            response.body = read(start, stop) if self.raw is None else self.raw[start:stop]
+            response.headers['Content-Range'] = content_range(start, stop, size)
+            response.headers['Content-Length'] = str(stop - start)
+        else:
+            multipart_type, length, body = multipart_byteranges(ranges, size, content_type, read)
+            response.code = 206
+            response.body = body
+            response.headers['Content-Type'] = multipart_type
+            response.headers['Content-Length'] = str(length)
         return response
 
+    def negotiate_encoding(self, request, response):
+        """Given a Request (or None) and a Response, return an encoding or None.
+
+        None means to respond without any Content-Encoding. We add Vary to the
+        response if it could have gone otherwise. Range requests are for
+        ranges of the unencoded resource, so we never encode those.
+
+        """
+        if not self.encodings:
+            return None
+        compression.add_vary(response.headers, b'Accept-Encoding')
+        if request is None or 'Range' in request.headers:
+            return None
+        return compression.negotiate_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+
+    def get_ranges(self, request, size):
+        """Given a Request (or None) and our size, return a list of ranges or None.
+
+        None means to respond with the whole resource, which we also do for
+        more than MAX_RANGES ranges. See parse_range for the list, which we
+        coalesce (see coalesce_ranges).
+
+        """
+        if request is None or request.line.method != 'GET':
+            return None
+        header = request.headers.get('Range')
+        if header is None:
+            return None
+        if_range = request.headers.get('If-Range')
+        if if_range is not None and not if_range_matches(if_range, self.etag, self.last_modified):
+            return None
+        ranges = parse_range(header, size)
+        if ranges is None:
+            return None
+        ranges = coalesce_ranges(ranges)
+        return ranges if len(ranges) <= MAX_RANGES else None
+
+
+def read_window(fspath, start, stop):
+    """Given a filesystem path and a slice-style range, yield those bytes in blocks.
+    """
+    with open(fspath, 'rb') as fh:
+        fh.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = fh.read(min(remaining, FILE_BLOCK_SIZE))
+            if not chunk:
+                break  # the file shrank under us
+            remaining -= len(chunk)
+            yield chunk
+
+
+def start_stream(chunks):
+    """Given an iterable body, render its first chunk now and return an iterator over all of them.
+
+    That way an exception before the first chunk goes through the usual error
+    handling, rather than surfacing after we've started sending a 200. An
+    empty iterable gives an empty string.
+
+    """
+    chunks = iter(chunks)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return b''
+    return _stream(first, chunks)
+
+
+def _stream(first, chunks):
+    try:
+        yield first
+        for chunk in chunks:
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def materialize(response):
+    """Given a Response, read a streamed body into a string, and return the response.
+    """
+    body = response.body
+    if not isinstance(body, basestring) and not hasattr(body, 'read'):
+        encode = lambda chunk: chunk.encode(response.charset) if isinstance(chunk, unicode) else chunk
+        response.body = b''.join(encode(chunk) for chunk in body)
+    return response
+
 
 class Dynamic(Simplate):
     """Model a dynamic HTTP resource using simplates.
@@ -40,6 +284,17 @@ class Dynamic(Simplate):
 
        Append a charset to text Content-Types if one is known.
 
+       Serve from and store into website.output_cache if page zero declares a
+       __cache__ policy (see aspen.caching).
+
+       Send cache tags from that policy and from response.cache_tags in the
+       Surrogate-Key header.
+
+       Respond with 304 before rendering if page one sets a matching ETag.
+
+       Stream bodies that renderers return as iterables, after rendering the
+       first chunk (see start_stream). Read them in full for the output cache.
+
 
     """
 
@@ -48,22 +303,32 @@ class Dynamic(Simplate):
         initial_context = { 'website': website }
         defaults = SimplateDefaults(website.default_renderers_by_media_type,
                                     website.renderer_factories,
-                                    initial_context)
+                                    initial_context,
+                                    website.bytecode_cache,
+                                    website.simplate_fast_locals)
         super(Dynamic, self).__init__(defaults, fs, raw, default_media_type)
+        self.cache_policy = None
+        if '__cache__' in self.pages[0]:
+            self.cache_policy = CachePolicy.from_declaration(self.pages[0]['__cache__'])
+            self.cache_namespace = (fs, md5(raw).hexdigest())
 
     def respond(self, state):
         accept = dispatch_accept = state['dispatch_result'].extra.get('accept')
         if accept is None:
             accept = state.get('accept_header')
         try:
-            content_type, body = super(Dynamic, self).respond(accept, state)
-            response = state['response']
-            response.body = body
-            if 'Content-Type' not in response.headers:
-                if content_type.startswith('text/') and response.charset is not None:
-                    content_type += '; charset=' + response.charset
-                response.headers['Content-Type'] = content_type
-            return response
+            cache_key = self.get_cache_key(accept, state)
+            if cache_key is None:
+                return self.render_response(accept, state)
+            render = lambda response: materialize(self.render_response( accept
+                                                                      , dict(state, response=response)
+                                                                       ))
+            return self.website.output_cache.serve( cache_key
+                                                  , state['response']
+                                                  , render
+                                                  , self.cache_policy.ttl
+                                                  , self.cache_policy.stale
+                                                   )
         except SimplateException as e:
             # find an Accept header
             if dispatch_accept is not None:  # indirect negotiation
@@ -73,3 +338,45 @@ class Dynamic(Simplate):
                 msg %= ', '.join(e.available_types)
                 raise Response(406, msg.encode('US-ASCII'))
 
+    def render_response(self, accept, state):
+        """Given an Accept header and the request state, run and render, and return state['response'].
+
+        If page one sets an ETag on the response that matches the request's
+        If-None-Match, we skip rendering and respond with 304. With
+        compress_dynamic, the client may have the ETag with -gzip on it.
+
+        """
+        context = self.run(state)
+        response = state['response']
+        etag = response.headers.get('ETag')
+        request = state.get('request')
+        encodings = DYNAMIC_ENCODINGS if self.website.compress_dynamic else ()
+        if etag is not None and request is not None and is_not_modified(request, etag, None, encodings):
+            response.code = 304
+            response.body = b''
+            return response
+        content_type = self.best_match(accept)
+        body = self.render(content_type, context)
+        if not isinstance(body, basestring):
+            body = start_stream(body)
+        response.body = body
+        if 'Content-Type' not in response.headers:
+            if content_type.startswith('text/') and response.charset is not None:
+                content_type += '; charset=' + response.charset
+            response.headers['Content-Type'] = content_type
+        if self.cache_policy is not None:
+            response.cache_tags.update(self.cache_policy.tags)
+        if response.cache_tags:
+            response.headers['Surrogate-Key'] = ' '.join(sorted(response.cache_tags))
+        return response
+
+    def get_cache_key(self, accept, state):
+        """Given an Accept header and the request state, return an output cache key or None.
+        """
+        request = state.get('request')
+        if self.cache_policy is None or request is None:
+            return None
+        if request.line.method not in ('GET', 'HEAD'):
+            return None
+        media_type = self.best_match(accept)
+        return self.cache_policy.key_for(self.cache_namespace, request, media_type)
@@ -11,6 +11,7 @@ from __future__ import unicode_literals
 import os
 import re
 import sys
+from wsgiref.util import FileWrapper
 
 from ..utils import ascii_dammit
 from . import status_strings
@@ -19,18 +20,25 @@ from .baseheaders import BaseHeaders as Headers
 
 class CloseWrapper(object):
     """Conform to WSGI's facility for running code *after* a response is sent.
+
+    We close source, the iterable body was made from, if it can be closed. For
+    a streamed body that's a generator, and closing it runs any finally
+    blocks in it, even if the client went away partway through.
+
     """
 
-    def __init__(self, request, body):
+    def __init__(self, request, body, source=None):
         self.request = request
         self.body = body
+        self.source = source
 
     def __iter__(self):
         return iter(self.body)
 
     def close(self):
-        # No longer using this since we ripped out Socket.IO support.
-        pass
+        close = getattr(self.source, 'close', None)
+        if close is not None:
+            close()
 
 
 # Define a charset name filter.
@@ -46,6 +54,11 @@ class CloseWrapper(object):
 charset_re = re.compile("^[A-Za-z0-9:_()+.-]{1,40}$")
 
 
+# This is how much of a file-like body we hand to the server at a time, if it
+# doesn't have a faster way to send it.
+FILE_BLOCK_SIZE = 64 * 1024
+
+
 class Response(Exception):
     """Represent an HTTP Response message.
     """
@@ -56,7 +69,7 @@ class Response(Exception):
         """Takes an int, a string, a dict, and a basestring.
 
             - code      an HTTP response code, e.g., 404
-            - body      the message body as a string
+            - body      the message body as a string, an iterable of strings, or a file
             - headers   a Headers instance
             - charset   string that will be set in the Content-Type in the future at some point but not now
 
@@ -80,6 +93,7 @@ class Response(Exception):
         self.body = body
         self.headers = Headers(b'')
         self.charset = charset
+        self.cache_tags = set()  # see aspen.caching
         if headers:
             if isinstance(headers, dict):
                 headers = headers.items()
@@ -108,10 +122,16 @@ class Response(Exception):
 
         start_response(wsgi_status, wsgi_headers)
         body = self.body
+        if hasattr(body, 'read'):
+            # A file-like body. Let the server send it however it can best.
+            # http://www.python.org/dev/peps/pep-0333/#optional-platform-specific-file-handling
+            file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+            return file_wrapper(body, FILE_BLOCK_SIZE)
         if isinstance(body, basestring):
             body = [body]
+        source = body
         body = (x.encode(self.charset) if isinstance(x, unicode) else x for x in body)
-        return CloseWrapper(self.request, body)
+        return CloseWrapper(self.request, body, source)
 
     def __repr__(self):
         return "<Response: %s>" % str(self)
@@ -8,20 +8,106 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import datetime
+import inspect
+from collections import OrderedDict
 
 
 # Find a json module.
 # ===================
-# The standard library includes simplejson as json since 2.6, but without the
-# C speedups. So we prefer simplejson if it is available.
+# A backend is a JSON library that aspen.json sits on top of. We use the first
+# one in backends that's installed, and you can register others, or switch to
+# a particular one with use_backend. Out of the box we prefer simplejson, which
+# has C speedups for both encoding and decoding, and fall back to the
+# standard library's json module, which is an older version of simplejson.
 
-try:
-    import simplejson as _json
-except ImportError:
-    try:
-        import json as _json
-    except ImportError:
-        _json = None
+class Backend(object):
+    """A JSON library, as far as aspen.json is concerned.
+
+    module should have the API of the standard library's json module, and we
+    subclass its JSONEncoder to add our encoders. loads is used for decoding
+    strings when no options are given; it defaults to module.loads, so pass a
+    faster decoder if you have one. Likewise dumps, if given, is used for
+    encoding an object with the COMPACT options and no cls. It takes just the
+    object, should return what dumps would, and should call default (below)
+    for objects of types it doesn't know. Without it we use an encoder.
+
+    """
+
+    def __init__(self, name, module, loads=None, dumps=None):
+        self.name = name
+        self.module = module
+        self.loads = module.loads if loads is None else loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return '<Backend %s>' % self.name
+
+
+backends = []   # (name, load) pairs, in order of preference
+backend = None  # the Backend we're using
+_json = None    # its module
+
+def register_backend(name, load, position=None):
+    """Register a JSON backend under name.
+
+    load should take no arguments and return a Backend, or raise ImportError if
+    the library isn't installed. The backend goes last in order of preference,
+    unless you give a position (0 for first). This doesn't switch backends:
+    call use_backend for that.
+
+    """
+    unregister_backend(name)
+    backends.insert(len(backends) if position is None else position, (name, load))
+
+def unregister_backend(name):
+    """Given a name, remove any backend that has been registered under it.
+    """
+    backends[:] = [(_name, load) for _name, load in backends if _name != name]
+
+def use_backend(name=None):
+    """Switch to the named backend, or to the first one that's installed.
+
+    Return the Backend, or None if no backend is installed. Raise KeyError if
+    there's no backend registered under name, and ImportError if it isn't
+    installed.
+
+    """
+    global backend, _json, FriendlyEncoder
+    candidates = [(_name, load) for _name, load in backends if name in (None, _name)]
+    if name is not None and not candidates:
+        raise KeyError(name)
+    found = None
+    for _name, load in candidates:
+        try:
+            found = load()
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+        break
+    backend = found
+    _json = None if found is None else found.module
+    FriendlyEncoder = None if found is None else make_friendly_encoder(found.module.JSONEncoder)
+    return backend
+
+def make_compact_dumps(module):
+    """Given a json-like module, return a dumps for its Backend.
+
+    It reuses a single encoder, which saves setting one up for every call.
+
+    """
+    return module.JSONEncoder(separators=(',', ':'), default=default).encode
+
+def _load_simplejson():
+    import simplejson
+    return Backend('simplejson', simplejson, dumps=make_compact_dumps(simplejson))
+
+def _load_json():
+    import json
+    return Backend('json', json, dumps=make_compact_dumps(json))
+
+register_backend('simplejson', _load_simplejson)
+register_backend('json', _load_json)
 
 
 # Allow arbitrary encoders to be registered.
@@ -41,16 +127,51 @@ def register_encoder(cls, encode):
     """Register the encode function for cls.
 
     An encoder should take an instance of cls and return something basically
-    serializable (strings, lists, dictionaries).
+    serializable (strings, lists, dictionaries). It's used for subclasses of
+    cls too, unless they have an encoder of their own.
 
     """
     encoders[cls] = encode
+    _resolved.clear()
 
 def unregister_encoder(cls):
     """Given a class, remove any encoder that has been registered for it.
     """
     if cls in encoders:
         del encoders[cls]
+    _resolved.clear()
+
+# Finding the encoder for a class means walking its MRO, so we remember what
+# we found (None for nothing) per class. Registering or unregistering an
+# encoder starts over; change encoders through those functions, not directly.
+
+_resolved = {}
+
+def find_encoder(cls):
+    """Given a class, return the encode function registered for it or its nearest base, or None.
+    """
+    try:
+        return _resolved[cls]
+    except KeyError:
+        pass
+    encode = None
+    for base in inspect.getmro(cls):
+        if base in encoders:
+            encode = encoders[base]
+            break
+    _resolved[cls] = encode
+    return encode
+
+def default(obj):
+    """Given an object of a type JSON doesn't know, return something it does, or raise TypeError.
+
+    We use the encoder registered for the object's class (see find_encoder).
+
+    """
+    encode = find_encoder(obj.__class__)
+    if encode is None:
+        raise TypeError(repr(obj) + " is not JSON serializable")
+    return encode(obj)
 
 # http://docs.python.org/library/json.html
 register_encoder(complex, lambda obj: [obj.real, obj.imag])
@@ -66,16 +187,23 @@ register_encoder(datetime.time, lambda obj: obj.isoformat())
 # Allow Aspen to run without JSON support. In practice that means that Python
 # 2.5 users won't be able to use JSON resources.
 
-if _json is not None:
-    class FriendlyEncoder(_json.JSONEncoder):
+def make_friendly_encoder(JSONEncoder):
+    """Given a backend's JSONEncoder class, return a subclass that uses our encoders.
+    """
+    class FriendlyEncoder(JSONEncoder):
         """Add support for additional types to the default JSON encoder.
         """
         def default(self, obj):
-            cls = obj.__class__ # Use this instead of type(obj) because that
-                                # isn't consistent between new- and old-style
-                                # classes, and this is.
-            encode = encoders.get(cls, _json.JSONEncoder.default)
+            # Use obj.__class__ instead of type(obj) because the latter isn't
+            # consistent between new- and old-style classes, and this is.
+            encode = find_encoder(obj.__class__)
+            if encode is None:
+                return JSONEncoder.default(self, obj)
             return encode(obj)
+    return FriendlyEncoder
+
+FriendlyEncoder = None
+use_backend()
 
 def lazy_check():
     if _json is None:
@@ -106,10 +234,14 @@ def dump(*a, **kw):
 
 def loads(*a, **kw):
     lazy_check()
+    if len(a) == 1 and not kw:
+        return backend.loads(a[0])
     return _json.loads(*a, **kw)
 
 def dumps(*a, **kw):
     lazy_check()
+    if backend.dumps is not None and len(a) == 1 and kw == COMPACT:
+        return backend.dumps(a[0])
     if 'cls' not in kw:
         kw['cls'] = FriendlyEncoder
     # Beautify json by default.
@@ -119,3 +251,94 @@ def dumps(*a, **kw):
         kw['indent'] = 4
     return _json.dumps(*a, **kw)
 
+ITEMS_PER_BATCH = 100
+
+def iterencode(obj, **kw):
+    """Given an object and dumps' keyword arguments, return an iterator of JSON strings.
+
+    The strings can be small (a single token, even), so you'll want to buffer
+    them before sending them anywhere.
+
+    An encoder's iterencode never uses the C speedups, which dumps only uses
+    without indentation or key sorting anyway. So in that case (see COMPACT)
+    we encode the items of a list or dict ITEMS_PER_BATCH at a time with the
+    encoder's encode method instead, which does use them, splitting any list
+    or dict of more than ITEMS_PER_BATCH items inside it the same way.
+    Otherwise we use iterencode, at about the same cost as dumps.
+
+    """
+    lazy_check()
+    encode = backend.dumps if kw == COMPACT else None
+    cls = kw.pop('cls', FriendlyEncoder)
+    # Beautify json by default.
+    if 'sort_keys' not in kw:
+        kw['sort_keys'] = True
+    if 'indent' not in kw:
+        kw['indent'] = 4
+    encoder = cls(**kw)
+    if encoder.indent is not None or encoder.sort_keys:
+        return encoder.iterencode(obj)
+    return _iterencode_items(encoder, obj, encode=encode)
+
+def _iterencode_items(encoder, obj, batch=ITEMS_PER_BATCH, markers=None, encode=None):
+    # We encode a batch of items at a time, as a list or dict of their own,
+    # without its brackets, to spread the cost of setting up the encoder. An
+    # item that is itself a list or dict of more than a batch of items gets
+    # the same treatment, so one big nested list doesn't end up in one chunk.
+    # We encode with the backend's dumps, if it has one we can use.
+    encode = encoder.encode if encode is None else encode
+    if not _is_splittable(obj):
+        yield encode(obj)  # a scalar, or a dict whose keys the encoder has to coerce
+        return
+    markers = set() if markers is None else markers
+    if id(obj) in markers:
+        raise ValueError("Circular reference detected")
+    markers.add(id(obj))
+    if isinstance(obj, dict):
+        items = obj.iteritems()
+        mapping = dict if type(obj) is dict else OrderedDict  # keep the order of an OrderedDict, say
+        brackets = '{}'
+    else:
+        items = ((None, value) for value in obj)
+        mapping = list
+        brackets = '[]'
+    yield brackets[0]
+    pending, first = [], True
+    for key, value in items:
+        big = isinstance(value, (list, tuple, dict)) and len(value) > batch and _is_splittable(value)
+        if pending and (big or len(pending) == batch):
+            if not first:
+                yield encoder.item_separator
+            yield encode(mapping(pending))[1:-1]
+            pending, first = [], False
+        if not big:
+            pending.append(value if key is None else (key, value))
+            continue
+        if not first:
+            yield encoder.item_separator
+        if key is not None:
+            yield encode(key) + encoder.key_separator
+        for chunk in _iterencode_items(encoder, value, batch, markers, encode):
+            yield chunk
+        first = False
+    if pending:
+        if not first:
+            yield encoder.item_separator
+        yield encode(mapping(pending))[1:-1]
+    yield brackets[1]
+    markers.remove(id(obj))
+
+def _is_splittable(obj):
+    if isinstance(obj, (list, tuple)):
+        return True
+    return isinstance(obj, dict) and all(isinstance(key, basestring) for key in obj)
+
+
+# Compact mode.
+# =============
+# Pass these to dumps or iterencode for JSON meant for machines rather than
+# people: no indentation or key sorting (both of which cost time on every
+# call), and no spaces after separators.
+
+COMPACT = {'indent': None, 'sort_keys': False, 'separators': (',', ':')}
+
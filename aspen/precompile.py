@@ -0,0 +1,193 @@
+"""
+aspen.precompile
+++++++++++++++++
+
+Warm the resource cache before serving any requests.
+
+Simplates are otherwise compiled lazily, on the first request for each one,
+which means that the first users after a deploy pay for it. Set
+precompile_simplates to have a Website do this at startup, or run:
+
+    python -m aspen.precompile
+
+to check that every simplate under www_root (configured as usual, e.g., with
+ASPEN_WWW_ROOT) compiles, and to see how long each one takes.
+
+Parsing and byte-compiling the Python pages of each simplate is farmed out to
+a pool of worker processes, which send the code objects back marshalled. Page
+zero has to be executed in the process that will serve requests, though, so
+the last step of loading each simplate into resources.__cache__ happens back
+in the calling process, with the workers' code objects standing in for a
+bytecode cache (see SeededBytecodeCache), so that it doesn't have to compile
+anything again. If the website has a real bytecode cache then the workers
+write to that too. We also compile every content page of negotiated
+simplates in the calling process, which would otherwise wait for a request
+that negotiates it.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import marshal
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+
+from . import log_dammit, resources
+from .simplates import Simplate, _decode, compile_python_pages
+from .backcompat import md5
+from .simplates.bytecode import BytecodeCache
+
+
+Report = namedtuple('Report', 'fspath compile_time load_time error')
+"""
+    fspath - the filesystem path of the simplate
+    compile_time - seconds spent parsing and byte-compiling in a worker
+    load_time - seconds spent loading into the resource cache (None if we didn't)
+    error - a traceback string if something went wrong, otherwise None
+"""
+
+
+def find_simplates(website):
+    """Given a website, yield the filesystem path of each simplate it could serve.
+    """
+    for dirpath, dirnames, filenames in os.walk(website.www_root, followlinks=True):
+        dirnames[:] = sorted(n for n in dirnames if not n.startswith('.'))
+        for name in sorted(filenames):
+            if name.endswith('.spt') and not name.startswith('.'):
+                yield os.path.join(dirpath, name)
+
+    # error pages and the like
+    if website.project_root is not None and os.path.isdir(website.project_root):
+        for name in sorted(os.listdir(website.project_root)):
+            if name.endswith('.spt'):
+                yield os.path.join(website.project_root, name)
+
+
+class SeededBytecodeCache(object):
+    """Serve code objects compiled elsewhere, as if from a BytecodeCache.
+
+    seeds maps filesystem paths to (digest, marshalled) tuples as from
+    compile_simplate. Each seed is used once, and only if the simplate still
+    has the same digest. Otherwise (and for storing) we defer to cache, a
+    BytecodeCache or None.
+
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.seeds = {}
+
+    def load(self, fspath, raw):
+        seed = self.seeds.pop(fspath, None)
+        if seed is not None and seed[0] == md5(raw).hexdigest():
+            return marshal.loads(seed[1])
+        return self.cache.load(fspath, raw) if self.cache is not None else None
+
+    def store(self, fspath, raw, codes):
+        if self.cache is not None:
+            self.cache.store(fspath, raw, codes)
+
+
+def compile_simplate(fspath, bytecode_cache_dir=None, fast_locals=False):
+    """Given the filesystem path of a simplate, return a (fspath, seconds, error, seed) tuple.
+
+    We parse the simplate and byte-compile its Python pages, without executing
+    anything, and store the code objects in the bytecode cache in
+    bytecode_cache_dir, if given. The seed is for SeededBytecodeCache: a hash
+    of the simplate and its marshalled code objects (None if there was an
+    error). This is run in worker processes.
+
+    """
+    start = time.time()
+    error = seed = None
+    try:
+        with open(fspath, 'rb') as fh:
+            raw = fh.read()
+        pages = Simplate.parse_into_pages(_decode(raw))
+        codes = compile_python_pages(pages[:2], fspath, fast_locals)
+        if bytecode_cache_dir is not None:
+            BytecodeCache(bytecode_cache_dir).store(fspath, raw, codes)
+        seed = (md5(raw).hexdigest(), marshal.dumps(tuple(codes)))
+    except Exception:
+        error = traceback.format_exc()
+    return fspath, time.time() - start, error, seed
+
+
+def _compile_simplate(args):
+    return compile_simplate(*args)
+
+
+def precompile(website, processes=None):
+    """Given a website, warm resources.__cache__ with all of its simplates.
+
+    processes is the size of the worker pool, defaulting to the number of
+    CPUs. If it's zero we compile in this process instead. Return a list of
+    Report objects.
+
+    """
+    work = [ (fspath, website.bytecode_cache_dir, website.simplate_fast_locals)
+             for fspath in find_simplates(website)
+            ]
+    if processes == 0 or len(work) < 2:
+        compiled = map(_compile_simplate, work)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            compiled = pool.map(_compile_simplate, work)
+        finally:
+            pool.close()
+            pool.join()
+
+    seeded = SeededBytecodeCache(website.bytecode_cache)
+    seeded.seeds.update((fspath, seed) for fspath, _, _, seed in compiled if seed is not None)
+    website.bytecode_cache = seeded
+    reports = []
+    try:
+        for fspath, compile_time, error, seed in compiled:
+            load_time = None
+            if error is None:
+                start = time.time()
+                try:
+                    resources.get(website, fspath).compile_renderers()
+                except Exception as exc:
+                    error = exc.args[0] if exc.args else traceback.format_exc()
+                load_time = time.time() - start
+            reports.append(Report(fspath, compile_time, load_time, error))
+    finally:
+        website.bytecode_cache = seeded.cache
+        seeded.seeds.clear()
+    return reports
+
+
+def log_reports(reports):
+    """Given a list of Report objects, log them. Return the number of errors.
+    """
+    nerrors = 0
+    log_dammit("Precompiled %d simplate(s):" % len(reports))
+    for report in reports:
+        timing = "%7.1fms" % (report.compile_time * 1000)
+        if report.load_time is not None:
+            timing += " + %7.1fms" % (report.load_time * 1000)
+        status = "ok" if report.error is None else "ERROR"
+        log_dammit("  %-5s %-22s %s" % (status, timing, report.fspath))
+        if report.error is not None:
+            nerrors += 1
+            log_dammit(report.error)
+    return nerrors
+
+
+def main():
+    from .website import Website
+    website = Website(precompile_simplates='no')  # we'll do it ourselves
+    nerrors = log_reports(precompile(website))
+    sys.exit(1 if nerrors else 0)
+
+
+if __name__ == '__main__':
+    main()
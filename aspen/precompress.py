@@ -0,0 +1,94 @@
+"""
+aspen.precompress
++++++++++++++++++
+
+Write compressed sidecar files for static assets, at build time.
+
+With compress_static set, a Static resource compresses itself when it's loaded
+unless it finds sidecar files (foo.css.gz, foo.css.br) next to it. Run:
+
+    python -m aspen.precompress
+
+to write those sidecars for every compressible static file under www_root
+(configured as usual, e.g., with ASPEN_WWW_ROOT), so that your servers don't
+spend time compressing at all, and so that you can compress harder than you
+would want to at runtime: we use the maximum levels (compression.MAX_LEVELS)
+rather than the moderate ones Static uses (compression.LEVELS). Sidecars that
+are newer than their originals are left alone, and we don't write a sidecar
+that wouldn't be smaller.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import mimetypes
+import os
+import sys
+
+from . import log_dammit
+from .http import compression
+
+
+def find_assets(www_root):
+    """Given a directory, yield the filesystem path of each file worth compressing.
+    """
+    suffixes = tuple(compression.SUFFIXES.values())
+    if isinstance(www_root, bytes):
+        www_root = www_root.decode(sys.getfilesystemencoding())
+    for dirpath, dirnames, filenames in os.walk(www_root, followlinks=True):
+        dirnames[:] = sorted(n for n in dirnames if not n.startswith('.'))
+        for name in sorted(filenames):
+            if name.startswith('.') or name.endswith('.spt') or name.endswith(suffixes):
+                continue
+            media_type = mimetypes.guess_type(name, strict=False)[0]
+            if media_type is not None and compression.is_compressible(media_type):
+                yield os.path.join(dirpath, name)
+
+
+def precompress_file(fspath, encodings=compression.ENCODINGS):
+    """Given a filesystem path, write its sidecars as needed. Return a list of those written.
+    """
+    written = []
+    mtime = os.stat(fspath).st_mtime
+    raw = None
+    for encoding in encodings:
+        sidecar = fspath + compression.SUFFIXES[encoding]
+        if os.path.isfile(sidecar) and os.stat(sidecar).st_mtime >= mtime:
+            continue
+        if raw is None:
+            with open(fspath, 'rb') as fh:
+                raw = fh.read()
+        compressed = compression.compress(encoding, raw, compression.MAX_LEVELS[encoding])
+        if len(compressed) >= len(raw):
+            continue
+        tmp = sidecar + '.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(compressed)
+        os.rename(tmp, sidecar)
+        written.append(sidecar)
+    return written
+
+
+def precompress(www_root, encodings=compression.ENCODINGS):
+    """Given a directory, write sidecars under it as needed. Return a list of those written.
+    """
+    written = []
+    for fspath in find_assets(www_root):
+        written.extend(precompress_file(fspath, encodings))
+    return written
+
+
+def main():
+    from .website import Website
+    website = Website()
+    written = precompress(website.www_root)
+    log_dammit("Wrote %d compressed file(s) (%s)." % (len(written), ', '.join(compression.ENCODINGS)))
+    for sidecar in written:
+        log_dammit("  " + sidecar)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
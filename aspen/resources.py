@@ -16,74 +16,263 @@ import mimetypes
 import os
 import stat
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict
+from types import CodeType
 
 from .exceptions import LoadError
+from .http import compression
 from .http.resource import Dynamic, Static
 
 
-__cache__ = dict()  # cache, keyed to filesystem path
-
-
-class Entry:
+class Entry(object):
     """An entry in the global resource cache.
     """
 
-    fspath = ''  # The filesystem path [string]
-    mtime = None  # The timestamp of the last change [int]
-    quadruple = None  # A post-processed version of the data [4-tuple]
-    exc = None  # Any exception in reading or compilation [Exception]
+    def __init__(self, fspath):
+        self.fspath = fspath  # The filesystem path [string]
+        self.lock = threading.Lock()  # Held while (re)loading the resource
+        self.size = 0  # The estimated memory footprint of the resource [int]
 
-    def __init__(self):
-        self.fspath = ''
-        self.mtime = 0
-        self.quadruple = ()
+        # The version of the file [tuple, see version], the resource
+        # [Resource], and any exception in reading or compilation [(Exception,
+        # traceback)]. We replace this tuple wholesale, so readers never see it
+        # torn.
+        self.state = (None, None, None)
 
 
-def get(website, fspath):
-    """Given a website and a filesystem path, return a Resource object (with caching).
-    """
+class ResourceCache(object):
+    """A thread-safe, optionally size-bounded cache of resources, keyed to filesystem path.
 
-    # XXX This is not thread-safe. It used to be, but then I simplified it
-    # when I switched to diesel. Now that we have multiple engines, some of
-    # which are threaded, we need to make this thread-safe again.
+    Each entry is loaded by exactly one thread at a time: concurrent requests
+    for an entry that is being (re)loaded wait for that load to finish and
+    then share its result, rather than compiling the resource themselves.
 
-    # Get a cache Entry object.
-    # =========================
+    We estimate the memory used by each resource (see estimate_size), again
+    whenever a simplate compiles a content page lazily (see LazyRenderer). If
+    max_bytes is non-zero, then once the total passes it we evict entries,
+    least recently used first.
 
-    if fspath not in __cache__:
-        entry = Entry()
-        __cache__[fspath] = entry
+    """
 
-    entry = __cache__[fspath]
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # Guards _entries and the counters
+        self._entries = OrderedDict()  # least recently used first
+        self.bytes = 0  # the sum of our entries' sizes [int]
+        self.reset_stats()
+
+    def __contains__(self, fspath):
+        return fspath in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0  # requests served from the cache [int]
+        self.misses = 0  # requests that had to (re)load [int]
+        self.evictions = 0  # entries dropped to stay under max_bytes [int]
+        self.load_time = 0.0  # total seconds spent in load [float]
+
+    def stats(self):
+        """Return a dict of statistics about this cache.
+        """
+        with self._lock:
+            return { 'entries': len(self._entries)
+                   , 'bytes': self.bytes
+                   , 'max_bytes': self.max_bytes
+                   , 'hits': self.hits
+                   , 'misses': self.misses
+                   , 'evictions': self.evictions
+                   , 'load_time': self.load_time
+                    }
+
+    def invalidate(self, fspath):
+        """Given a filesystem path, drop it and anything under it.
+        """
+        prefix = fspath.rstrip(os.sep) + os.sep
+        with self._lock:
+            for cached in [k for k in self._entries if k == fspath or k.startswith(prefix)]:
+                self.bytes -= self._entries.pop(cached).size
+
+    def get(self, website, fspath):
+        """Given a website and a filesystem path, return a Resource object.
+        """
+
+        # Get a cache Entry object.
+        # =========================
+
+        entry = self._entries.get(fspath)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(fspath)
+                if entry is None:
+                    entry = self._entries[fspath] = Entry(fspath)
+
+
+        # Process the resource.
+        # =====================
+        # If a watcher is looking after fspath then it will invalidate our
+        # cache entry when the file (or a sidecar) changes, so we don't need
+        # to stat it ourselves. That's only so while its thread is running.
+
+        stamp, resource, exc = entry.state
+        watcher = website.watcher
+        if not (stamp and watcher is not None and watcher.running and watcher.covers(fspath)):
+            stamp = version(website, fspath)
+
+        hit = entry.state[0] == stamp
+        if not hit:
+            with entry.lock:
+                hit = entry.state[0] == stamp  # someone may have beaten us to it
+                if not hit:
+                    start = time.time()
+                    try:
+                        resource = load(website, fspath, stamp[0])
+                    except:  # capture any Exception
+                        exc = (LoadError(traceback.format_exc()), sys.exc_info()[2])
+                    else:  # reset any previous Exception
+                        exc = None
+                    elapsed = time.time() - start
+                    size = estimate_size(resource) if exc is None else 0
+                    if exc is None and hasattr(resource, 'on_compile'):
+                        resource.on_compile = self._resizer(fspath, entry, resource)
+                    entry.state = (stamp, resource, exc)
+                    with self._lock:
+                        self.misses += 1
+                        self.load_time += elapsed
+                        if self._entries.get(fspath) is entry:  # not invalidated meanwhile
+                            self.bytes += size - entry.size
+                            entry.size = size
+                            self._evict(keep=entry)
+
+        stamp, resource, exc = entry.state
+        if hit:
+            with self._lock:
+                self.hits += 1
+                if self.max_bytes and self._entries.get(fspath) is entry:
+                    # Mark as most recently used.
+                    del self._entries[fspath]
+                    self._entries[fspath] = entry
+
+        if exc is not None:
+            raise exc[0]
+
+
+        # Return
+        # ======
+        # The caller must take care to avoid mutating any context dictionary at
+        # entry.resource.pages[0].
+
+        return resource
+
+    def _resizer(self, fspath, entry, resource):
+        """Return a function that estimates the size of entry's resource again.
+        """
+        def resize():
+            size = estimate_size(resource)
+            with self._lock:
+                if self._entries.get(fspath) is entry and entry.state[1] is resource:
+                    self.bytes += size - entry.size
+                    entry.size = size
+                    self._evict(keep=entry)
+        return resize
+
+    def _evict(self, keep):
+        """Drop least recently used entries (other than keep) until we fit in max_bytes.
+
+        Call this with self._lock held.
+
+        """
+        if not self.max_bytes:
+            return
+        for fspath, entry in list(self._entries.items()):
+            if self.bytes <= self.max_bytes:
+                break
+            if entry is keep:
+                continue
+            del self._entries[fspath]
+            self.bytes -= entry.size
+            self.evictions += 1
+
+
+def version(website, fspath):
+    """Given a website and a filesystem path, return a tuple that changes when the file does.
+
+    The first item is the file's mtime. With compress_static, the rest are the
+    mtimes of its sidecars (None for missing ones), since a Static resource
+    reads those at load time.
 
+    """
+    mtimes = [os.stat(fspath)[stat.ST_MTIME]]
+    if website.compress_static and not fspath.endswith('.spt'):
+        for encoding in compression.ENCODINGS:
+            try:
+                mtimes.append(os.stat(fspath + compression.SUFFIXES[encoding])[stat.ST_MTIME])
+            except OSError:
+                mtimes.append(None)
+    return tuple(mtimes)
 
-    # Process the resource.
-    # =====================
 
-    mtime = os.stat(fspath)[stat.ST_MTIME]
-    if entry.mtime == mtime:  # cache hit
-        if entry.exc is not None:
-            raise entry.exc
-    else:  # cache miss
-        try:
-            entry.resource = load(website, fspath, mtime)
-        except:  # capture any Exception
-            entry.exc = (LoadError(traceback.format_exc()), sys.exc_info()[2])
-        else:  # reset any previous Exception
-            entry.exc = None
+def estimate_size(resource):
+    """Given a Resource object, return a rough estimate of its memory footprint in bytes.
 
-        entry.mtime = mtime
-        if entry.exc is not None:
-            raise entry.exc[0]  # TODO Why [0] here, and not above?
+    We count the strings we hold (raw bytes, decoded text, content pages) and
+    the bytecode of any compiled pages. Objects that are likely to be shared
+    with the rest of the process (modules imported in page zero, etc.) we
+    don't count.
 
+    """
+    size = sys.getsizeof(resource)
+    raw = getattr(resource, 'raw', None)
+    if raw is not None:
+        size += sys.getsizeof(raw)
+    decoded = getattr(resource, 'decoded', None)
+    if decoded is not None:
+        size += sys.getsizeof(decoded)
+    for encoded in getattr(resource, 'encoded', {}).values():
+        size += sys.getsizeof(encoded)
+    pages = getattr(resource, 'pages', None)
+    if pages is not None:
+        size += sys.getsizeof(pages[0])  # just the dict, not what's in it
+        size += _sizeof_code(pages[1])
+        for renderer, media_type in pages[2:]:
+            size += sys.getsizeof(renderer.raw)
+            compiled = getattr(renderer, 'compiled', None)
+            if compiled is not renderer.raw:
+                size += _sizeof_code(compiled) if isinstance(compiled, CodeType) \
+                                               else sys.getsizeof(compiled)
+    return size
+
+
+def _sizeof_code(code):
+    size = sys.getsizeof(code) + sys.getsizeof(code.co_code)
+    for const in code.co_consts:
+        size += _sizeof_code(const) if isinstance(const, CodeType) else sys.getsizeof(const)
+    return size
+
+
+__cache__ = ResourceCache()
+
+
+def get(website, fspath):
+    """Given a website and a filesystem path, return a Resource object (with caching).
+    """
+    return __cache__.get(website, fspath)
 
-    # Return
-    # ======
-    # The caller must take care to avoid mutating any context dictionary at
-    # entry.resource.pages[0].
 
-    return entry.resource
+def invalidate(fspath):
+    """Given a filesystem path, drop it and anything under it from the cache.
+    """
+    __cache__.invalidate(fspath)
 
 
 def load(website, fspath, mtime):
@@ -96,10 +285,14 @@ def load(website, fspath, mtime):
     # ===========
     # .spt files are simplates, which get loaded according to their encoding
     #      and turned into unicode strings internally
-    # non-.spt files are static, possibly binary, so don't get decoded
+    # non-.spt files are static, possibly binary, so don't get decoded; big
+    #      ones aren't loaded at all, but are streamed from disk per request
 
-    with open(fspath, 'rb') as fh:
-        raw = fh.read()
+    raw = None
+    threshold = website.stream_static_above
+    if is_spt or not threshold or os.stat(fspath).st_size <= threshold:
+        with open(fspath, 'rb') as fh:
+            raw = fh.read()
 
     # Compute a media type.
     # =====================
@@ -115,5 +308,6 @@ def load(website, fspath, mtime):
     # ================================
     # An instantiated resource is compiled as far as we can take it.
 
-    Class = Dynamic if is_spt else Static
-    return Class(website, fspath, raw, media_type)
+    if is_spt:
+        return Dynamic(website, fspath, raw, media_type)
+    return Static(website, fspath, raw, media_type, mtime)
@@ -0,0 +1,127 @@
+"""
+aspen.server
+++++++++++++
+
+Extend wsgiref's development server to send file bodies with sendfile(2).
+
+When a response body is a file (see the stream_static_above knob), Aspen
+returns it wrapped in wsgi.file_wrapper, and wsgiref gives its handler a
+chance to send it without copying it through Python. The stock handler passes
+on that chance. Ours takes it if the platform has os.sendfile (Python 3.3+ on
+POSIX), or, on Linux, by calling sendfile(2) in libc via ctypes (no
+third-party libraries needed); otherwise wsgiref falls back to reading the
+file in blocks.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import ctypes
+import errno
+import os
+import sys
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+
+def _load_sendfile():
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(str('libc.so.6'), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'sendfile64'):
+        return None
+    libc.sendfile64.argtypes = [ ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64)
+                               , ctypes.c_size_t
+                                ]
+    libc.sendfile64.restype = ctypes.c_ssize_t
+
+    def sendfile(outfd, infd, offset, count):
+        """Given file descriptors, an offset, and a count, return the number of bytes sent.
+
+        This has the signature of os.sendfile on Linux.
+
+        """
+        sent = libc.sendfile64(outfd, infd, ctypes.byref(ctypes.c_int64(offset)), count)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    return sendfile
+
+sendfile = _load_sendfile()
+
+
+class SendfileHandler(ServerHandler):
+    """A wsgiref handler that implements its sendfile hook.
+    """
+
+    def sendfile(self):
+        """Send self.result using sendfile(2), returning a boolean: did we?
+        """
+        content_length = self.headers.get('Content-Length') if self.headers else None
+        if sendfile is None or content_length is None:
+            return False
+        try:
+            infd = self.result.filelike.fileno()
+            outfd = self.stdout.fileno()
+        except (AttributeError, IOError, ValueError):
+            return False  # not real files after all
+
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+
+        offset = os.lseek(infd, 0, os.SEEK_CUR)
+        remaining = int(content_length)
+        while remaining > 0:
+            try:
+                sent = sendfile(outfd, infd, offset, remaining)
+            except OSError as err:
+                if err.errno == errno.EINTR:
+                    continue
+                raise
+            if sent == 0:
+                break  # the file shrank under us
+            offset += sent
+            remaining -= sent
+            self.bytes_sent += sent
+        return True
+
+
+class RequestHandler(WSGIRequestHandler):
+    """A wsgiref request handler that uses SendfileHandler.
+    """
+
+    def handle(self):
+        # Adapted from wsgiref.simple_server.WSGIRequestHandler.handle.
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        handler = SendfileHandler( self.rfile
+                                 , self.wfile
+                                 , self.get_stderr()
+                                 , self.get_environ()
+                                  )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+def make_server(host, port, app):
+    """Given a host, a port, and a WSGI app, return a server, ready to serve.
+    """
+    server = WSGIServer((host, port), RequestHandler)
+    server.set_app(app)
+    return server
@@ -9,11 +9,15 @@ from __future__ import unicode_literals
 
 import re
 import sys
+import threading
+from collections import OrderedDict
 
 import mimeparse
 
 from .. import log
 from ..backcompat import StringIO
+from .context import make_namespace, names_deleted, names_used
+from .context import compile_page_one_function, run_page_one_function
 from .pagination import split_and_escape, parse_specline, Page
 
 renderer_re = re.compile(r'[a-z0-9.-_]+$')
@@ -22,6 +26,8 @@ media_type_re = re.compile(r'[A-Za-z0-9.+*-]+/[A-Za-z0-9.+*-]+$')
 MIN_PAGES=2
 MAX_PAGES=None
 
+NEGOTIATION_MEMO_SIZE=512
+
 
 def _ordinal(n):
     ords = [ 'zero' , 'one' , 'two', 'three', 'four'
@@ -83,18 +89,123 @@ class SimplateException(Exception):
         self.available_types = available_types
 
 
+# Negotiation
+# ===========
+# Parsing an Accept header is most of the cost of content negotiation, and
+# real traffic only sends a few dozen distinct ones, so we remember outcomes
+# (LRU, bounded) per (available types, Accept header).
+
+_negotiations = OrderedDict()
+_negotiations_lock = threading.Lock()
+
+
+def negotiate(available_types, accept):
+    """Given a tuple of media types and an Accept header, return a media type, '', or None.
+
+    '' means that none of available_types is acceptable, and None means that
+    mimeparse choked on the header (which we log, the first time).
+
+    """
+    key = (available_types, accept)
+    with _negotiations_lock:
+        media_type = _negotiations.pop(key, False)
+        if media_type is not False:
+            _negotiations[key] = media_type  # most recently used
+            return media_type
+    try:
+        media_type = mimeparse.best_match(available_types, accept)
+    except:
+        media_type = None
+        log( "Problem with mimeparse.best_match(%r, %r): %r "
+            % (available_types, accept, sys.exc_info())
+            )
+    with _negotiations_lock:
+        _negotiations[key] = media_type
+        while len(_negotiations) > NEGOTIATION_MEMO_SIZE:
+            _negotiations.popitem(last=False)
+    return media_type
+
+
+def compile_python_pages(pages, fs, fast_locals=False):
+    """Given a sequence of Pages and a filesystem path, return a tuple of code objects.
+
+    With fast_locals, append the result of compile_page_one_function for the
+    second page (a code object or None).
+
+    """
+    codes = tuple(compile(page.padded_content, fs, 'exec') for page in pages)
+    if fast_locals:
+        codes += (compile_page_one_function(pages[1], fs),)
+    return codes
+
+
+class LazyRenderer(object):
+    """Stand in for the renderer of a content page until it's first called.
+
+    Negotiated simplates can have many content pages, and most clients only
+    ever ask for one of them, so we don't compile the others until we have to.
+    If compiling fails we keep the exception and raise it again on every call,
+    rather than trying (and failing) to compile again.
+
+    """
+
+    def __init__(self, make_renderer, fs, page, media_type, on_compile=None):
+        self._make_renderer = make_renderer
+        self._args = (fs, page.content, media_type, page.offset)
+        self._renderer = None
+        self._exc = None
+        self._lock = threading.Lock()
+        self._on_compile = on_compile  # called with no arguments once we've compiled
+
+    def __call__(self, context):
+        return self.renderer(context)
+
+    @property
+    def renderer(self):
+        """The real renderer, compiled on first access.
+        """
+        if self._renderer is None:
+            with self._lock:
+                if self._renderer is None and self._exc is None:
+                    try:
+                        self._renderer = self._make_renderer(*self._args)
+                    except Exception as exc:
+                        self._exc = exc
+                    else:
+                        if self._on_compile is not None:
+                            self._on_compile()
+            if self._exc is not None:
+                raise self._exc
+        return self._renderer
+
+    @property
+    def raw(self):
+        return self._args[1]
+
+    @property
+    def compiled(self):
+        """The real renderer's compiled, or raw if it hasn't been compiled yet.
+        """
+        return self.raw if self._renderer is None else self._renderer.compiled
+
+
 class SimplateDefaults(object):
-    def __init__(self, renderers_by_media_type, renderer_factories, initial_context):
+    def __init__(self, renderers_by_media_type, renderer_factories, initial_context,
+                 bytecode_cache=None, fast_locals=False):
         """
         Things that are usually the same across all simplates:
 
         renderers_by_media_type - dict[media_type_name] -> renderer_name
         renderer_factories - dict[renderer_name] -> renderer_factory
         initial_context - initial context passed into the 'run-once' page
+        bytecode_cache - a BytecodeCache for compiled pages, or None
+        fast_locals - whether to run the 'run-every' page as a function
         """
         self.renderers_by_media_type = renderers_by_media_type # type: Dict[str, str]
         self.renderer_factories = renderer_factories           # type: Dict[str, Callable]
         self.initial_context = initial_context                 # type: Dict[str, object]
+        self.bytecode_cache = bytecode_cache                   # type: BytecodeCache
+        self.fast_locals = fast_locals                         # type: bool
 
 
 class Simplate(object):
@@ -119,6 +230,7 @@ class Simplate(object):
 
         self.renderers = {}         # mapping of media type to render function
         self.available_types = []   # ordered sequence of media types
+        self.on_compile = None      # called when a LazyRenderer compiles (see resources)
         pages = self.parse_into_pages(self.decoded)
         self.pages = self.compile_pages(pages)
 
@@ -138,17 +250,13 @@ class Simplate(object):
         if accept is None:
             # No accept header provided, use the default
             return media_type
-        try:
-            media_type = mimeparse.best_match(self.available_types, accept)
-        except:
-            # exception means don't override the defaults
-            log( "Problem with mimeparse.best_match(%r, %r): %r "
-                % (self.available_types, accept, sys.exc_info())
-                )
-        else:
-            if media_type == '':    # breakdown in negotiations
-                raise SimplateException(self.available_types)
-        return media_type
+        match = negotiate(tuple(self.available_types), accept)
+        if match is None:
+            # mimeparse choked, which means don't override the defaults
+            return media_type
+        if match == '':    # breakdown in negotiations
+            raise SimplateException(self.available_types)
+        return match
 
 
     def respond(self, accept, context):
@@ -161,28 +269,59 @@ class Simplate(object):
                   over from the execution of the zeroth page
         """
 
-        # copy the state dict to avoid accidentally mutating it
-        context = dict(context)
-        # override it with values from the first page
-        context.update(self.pages[0])
+        context = self.run(context)
+        # find matching media type
+        media_type = self.best_match(accept)
+        # render it
+        body = self.render(media_type, context)
+
+        return media_type, body
+
+
+    def run(self, context):
+        """
+        execute the second page, and return the context to render with
+
+        context - as for respond
+        """
+
+        # pick out what the second page needs from the first page and the
+        # state, without mutating either (see context.py)
+        namespace = make_namespace(self.page_one_names, self.pages[0], context)
         # use this as the context to execute the second page in
-        exec(self.pages[1], context)
+        if self.page_one_function is None or \
+           not run_page_one_function(self.page_one_function, namespace):
+            exec(self.pages[1], namespace)
+        if self.page_one_names is not None:  # otherwise it's a full copy already
+            namespace.fall_back((self.pages[0], context), self.page_one_deletes)
+        context = namespace
 
         if '__all__' in context:
             # templates will only see variables named in __all__
             context = dict([ (k, context[k]) for k in context['__all__'] ])
 
-        # find matching media type
-        media_type = self.best_match(accept)
-        # load that renderer
-        render = self.renderers[media_type]
-        # render it
-        body = render(context)
+        return context
 
-        return media_type, body
+
+    def render(self, media_type, context):
+        """
+        render the content page for media_type, which must be available
+
+        context - as returned by run
+        """
+        return self.renderers[media_type](context)
+
+
+    def compile_renderers(self):
+        """Compile any content pages that haven't been yet.
+        """
+        for renderer in self.renderers.values():
+            if isinstance(renderer, LazyRenderer):
+                renderer.renderer
 
 
-    def parse_into_pages(self, decoded):
+    @staticmethod
+    def parse_into_pages(decoded):
         """Given a bytestring that is the entire simplate, return a list of pages.
 
         If there's one page, it's a template.
@@ -213,35 +352,60 @@ class Simplate(object):
         Page 1 is the 'run every' page - it is compiled for easier execution
             later, and stored in self.pages[1]
         Subsequent pages are templates, so each one's content_type and
-            respective renderer are stored as a tuple in self.pages[n]
+            respective renderer are stored as a tuple in self.pages[n]. If
+            there's more than one, their renderers are LazyRenderers.
         """
 
         # Exec the first page and compile the second.
         # ===========================================
 
-        one, two = pages[:2]
+        codes = self.compile_python_pages(pages[:2])
+        one, two = codes[:2]
 
         context = dict()
         context['__file__'] = self.fs
         context.update(self.defaults.initial_context)
 
-        one = compile(one.padded_content, self.fs, 'exec')
         exec one in context    # mutate context
         one = context          # store it
-
-        two = compile(two.padded_content, self.fs, 'exec')
+        self.page_one_names = names_used(two)
+        self.page_one_deletes = names_deleted(two)
+        self.page_one_function = codes[2] if len(codes) > 2 else None
 
         pages[:2] = (one, two)
-        pages[2:] = (self.compile_page(page) for page in pages[2:])
+        lazy = len(pages) > 3
+        pages[2:] = (self.compile_page(page, lazy) for page in pages[2:])
 
         return pages
 
 
-    def compile_page(self, page):
+    def compile_python_pages(self, pages):
+        """Given the first two pages, return a tuple of code objects (see compile_python_pages).
+
+        We use our bytecode cache if we have one.
+        """
+        cache = self.defaults.bytecode_cache
+        fast_locals = self.defaults.fast_locals
+        codes = cache.load(self.fs, self.raw) if cache is not None else None
+        if codes is not None and len(codes) != (3 if fast_locals else 2):
+            codes = None  # cached with fast_locals the other way
+        if codes is None:
+            codes = compile_python_pages(pages, self.fs, fast_locals)
+            if cache is not None:
+                cache.store(self.fs, self.raw, codes)
+        return codes
+
+
+    def compile_page(self, page, lazy=False):
         """Given a Page, return a (renderer, media type) pair.
+
+        With lazy, the renderer is a LazyRenderer.
         """
         make_renderer, media_type = self._parse_specline(page.header)
-        renderer = make_renderer(self.fs, page.content, media_type, page.offset)
+        if lazy:
+            renderer = LazyRenderer(make_renderer, self.fs, page, media_type, self._renderer_compiled)
+        else:
+            renderer = make_renderer(self.fs, page.content, media_type, page.offset)
         if media_type in self.renderers:
             raise SyntaxError("Two content pages defined for %s." % media_type)
 
@@ -251,6 +415,10 @@ class Simplate(object):
 
         return (renderer, media_type)  # back to parent class
 
+    def _renderer_compiled(self):
+        if self.on_compile is not None:
+            self.on_compile()
+
     def _parse_specline(self, specline):
         """Given a bytestring, return a two-tuple.
 
@@ -0,0 +1,85 @@
+"""
+aspen.simplates.bytecode
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Cache the compiled Python pages of simplates on disk.
+
+This is like __pycache__ for .py files: a fresh process (a new worker, or a
+restart under changes_reload) can load code objects with marshal instead of
+compiling page zero and page one of every simplate again. Each simplate gets
+one file in the cache directory, named after a hash of its filesystem path,
+and the file is only used if the simplate's mtime and size and the Python
+version all still match.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import imp
+import marshal
+import os
+import tempfile
+
+from .. import log
+
+
+MAGIC = imp.get_magic()  # changes with each bytecode format
+SUFFIX = '.spc'
+
+
+class BytecodeCache(object):
+    """Store and retrieve code objects for simplates in a directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, fspath):
+        """Given the filesystem path of a simplate, return the path of its cache file.
+        """
+        name = hashlib.sha1(fspath.encode('UTF-8')).hexdigest()
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def _header(self, fspath):
+        st = os.stat(fspath)
+        return (MAGIC, marshal.version, fspath, st.st_mtime, st.st_size)
+
+    def load(self, fspath, raw):
+        """Given a filesystem path and its raw bytes, return a tuple of code objects or None.
+        """
+        try:
+            with open(self.path_for(fspath), 'rb') as fh:
+                header, codes = marshal.load(fh)
+            if header != self._header(fspath) or header[-1] != len(raw):
+                return None  # stale
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None  # missing or corrupt
+        return codes
+
+    def store(self, fspath, raw, codes):
+        """Given a filesystem path, its raw bytes, and a tuple of code objects, cache the latter.
+
+        We write to a temporary file and rename it into place, so concurrent
+        readers never see a partial file. Failures are logged, not raised:
+        the cache is only an optimization.
+
+        """
+        try:
+            header = self._header(fspath)
+            if header[-1] != len(raw):
+                return  # it's changed since it was read
+            try:
+                os.makedirs(self.directory)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            fd, tmp = tempfile.mkstemp(suffix=SUFFIX, dir=self.directory)
+            with os.fdopen(fd, 'wb') as fh:
+                marshal.dump((header, tuple(codes)), fh)
+            os.rename(tmp, self.path_for(fspath))
+        except (IOError, OSError) as err:
+            log("Couldn't write bytecode cache for %s: %s" % (fspath, err))
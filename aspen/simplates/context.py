@@ -0,0 +1,333 @@
+"""
+aspen.simplates.context
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Page one of a simplate runs on every request, in a namespace made of the
+request state, overridden by the names page zero defined, overridden in turn
+by whatever page one assigns. We used to build that namespace by copying the
+state and page zero into a new dict for each request, which is expensive when
+page zero defines a lot of names (imports, helpers, constants).
+
+Now we only copy the names page one actually refers to (see names_used) into
+its namespace, which is a Context: a dict that, once page one has run, falls
+back to page zero and then the state for names it doesn't have, without
+copying either. The content pages render with it. Neither page zero nor the
+state is mutated by page one's assignments, and a name that page one deletes
+stays deleted, as it did when page one ran in a full copy.
+
+If page one gets at its namespace dynamically (with globals(), locals(),
+vars(), eval, or exec) we can't know what it needs, so we copy everything, as
+before.
+
+With the simplate_fast_locals knob, we go further and compile page one as the
+body of a function (see compile_page_one_function), so that its variables are
+fast locals rather than dict entries. Names that page one assigns are passed
+in as arguments, so it can still update values from page zero or the state
+(n += 1), and the function returns its locals for the content pages. A
+variable that page one closes over (in a nested function or lambda) can't be
+deleted when there's nothing to inherit, so unless page one assigns it before
+anything else mentions it, we pass it in too, and if there's nothing to pass
+for it then we run page one with exec for that request. Pages that get at
+their namespace dynamically, or that use import *, always run with exec.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import ast
+import dis
+try:                # 3
+    import builtins
+except ImportError: # 2
+    import __builtin__ as builtins
+from types import CodeType, FunctionType
+
+
+DYNAMIC_NAMES = frozenset(['dir', 'eval', 'exec', 'execfile', 'globals', 'locals', 'vars'])
+EXEC_STMT = dis.opmap.get('EXEC_STMT')  # Python 2 only
+DELETE_NAME = dis.opmap['DELETE_NAME']
+DELETE_GLOBAL = dis.opmap['DELETE_GLOBAL']
+
+PAGE_ONE = '__page_one__'
+UNBOUND_NAME = '__unbound__'
+UNBOUND = object()  # passed for arguments that have nothing to inherit
+
+
+def names_used(code):
+    """Given a code object, return a frozenset of the global names it may load, or None.
+
+    We include the names used by functions, classes, and generator expressions
+    defined in code, since those look names up in the same globals. None means
+    that code gets at its namespace dynamically.
+
+    """
+    names = set()
+    for code in _walk(code):
+        if EXEC_STMT is not None and _has_opcode(code, EXEC_STMT):
+            return None
+        names.update(code.co_names)
+    if names & DYNAMIC_NAMES:
+        return None
+    return frozenset(names)
+
+
+def names_deleted(code):
+    """Given a code object, return a frozenset of the global names it may delete.
+    """
+    names = set()
+    for nested in _walk(code):
+        opcodes = (DELETE_NAME, DELETE_GLOBAL) if nested is code else (DELETE_GLOBAL,)
+        for opcode in opcodes:
+            names.update(nested.co_names[arg] for arg in _opargs(nested, opcode))
+    return frozenset(names)
+
+
+class Context(dict):
+    """A dict of page one's namespace that falls back to other dicts.
+
+    Page one runs in it as a plain dict. Then we call fall_back, after which
+    looking up, testing for, and iterating over names also covers the
+    fallbacks (page zero and the state), in order, except for hidden names.
+    Assignments go to the dict itself. Only dict(context) and **context see
+    just the dict itself (CPython copies a dict subclass without asking it),
+    so renderers that want a flat copy should call context.copy().
+
+    """
+
+    __slots__ = ('fallbacks', 'hidden')
+
+    def __init__(self, *a, **kw):
+        dict.__init__(self, *a, **kw)
+        self.fallbacks = ()
+        self.hidden = frozenset()
+
+    def fall_back(self, fallbacks, deleted=()):
+        """Given a sequence of dicts and names_deleted for page one, fall back to the dicts.
+
+        Deleted names that we don't have are hidden, so page one can hide a
+        name in page zero or the state with del.
+
+        """
+        self.fallbacks = tuple(fallbacks)
+        self.hidden = frozenset(name for name in deleted if not dict.__contains__(self, name))
+
+    def __missing__(self, name):
+        if name not in self.hidden:
+            for fallback in self.fallbacks:
+                if name in fallback:
+                    return fallback[name]
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        if dict.__contains__(self, name):
+            return True
+        return name not in self.hidden and any(name in fallback for fallback in self.fallbacks)
+
+    has_key = __contains__
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def copy(self):
+        """Return a plain dict of everything we can see.
+        """
+        flat = {}
+        for fallback in reversed(self.fallbacks):
+            flat.update(fallback)
+        for name in self.hidden:
+            flat.pop(name, None)
+        flat.update(dict.items(self))
+        return flat
+
+    def keys(self):
+        return self.copy().keys()
+
+    def values(self):
+        return self.copy().values()
+
+    def items(self):
+        return self.copy().items()
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return self.copy().itervalues()
+
+    def iteritems(self):
+        return self.copy().iteritems()
+
+    def __len__(self):
+        return len(self.copy())
+
+
+def make_namespace(names, page_zero, state):
+    """Given names_used for page one, page zero's namespace, and the state, return a new dict.
+
+    Page one will run in that dict. It's a Context unless names is None.
+
+    """
+    if names is None:
+        namespace = dict(state)
+        namespace.update(page_zero)
+        return namespace
+    namespace = Context()
+    for name in names:
+        if name in page_zero:
+            namespace[name] = page_zero[name]
+        elif name in state:
+            namespace[name] = state[name]
+    return namespace
+
+
+def compile_page_one_function(page, fs):
+    """Given page one (a Page) and a filesystem path, return a code object or None.
+
+    The code object is for a function that takes the names page one assigns
+    (see page_one_arguments), runs page one, and returns its locals. None
+    means page one has to run with exec instead.
+
+    """
+    source = page.padded_content
+    if names_used(compile(source, fs, 'exec')) is None:
+        return None
+    body = ast.parse(source, fs).body
+    for node in ast.walk(ast.Module(body)):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names):
+            return None
+
+    # Compile once to find out which names are local, then again to take those as arguments.
+    code = _function_code(_wrap(body, (), fs), fs)
+    assigned = code.co_varnames
+    bound_first = _bound_first(body, code.co_cellvars)
+    closed = tuple(name for name in code.co_cellvars if name not in bound_first)
+    arguments = assigned + closed + (UNBOUND_NAME,)
+    prologue = ''.join( 'if {0} is {1}: del {0}\n'.format(name, UNBOUND_NAME)
+                        for name in assigned
+                       )
+    epilogue = 'del {0}\nreturn locals()\n'.format(UNBOUND_NAME)
+    body = ast.parse(prologue).body + body + ast.parse(epilogue).body
+    return _function_code(_wrap(body, arguments, fs), fs)
+
+
+def page_one_arguments(code):
+    """Given a code object from compile_page_one_function, return its argument names.
+
+    The last one is for UNBOUND.
+
+    """
+    return code.co_varnames[:code.co_argcount]
+
+
+def run_page_one_function(code, namespace):
+    """Given a code object from compile_page_one_function and a namespace, run it and return True.
+
+    The namespace is as from make_namespace. It's updated with page one's
+    locals, and loses the names page one deleted. If page one closes over a
+    name that has nothing in namespace to inherit, return False without
+    running anything: page one has to run with exec this time.
+
+    """
+    names = page_one_arguments(code)[:-1]
+    if any(name not in namespace for name in code.co_cellvars if name in names):
+        return False
+    namespace.setdefault('__builtins__', builtins)  # as exec would
+    function = FunctionType(code, namespace)
+    arguments = [namespace.get(name, UNBOUND) for name in names]
+    found = function(*(arguments + [UNBOUND]))
+    for name in names:
+        if name not in found:
+            namespace.pop(name, None)  # page one deleted it
+    namespace.update(found)
+    return True
+
+
+def _bound_first(body, names):
+    """Given a list of statements and some names, return those bound before they're used.
+
+    Only simple bindings at the top level count (assignments to plain names,
+    def, class, and import), and any other mention of a name, however deeply
+    nested, counts as a use.
+
+    """
+    pending, bound_first = set(names), set()
+    for stmt in body:
+        if not pending:
+            break
+        if isinstance(stmt, ast.Assign) and all(isinstance(t, ast.Name) for t in stmt.targets):
+            bound, mentioned = set(t.id for t in stmt.targets), _mentions(stmt.value)
+        elif isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            header = stmt.decorator_list + (stmt.args.defaults if hasattr(stmt, 'args') else stmt.bases)
+            bound = set([stmt.name])
+            mentioned = _mentions(*header) | (_mentions(*stmt.body) - bound)
+        elif isinstance(stmt, ast.Import):
+            bound = set((alias.asname or alias.name).split('.')[0] for alias in stmt.names)
+            mentioned = set()
+        else:
+            bound, mentioned = set(), _mentions(stmt)
+        pending -= mentioned
+        bound_first |= bound & pending
+        pending -= bound
+    return bound_first
+
+
+def _mentions(*nodes):
+    mentioned = set()
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                mentioned.add(child.id)
+            elif isinstance(child, (ast.FunctionDef, ast.ClassDef)):
+                mentioned.add(child.name)
+            elif isinstance(child, ast.alias):
+                mentioned.add((child.asname or child.name).split('.')[0])
+            elif isinstance(child, ast.Global):
+                mentioned.update(child.names)
+    return mentioned
+
+
+def _wrap(body, arguments, fs):
+    module = ast.parse('def {0}({1}): pass\n'.format(PAGE_ONE, ', '.join(arguments)), fs)
+    if body:
+        module.body[0].body = body  # an empty body crashes the compiler; keep pass
+    return ast.fix_missing_locations(module)
+
+
+def _function_code(module, fs):
+    for const in compile(module, fs, 'exec').co_consts:
+        if isinstance(const, CodeType) and const.co_name == PAGE_ONE:
+            return const
+
+
+def _walk(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            for nested in _walk(const):
+                yield nested
+
+
+def _has_opcode(code, opcode):
+    raw = bytearray(code.co_code)
+    i, n = 0, len(raw)
+    while i < n:
+        if raw[i] == opcode:
+            return True
+        i += 3 if raw[i] >= dis.HAVE_ARGUMENT else 1
+    return False
+
+
+def _opargs(code, opcode):
+    raw = bytearray(code.co_code)
+    i, n = 0, len(raw)
+    while i < n:
+        if raw[i] == opcode:
+            yield raw[i+1] | (raw[i+2] << 8)
+        i += 3 if raw[i] >= dis.HAVE_ARGUMENT else 1
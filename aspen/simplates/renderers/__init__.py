@@ -41,7 +41,11 @@ return a function (confused yet?). The five arguments are:
 
 Each Renderer instance is a callable that takes a context dictionary and
 returns a bytestring of rendered content. The heavy lifting is done in the
-render_content method.
+render_content method. It can also return an iterable of strings (a
+generator, say), which is streamed to the client a chunk at a time, so that
+large pages don't have to be rendered in full before the first byte goes out.
+The context falls back to page zero and the state without copying them, so
+use context.copy() rather than dict(context) or **context for a flat copy.
 
 Here's how to implement and register your own renderer:
 
@@ -87,7 +91,8 @@ import pkg_resources
 from ... import log_dammit
 
 # Built-in renderers
-BUILTIN_RENDERERS = [ 'stdlib_format'
+BUILTIN_RENDERERS = [ 'aspen_template'
+                    , 'stdlib_format'
                     , 'stdlib_percent'
                     , 'stdlib_template'
                     , 'json_dump'
@@ -161,7 +166,7 @@ class Renderer(object):
         return raw
 
     def render_content(self, context):
-        """Override. Context is a dict.
+        """Override. Context is a mapping. Return a string or an iterable of strings.
 
         You can use these attributes:
 
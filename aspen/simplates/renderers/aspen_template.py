@@ -0,0 +1,255 @@
+"""
+aspen.simplates.renderers.aspen_template
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+A small template language that compiles each content page into a Python
+function once, instead of interpreting the page on every request:
+
+    {{ expr }}          the value of a Python expression, escaped for HTML
+    {{! expr }}         the value of a Python expression, not escaped
+    {% for x in y %}    a Python block statement (for, while, if), closed by
+    {% end %}           ... this; elif and else go in between as usual
+    {% set x = expr %}  a Python assignment
+    {% flush %}         send what's been rendered so far to the client
+    {# comment #}       nothing
+
+Expressions are escaped for text/html, application/xhtml+xml, and any XML
+media type, and not for anything else. An object with an __html__ method
+(markupsafe.Markup, say) is trusted to escape itself. A {% %} or {# #} tag
+that's alone on its line takes the whole line with it, so block tags don't
+leave blank lines in the output.
+
+A page with {% flush %} in it is streamed: it renders to a generator that
+yields a chunk at each flush, and the rest at the end. Put one in the loop of
+a big table or CSV export, and the client starts getting rows right away,
+while we only hold a chunk's worth of them at a time.
+
+Names come from the context the content page is rendered with (or from
+builtins), except for loop variables and names you set, which are fast
+locals. So, as in a Python function, a name you set can't also be read from
+the context in the same page.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import ast
+import re
+from types import CodeType, FunctionType
+
+try:                # 3
+    import builtins
+except ImportError: # 2
+    import __builtin__ as builtins
+
+from . import Renderer, Factory
+from ..context import names_used
+
+
+TOKENS = re.compile(r'''
+      ^[ \t]*\{(?P<line>%(?P<line_stmt>(?:(?!%\}).)*?)%|\#(?:(?!\#\}).)*?\#)\}[ \t]*(?:\n|\Z)
+    | \{\{(?P<expr>.*?)\}\}
+    | \{%(?P<stmt>(?:(?!%\}).)*?)%\}
+    | \{\#(?:(?!\#\}).)*?\#\}
+''', re.MULTILINE | re.DOTALL | re.VERBOSE)
+
+BLOCKS = ('for', 'while', 'if')
+CONTINUATIONS = ('elif', 'else')
+FUNCTION = '_aspen_render'
+ARGUMENTS = '_aspen_convert, _aspen_text'
+
+ESCAPED_MEDIA_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+SPECIAL = re.compile(r'[&<>"\']')
+NUMBERS = (int, long, float)
+
+
+def escape(value):
+    """Given a value, return it as a string, escaped for HTML.
+
+    This is called for every {{ }} in an HTML page, so we try to do as little
+    as possible: numbers and strings with nothing to escape come straight back.
+
+    """
+    cls = type(value)
+    if cls is not unicode and cls is not str:
+        if hasattr(value, '__html__'):
+            return value.__html__()
+        value = unicode(value)
+        if cls in NUMBERS:
+            return value
+    if SPECIAL.search(value) is None:
+        return value
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+                .replace('"', '&quot;').replace("'", '&#39;')
+
+
+def text(value):
+    """Given a value, return it as a string.
+    """
+    return value if isinstance(value, basestring) else unicode(value)
+
+
+def should_escape(media_type):
+    """Given a media type, return a boolean.
+    """
+    media_type = media_type.split(';')[0].strip().lower()
+    return media_type in ESCAPED_MEDIA_TYPES or media_type.endswith(('/xml', '+xml'))
+
+
+def generate(raw):
+    """Given the source of a template, return a two-tuple.
+
+    The first item is the source of a Python module that defines a function
+    named by FUNCTION, and the second is a list giving the line number in raw
+    (counting from one) of each line of that source.
+
+    """
+    lines, linenos = [], []
+    depth = [1]                 # indentation of the current block
+    empty = []                  # for each open block, whether it has no body yet
+    pending = []                # (code, lineno) for output not yet emitted
+
+    def emit(code, lineno, indent=None):
+        flush()
+        lines.append('    ' * (depth[0] if indent is None else indent) + code)
+        linenos.append(lineno)
+        if empty:
+            empty[-1] = False
+
+    def output(code, lineno, is_expression=False):
+        # Output is emitted in runs, with one call to extend for each. A run
+        # of expressions stays on one line of the template, so that
+        # tracebacks from them point at the right line.
+        if is_expression and pending and pending[0][1] != lineno:
+            flush()
+        pending.append((code, lineno))
+
+    def flush():
+        if not pending:
+            return
+        codes = [code for code, lineno in pending]
+        lineno = pending[0][1]
+        del pending[:]
+        if len(codes) == 1:
+            emit('_aspen_append(%s)' % codes[0], lineno)
+        else:
+            emit('_aspen_extend((%s))' % ', '.join(codes), lineno)
+
+    def fail(msg, lineno):
+        raise SyntaxError(msg, (None, lineno, None, raw.splitlines()[lineno-1]))
+
+    emit('def %s(%s):' % (FUNCTION, ARGUMENTS), 1, 0)
+    emit('_aspen_buffer = []', 1)
+    emit('_aspen_append = _aspen_buffer.append', 1)
+    emit('_aspen_extend = _aspen_buffer.extend', 1)
+    pos, lineno = 0, 1
+    streaming = False
+    for match in TOKENS.finditer(raw):
+        start, end = match.span()
+        if start > pos:
+            output(repr(raw[pos:start]), lineno)
+            lineno += raw.count('\n', pos, start)
+        pos = end
+        tag_lineno = lineno
+        lineno += raw.count('\n', start, end)
+
+        expr, stmt = match.group('expr'), match.group('stmt')
+        if match.group('line') is not None:
+            stmt = match.group('line_stmt')  # None for a comment
+        if expr is not None:
+            expr = expr.replace('\n', ' ').strip()
+            if expr.startswith('!'):
+                output('_aspen_text((%s))' % expr[1:].strip(), tag_lineno, True)
+            else:
+                output('_aspen_convert((%s))' % expr, tag_lineno, True)
+        elif stmt is not None:
+            flush()  # before we change blocks
+            stmt = stmt.replace('\n', ' ').strip()
+            keyword = stmt.split(None, 1)[0] if stmt else ''
+            if keyword in BLOCKS:
+                emit(stmt + ':', tag_lineno)
+                depth[0] += 1
+                empty.append(True)
+            elif keyword in CONTINUATIONS:
+                if not empty:
+                    fail("{%% %s %%} outside of a block." % keyword, tag_lineno)
+                if empty.pop():
+                    emit('pass', tag_lineno)
+                emit(stmt + ':', tag_lineno, depth[0] - 1)
+                empty.append(True)
+            elif keyword == 'end':
+                if not empty:
+                    fail("{% end %} outside of a block.", tag_lineno)
+                if empty.pop():
+                    emit('pass', tag_lineno)
+                depth[0] -= 1
+            elif keyword == 'set':
+                emit(stmt[3:].strip(), tag_lineno)
+            elif keyword == 'flush':
+                streaming = True
+                emit('if _aspen_buffer:', tag_lineno)
+                emit("yield ''.join(_aspen_buffer)", tag_lineno, depth[0] + 1)
+                emit('del _aspen_buffer[:]', tag_lineno, depth[0] + 1)
+            else:
+                fail("Unknown template tag: {%% %s %%}." % stmt, tag_lineno)
+    if pos < len(raw):
+        output(repr(raw[pos:]), lineno)
+        lineno += raw.count('\n', pos)
+    if empty:
+        fail("Missing {% end %}.", lineno)
+    if streaming:
+        emit("yield ''.join(_aspen_buffer)", lineno)
+    else:
+        emit("return ''.join(_aspen_buffer)", lineno)
+    return '\n'.join(lines) + '\n', linenos
+
+
+def compile_template(raw, filepath, offset=0):
+    """Given the source of a template, a filesystem path, and a line offset, return a code object.
+
+    The code object is for a function that takes two conversion functions, one
+    for {{ }} (escape or text) and one for {{! }} (text), and returns the
+    rendered template (or, with {% flush %}, a generator of its chunks).
+    Tracebacks point at the template's lines in filepath.
+
+    """
+    try:
+        source, linenos = generate(raw)
+    except SyntaxError as exc:
+        raise SyntaxError(exc.msg, (filepath, exc.lineno + offset, None, exc.text))
+    try:
+        module = ast.parse(source, filepath)
+    except SyntaxError as exc:
+        lineno = linenos[exc.lineno-1] + offset if exc.lineno else None
+        raise SyntaxError(exc.msg, (filepath, lineno, None, None))
+    for node in ast.walk(module):
+        if hasattr(node, 'lineno'):
+            node.lineno = linenos[node.lineno-1] + offset
+    for const in compile(module, filepath, 'exec').co_consts:
+        if isinstance(const, CodeType) and const.co_name == FUNCTION:
+            return const
+
+
+class Renderer(Renderer):
+
+    def compile(self, filepath, raw):
+        code = compile_template(raw, filepath, self.offset)
+        self._names = names_used(code)
+        self._convert = escape if should_escape(self.media_type) else text
+        return code
+
+    def render_content(self, context):
+        if self._names is None:
+            namespace = context.copy()
+        else:
+            namespace = dict((name, context[name]) for name in self._names if name in context)
+        namespace['__builtins__'] = builtins
+        return FunctionType(self.compiled, namespace)(self._convert, text)
+
+
+class Factory(Factory):
+    Renderer = Renderer
@@ -1,6 +1,24 @@
 """
 aspen.simplates.renderers.json_dump
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+With the json_compact knob, we leave out indentation, key sorting, and the
+spaces after separators, which makes for smaller responses and quicker
+encoding. With the json_stream knob, we don't build the whole document as one
+string: we render to a generator that encodes as it goes, and send the output
+in chunks of about CHUNK_SIZE characters. Streamed responses don't get an
+ETag from etag_dynamic, and the output cache reads them in before storing
+them.
+
+Streaming can cost CPU. With json_compact, we encode a top-level list or dict
+a batch of items at a time (see json.iterencode), with the C speedups: that's
+about as quick as encoding it all at once for a list, and up to twice as slow
+for a dict of many small values. Anything else streams through the encoder's
+pure-Python iterencode. Without json_compact that's no great loss, since the
+json module encodes indented output in pure Python anyway, but with it that's
+several times slower than dumps. So turn json_stream on for big responses,
+where holding the whole document in memory is the bigger cost.
+
 """
 from __future__ import absolute_import
 from __future__ import division
@@ -10,18 +28,49 @@ from __future__ import unicode_literals
 from . import Renderer, Factory
 from ... import json
 
+
+CHUNK_SIZE = 8192
+
+
+def buffer_chunks(chunks, size=CHUNK_SIZE):
+    """Given an iterable of strings and a size, yield strings of about that size.
+
+    json.iterencode yields a string per token or so, which is far too many to
+    send one at a time.
+
+    """
+    buf, buffered = [], 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf, buffered = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
 class Renderer(Renderer):
     def compile(self, filepath, raw):
-        return raw
+        # Compile the expression once, padded so that tracebacks point at the
+        # right line of the simplate. Like eval, allow leading spaces and tabs.
+        source = ('\n' * self.offset) + raw.lstrip(' \t')
+        try:
+            return compile(source, filepath, 'eval')
+        except SyntaxError:
+            return source  # eval will raise if we're ever rendered, as it used to
 
     def render_content(self, context):
+        website = context['website']
         if 'Content-type' not in context['response'].headers:
             response = context['response']
-            website = context['website']
             response.headers['Content-type'] = website.media_type_json
-        return json.dumps(eval(self.compiled, globals(), context))
+        obj = eval(self.compiled, globals(), context)
+        options = json.COMPACT if website.json_compact else {}
+        if website.json_stream:
+            return buffer_chunks(json.iterencode(obj, **options))
+        return json.dumps(obj, **options)
 
 
 class Factory(Factory):
     Renderer = Renderer
-
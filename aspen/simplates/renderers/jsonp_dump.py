@@ -15,6 +15,15 @@ import re
 CALLBACK_RE = re.compile(r'[^_a-zA-Z0-9]')
 
 
+def wrap_chunks(prefix, chunks, suffix):
+    """Given a prefix, an iterable of strings, and a suffix, yield the lot.
+    """
+    yield prefix
+    for chunk in chunks:
+        yield chunk
+    yield suffix
+
+
 class Renderer(JsonRenderer):
     def render_content(self, context):
         # get the jsonp callback
@@ -38,6 +47,8 @@ class Renderer(JsonRenderer):
 
         # return the wrapped json
         # (preceding comment block prevent a Rosetta-Flash based attack)
+        if not isinstance(json, basestring):
+            return wrap_chunks("/**/ " + callback + "(", json, ");")
         return "/**/ " + callback + "(" + json + ");"
 
 
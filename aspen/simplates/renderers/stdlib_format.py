@@ -7,15 +7,20 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from string import Formatter
+
 from . import Renderer, Factory
 
 
+formatter = Formatter()
+
+
 class Renderer(Renderer):
     def compile(self, filepath, raw):
         return raw
 
     def render_content(self, context):
-        return self.compiled.format(**context)
+        return formatter.vformat(self.compiled, (), context)  # **context would miss fallbacks
 
 
 class Factory(Factory):
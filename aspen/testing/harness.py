@@ -30,7 +30,7 @@ def teardown():
     """
     os.chdir(CWD)
     # Reset some process-global caches. Hrm ...
-    resources.__cache__ = {}
+    resources.__cache__.clear()
     sys.path_importer_cache = {} # see test_weird.py
 
 teardown() # start clean
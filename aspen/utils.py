@@ -11,6 +11,7 @@ import codecs
 import datetime
 import math
 import re
+from email.utils import mktime_tz, parsedate_tz
 
 import algorithm
 
@@ -215,6 +216,20 @@ def to_rfc822(dt):
     )
 
 
+def from_rfc822(s):
+    """Given an RFC 822-formatted string, return a timezone-aware datetime.datetime.
+
+    This is the inverse of to_rfc822, though it's more lenient, as HTTP
+    requires (http://tools.ietf.org/html/rfc7231#section-7.1.1.1). Raise
+    ValueError if s can't be parsed.
+
+    """
+    parsed = parsedate_tz(s)
+    if parsed is None:
+        raise ValueError("Couldn't parse %r as an RFC 822 date." % s)
+    return datetime.datetime.fromtimestamp(mktime_tz(parsed), tz=utc)
+
+
 # Filters
 # =======
 # These are decorators for algorithm functions.
@@ -0,0 +1,291 @@
+"""
+aspen.watcher
++++++++++++++
+
+Watch directory trees for changes.
+
+Aspen caches resources and (optionally) the layout of www_root in memory. By
+default we check the filesystem on every request to see whether those caches
+are stale. A watcher turns that around: it notices changes in the background
+and tells the website, so that requests don't have to ask.
+
+On Linux we use inotify (via ctypes, no third-party libraries needed).
+Elsewhere, or if inotify is unavailable for some reason, we fall back to
+polling.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import traceback
+
+from .logging import log, log_dammit
+
+
+class Watcher(object):
+    """Abstract base for watchers.
+
+    A watcher is instantiated with a list of root directories and a callback.
+    The callback is called with a sorted list of filesystem paths that have
+    changed (been created, modified, or deleted). A directory in this list
+    means that anything under it may have changed.
+
+    Call check to look for changes synchronously, or start to look for them
+    every interval seconds in a daemon thread.
+
+    """
+
+    interval = 1.0
+
+    def __init__(self, roots, callback):
+        self.roots = _dedupe_roots(roots)
+        self.callback = callback
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def covers(self, fspath):
+        """Given a filesystem path, return a boolean: are we watching it?
+        """
+        for root in self.roots:
+            if fspath == root or fspath.startswith(root + os.sep):
+                return True
+        return False
+
+    def running(self):
+        """Whether our thread is alive in this process.
+
+        A process forked after we started (under gunicorn --preload, say)
+        inherits us, but not our thread, so nobody is watching for it.
+
+        """
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+    running = property(running)
+
+    def check(self, timeout=0):
+        """Look for changes, call back with any found, and return them.
+        """
+        paths = sorted(self.find_changes(timeout))
+        if paths:
+            self.callback(paths)
+        return paths
+
+    def find_changes(self, timeout):
+        """Override. Return an iterable of changed paths.
+        """
+        raise NotImplementedError
+
+    def start(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self.run, name=self.__class__.__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                log_dammit(traceback.format_exc())
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _dedupe_roots(roots):
+    """Given a list of directories, return a list with nested ones removed.
+    """
+    out = []
+    for root in sorted(set(roots)):
+        if not any(root.startswith(r + os.sep) for r in out):
+            out.append(root)
+    return out
+
+
+# Polling
+# =======
+
+class PollingWatcher(Watcher):
+    """Watch by walking the roots and comparing (mtime, size) snapshots.
+    """
+
+    def __init__(self, roots, callback):
+        super(PollingWatcher, self).__init__(roots, callback)
+        self._snapshot = self.snapshot()
+
+    def snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+                for name in dirnames + filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue  # gone already, or a broken symlink
+                    snapshot[path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def find_changes(self, timeout):
+        old, new = self._snapshot, self.snapshot()
+        self._snapshot = new
+        changed = set(old) ^ set(new)
+        changed.update(path for path in set(old) & set(new) if old[path] != new[path])
+        return changed
+
+
+# inotify
+# =======
+# See inotify(7). The event struct is: int wd; uint32 mask, cookie, len; char
+# name[len], where name is NUL-padded.
+
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ISDIR        = 0x40000000
+IN_CLOEXEC      = 0o2000000
+IN_NONBLOCK     = 0o0004000
+
+INOTIFY_MASK = ( IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+               | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+                )
+
+EVENT_HEADER = struct.Struct(str('iIII'))
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(str('libc.so.6'), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+libc = _load_libc()
+
+
+class InotifyWatcher(Watcher):
+    """Watch using Linux's inotify.
+    """
+
+    def __init__(self, roots, callback):
+        if libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        super(InotifyWatcher, self).__init__(roots, callback)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._wds = {}  # watch descriptor to directory path
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root):
+        for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+            self._watch(dirpath)
+
+    def _watch(self, path):
+        encoded = path.encode(sys.getfilesystemencoding()) if isinstance(path, unicode) else path
+        wd = libc.inotify_add_watch(self.fd, encoded, INOTIFY_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.ENOENT, errno.ENOTDIR):  # it's gone again
+                log("inotify_add_watch failed for %s: %s" % (path, os.strerror(err)))
+            return
+        self._wds[wd] = path
+
+    def _read(self, timeout):
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return b''
+        try:
+            return os.read(self.fd, 64 * 1024)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EINTR):
+                return b''
+            raise
+
+    def find_changes(self, timeout):
+        changed = set()
+        data = self._read(timeout)
+        while data:
+            self._parse(data, changed)
+            data = self._read(0)
+        return changed
+
+    def _parse(self, data, changed):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # We lost events, so assume that everything changed.
+                changed.update(self.roots)
+                continue
+
+            dirpath = self._wds.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._wds[wd]
+                continue
+
+            path = dirpath
+            if name:
+                path = os.path.join(dirpath, name.decode(sys.getfilesystemencoding()))
+            changed.add(path)
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.check(self.interval)
+            except Exception:
+                log_dammit(traceback.format_exc())
+
+    def stop(self):
+        super(InotifyWatcher, self).stop()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def make_watcher(roots, callback):
+    """Given a list of directories and a callback, return the best watcher available.
+    """
+    if libc is not None:
+        try:
+            return InotifyWatcher(roots, callback)
+        except OSError:
+            log_dammit("Couldn't set up inotify, falling back to polling:")
+            log_dammit(traceback.format_exc())
+    return PollingWatcher(roots, callback)
@@ -11,10 +11,14 @@ import datetime
 import os
 
 from algorithm import Algorithm
+from . import precompile, resources
 from .configuration import Configurable
+from .dispatcher import DispatchTree
+from .http import compression
 from .http.response import Response
 from .utils import to_rfc822, utc
 from .exceptions import BadLocation
+from .watcher import make_watcher
 
 # 2006-11-17 was the first release of aspen - v0.3
 THE_PAST = to_rfc822(datetime.datetime(2006, 11, 17, tzinfo=utc))
@@ -34,6 +38,19 @@ class Website(Configurable):
         """
         self.algorithm = Algorithm.from_dotted_name('aspen.algorithms.website')
         self.configure(**kwargs)
+        resources.__cache__.max_bytes = self.resource_cache_size
+
+        self.watcher = None
+        if self.precompile_simplates:
+            # before starting the watcher's thread, since this forks workers
+            precompile.log_reports(precompile.precompile(self))
+
+        if self.watch_files:
+            roots = [self.www_root]
+            if self.project_root is not None:
+                roots.append(self.project_root)
+            self.watcher = make_watcher(roots, self.invalidate_paths)
+            self.watcher.start()
 
 
     def __call__(self, environ, start_response):
@@ -87,6 +104,45 @@ class Website(Configurable):
         raise response
 
 
+    def resource_cache(self):
+        """The process-wide cache of resources (see aspen.resources).
+
+        Its size is bounded by our resource_cache_size, if non-zero. Call its
+        stats method for hit, miss, memory, and eviction statistics.
+
+        """
+        return resources.__cache__
+    resource_cache = property(resource_cache)
+
+    def invalidate_paths(self, paths):
+        """Given a list of filesystem paths that have changed, drop any state we've cached for them.
+
+        This is called by our watcher, if we have one (see watch_files).
+
+        """
+        for path in paths:
+            resources.invalidate(path)
+            for suffix in compression.SUFFIXES.values():
+                if path.endswith(suffix):
+                    resources.invalidate(path[:-len(suffix)])  # a sidecar
+        if self.dispatch_tree is not None:
+            if any((path == self.www_root or path.startswith(self.www_root + os.sep))
+                   and self.dispatch_tree.is_stale(path) for path in paths):
+                self.dispatch_tree = DispatchTree(self.www_root, self.indices)
+
+    def invalidate_tags(self, tags):
+        """Given a list of cache tags, drop everything in our cache that was tagged with them.
+
+        That includes the rendered output of simplates (see aspen.caching),
+        in every process sharing our cache backend. You'll want to purge the
+        same tags from any CDN in front of us, too: they went out in the
+        Surrogate-Key header.
+
+        """
+        for tag in tags:
+            self.cache.invalidate_tag(tag)
+
+
     # Base URL Canonicalization
     # =========================
 
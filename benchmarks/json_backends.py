@@ -0,0 +1,72 @@
+"""
+benchmarks.json_backends
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Measure encoding (pretty, and compact both with an encoder and with the
+backend's dumps) and decoding with each installed aspen.json backend, on a few
+representative payloads. Run it from the root of the repo:
+
+    python benchmarks/json_backends.py
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import sys
+import timeit
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from aspen import json
+
+
+class Moment(datetime.datetime):
+    """A subclass, to go through the encoder lookup by MRO.
+    """
+
+
+NOW = Moment(2014, 1, 2, 3, 4, 5)
+
+PAYLOADS = \
+    [ ('small object', {'id': 42, 'name': 'Greetings, program!', 'active': True, 'score': 9.5})
+    , ('1000 records', [ {'id': i, 'name': 'user %d' % i, 'email': 'user%d@example.com' % i,
+                          'tags': ['a', 'b', 'c'], 'balance': i * 1.25, 'admin': i % 7 == 0}
+                        for i in range(1000)
+                       ])
+    , ('1000 timestamps', [{'id': i, 'created': NOW, 'day': NOW.date()} for i in range(1000)])
+    , ('nested', {'level%d' % i: {'items': list(range(50)), 'meta': {'n': i}} for i in range(100)})
+     ]
+
+NUMBER = 20
+
+
+def measure(func):
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER
+
+
+def main():
+    for name, _ in json.backends:
+        try:
+            json.use_backend(name)
+        except ImportError:
+            print("%s: not installed" % name)
+            continue
+        print("%s:" % name)
+        for label, payload in PAYLOADS:
+            encoded = json.dumps(payload, **json.COMPACT)
+            timings = ( measure(lambda: json.dumps(payload))
+                      , measure(lambda: json.dumps(payload, cls=json.FriendlyEncoder, **json.COMPACT))
+                      , measure(lambda: json.dumps(payload, **json.COMPACT))
+                      , measure(lambda: json.loads(encoded))
+                       )
+            print("    %-16s %8.3f ms pretty %8.3f ms compact (encoder) %8.3f ms compact (dumps)"
+                  " %8.3f ms loads" % ((label,) + tuple(t * 1000 for t in timings)))
+    json.use_backend()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+benchmarks.negotiation
+~~~~~~~~~~~~~~~~~~~~~~
+
+Measure the cost of content negotiation per request, with and without the
+memo in aspen.simplates.negotiate. Run it from the root of the repo:
+
+    python benchmarks/negotiation.py
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import timeit
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+import mimeparse
+from aspen import simplates
+
+
+AVAILABLE_TYPES = ('text/plain', 'text/html', 'application/json', 'application/xml')
+
+# Accept headers as sent by a few browsers, libraries, and crawlers.
+ACCEPTS = [ 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+          , 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
+          , 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,'
+            'image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7'
+          , 'application/json, text/plain, */*'
+          , 'application/json'
+          , 'text/plain'
+          , '*/*'
+          , 'text/*;q=0.5, application/json;q=0.9'
+           ]
+
+REQUESTS = 10000
+
+
+def unmemoized():
+    for i in range(REQUESTS):
+        mimeparse.best_match(AVAILABLE_TYPES, ACCEPTS[i % len(ACCEPTS)])
+
+
+def memoized():
+    for i in range(REQUESTS):
+        simplates.negotiate(AVAILABLE_TYPES, ACCEPTS[i % len(ACCEPTS)])
+
+
+def main():
+    for name, func in (('mimeparse.best_match', unmemoized), ('simplates.negotiate', memoized)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print("%-22s %8.2f us/request" % (name, seconds / REQUESTS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+benchmarks.simplate_context
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Measure running page one and rendering a content page, for simplates whose
+page zero binds few names and many, with fast_locals off and on. The context
+doesn't copy page zero per request, so the size of page zero shouldn't matter.
+Run it from the root of the repo:
+
+    python benchmarks/simplate_context.py
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import timeit
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from aspen.simplates import Simplate, SimplateDefaults
+from aspen.simplates.renderers import stdlib_format
+
+
+class Configuration(object):
+    changes_reload = False
+
+
+PAGE_ONE = "greeting = 'Hello, ' + name\n"
+CONTENT = "{greeting} ({name_0})\n"
+REQUESTS = 10000
+
+
+def make_simplate(size, fast_locals):
+    defaults = SimplateDefaults( {'text/plain': 'stdlib_format'}
+                               , {'stdlib_format': stdlib_format.Factory(Configuration())}
+                               , {}
+                               , fast_locals=fast_locals
+                                )
+    page_zero = ''.join('name_%d = %d\n' % (i, i) for i in range(size))
+    raw = page_zero + '[---]\n' + PAGE_ONE + '[---] text/plain\n' + CONTENT
+    return Simplate(defaults, 'bench.spt', raw.encode('ascii'), 'text/plain')
+
+
+def main():
+    for fast_locals in (False, True):
+        for size in (10, 2000):
+            simplate = make_simplate(size, fast_locals)
+            state = {'name': 'world'}
+
+            def request():
+                for i in range(REQUESTS):
+                    simplate.render('text/plain', simplate.run(state))
+
+            seconds = min(timeit.repeat(request, number=1, repeat=5))
+            label = "fast_locals=%s, %d names" % (fast_locals, size)
+            print("%-28s %8.2f us/request" % (label, seconds / REQUESTS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
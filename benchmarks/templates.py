@@ -0,0 +1,68 @@
+"""
+benchmarks.templates
+~~~~~~~~~~~~~~~~~~~~
+
+Measure rendering an HTML table of many rows with aspen_template, against
+building the rows in Python and filling in a stdlib_format page. Run it from
+the root of the repo:
+
+    python benchmarks/templates.py
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import timeit
+from os.path import dirname, join
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from aspen.backcompat import html_escape
+from aspen.simplates.renderers import aspen_template, stdlib_format
+
+
+class Configuration(object):
+    changes_reload = False
+
+
+ROWS = [{'id': i, 'name': 'Row <%d>' % i, 'even': i % 2 == 0} for i in range(1000)]
+
+ASPEN_TEMPLATE = """\
+<table>
+{% for row in rows %}
+  <tr class="{{ 'even' if row['even'] else 'odd' }}"><td>{{ row['id'] }}</td><td>{{ row['name'] }}</td></tr>
+{% end %}
+</table>
+"""
+
+STDLIB_FORMAT = "<table>\n{rows}</table>\n"
+STDLIB_FORMAT_ROW = '  <tr class="{0}"><td>{1}</td><td>{2}</td></tr>\n'
+
+
+def main():
+    fast = aspen_template.Factory(Configuration())('bench.spt', ASPEN_TEMPLATE, 'text/html', 0)
+    slow = stdlib_format.Factory(Configuration())('bench.spt', STDLIB_FORMAT, 'text/html', 0)
+
+    def with_stdlib_format():
+        rows = ''.join( STDLIB_FORMAT_ROW.format( 'even' if row['even'] else 'odd'
+                                                , html_escape(unicode(row['id']))
+                                                , html_escape(row['name'])
+                                                 )
+                        for row in ROWS
+                       )
+        return slow({'rows': rows})
+
+    def with_aspen_template():
+        return fast({'rows': ROWS})
+
+    assert with_stdlib_format() == with_aspen_template()
+    for name, func in (('stdlib_format', with_stdlib_format), ('aspen_template', with_aspen_template)):
+        seconds = min(timeit.repeat(func, number=100, repeat=5)) / 100
+        print("%-16s %8.2f ms/render" % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -84,11 +84,13 @@ GENERIC_SPT = """
 Greetings, Program!
 """
 
+@pytest.mark.parametrize("precompile_dispatch", ['no', 'yes'])
 @pytest.mark.parametrize("files,request_uri,expected", get_table_entries())
-def test_all_table_entries(harness, files, request_uri, expected):
+def test_all_table_entries(harness, files, request_uri, expected, precompile_dispatch):
     # set up the specified files
     realfiles = tuple([ f if f.endswith('/') else (f, GENERIC_SPT) for f in files ])
     harness.fs.www.mk(*realfiles)
+    harness.client.hydrate_website(precompile_dispatch=precompile_dispatch)
     # make the request and get the response code and the request object (sadly we can't get both with one request)
     response = harness.simple(uripath=request_uri, filepath=None, want='response', raise_immediately=False)
     result = unicode(response.code)
@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import traceback
+
+from pytest import raises
+
+from aspen.exceptions import LoadError
+from aspen.simplates.renderers.aspen_template import compile_template, escape, generate
+from aspen.simplates.renderers.aspen_template import should_escape
+
+
+def render(harness, template, media_type='text/html', page_one="items = ['<a>', 'b&c']"):
+    simplate = "[---]\n%s\n[---] %s via aspen_template\n%s" % (page_one, media_type, template)
+    return harness.simple(simplate, 'index.spt').body
+
+
+def test_aspen_template_is_a_builtin_renderer(harness):
+    assert 'aspen_template' in harness.client.website.renderer_factories
+
+def test_aspen_template_renders_expressions(harness):
+    assert render(harness, "{{ len(items) }} {{ items[1].upper() }}", 'text/plain') == "2 B&C"
+
+def test_aspen_template_escapes_for_html(harness):
+    assert render(harness, "{{ items[0] }} {{ items[1] }}") == "&lt;a&gt; b&amp;c"
+
+def test_aspen_template_escapes_quotes(harness):
+    assert render(harness, "{{ q }}", page_one="q = '\"\\''") == "&quot;&#39;"
+
+def test_aspen_template_doesnt_escape_plain_text(harness):
+    assert render(harness, "{{ items[0] }}", 'text/plain') == "<a>"
+
+def test_aspen_template_doesnt_escape_with_bang(harness):
+    assert render(harness, "{{! items[0] }}") == "<a>"
+
+def test_aspen_template_trusts_dunder_html(harness):
+    page_one = "class Safe(object):\n    def __html__(self):\n        return '<b>'\nsafe = Safe()"
+    assert render(harness, "{{ safe }}", page_one=page_one) == "<b>"
+
+def test_aspen_template_loops(harness):
+    template = "<ul>\n{% for item in items %}\n<li>{{ item }}</li>\n{% end %}\n</ul>"
+    assert render(harness, template) == "<ul>\n<li>&lt;a&gt;</li>\n<li>b&amp;c</li>\n</ul>"
+
+def test_aspen_template_branches(harness):
+    template = "{% for n in range(4) %}{% if n == 0 %}zero{% elif n % 2 %}odd{% else %}even" \
+               "{% end %} {% end %}"
+    assert render(harness, template, 'text/plain') == "zero odd even odd "
+
+def test_aspen_template_sets(harness):
+    template = "{% set total = sum(range(5)) %}{{ total }}"
+    assert render(harness, template, 'text/plain') == "10"
+
+def test_aspen_template_allows_empty_blocks(harness):
+    assert render(harness, "{% if items %}{% else %}{% end %}ok", 'text/plain') == "ok"
+
+def test_aspen_template_skips_comments(harness):
+    assert render(harness, "a{# nothing #}b\n{# a whole line #}\nc", 'text/plain') == "ab\nc"
+
+def test_aspen_template_rejects_unknown_tags(harness):
+    exc = raises(LoadError, render, harness, "\n{% frobnicate %}").value
+    assert 'index.spt", line 5' in exc.args[0]
+    assert 'Unknown template tag: {% frobnicate %}' in exc.args[0]
+
+def test_aspen_template_reports_python_syntax_errors(harness):
+    exc = raises(LoadError, render, harness, "\n\n{{ 1 + }}").value
+    assert 'index.spt", line 6' in exc.args[0]
+
+def test_compile_template_rejects_unclosed_blocks():
+    raises(SyntaxError, compile_template, "{% for item in items %}", 'index.spt')
+
+def test_compile_template_rejects_stray_ends():
+    raises(SyntaxError, compile_template, "{% end %}", 'index.spt')
+
+def test_aspen_template_tracebacks_point_at_the_simplate(harness):
+    exc_info = raises(ZeroDivisionError, render, harness, "foo\n{% for item in items %}\n{{ 1/0 }}\n{% end %}")
+    filename, lineno = traceback.extract_tb(exc_info.tb)[-1][:2]
+    assert filename.endswith('index.spt')
+    assert lineno == 6
+
+
+def test_generate_maps_lines():
+    source, linenos = generate("a\n{% if b %}\n{{ c }}\n{% end %}\nd")
+    assert len(source.splitlines()) == len(linenos)
+    assert linenos == sorted(linenos)
+    assert linenos[-1] == 5
+
+def test_escape_converts_to_unicode():
+    assert escape(42) == '42'
+
+def test_should_escape_html_and_xml():
+    assert should_escape('text/html; charset=UTF-8')
+    assert should_escape('application/atom+xml')
+    assert not should_escape('text/plain')
+
+
+# streaming
+
+def test_aspen_template_streams_with_flush(harness):
+    template = "<table>\n{% for item in items %}\n<tr>{{ item }}</tr>\n{% flush %}\n{% end %}\n</table>"
+    body = render(harness, template)
+    assert not isinstance(body, basestring)
+    assert list(body) == ["<table>\n<tr>&lt;a&gt;</tr>\n", "<tr>b&amp;c</tr>\n", "</table>"]
+
+def test_aspen_template_doesnt_stream_without_flush(harness):
+    assert isinstance(render(harness, "{% for item in items %}{{ item }}{% end %}"), basestring)
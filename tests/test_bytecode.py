@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+from aspen import precompile, resources
+from aspen import simplates
+from aspen.simplates.bytecode import BytecodeCache
+
+
+SIMPLATE = "[---]\nfoo = 'bar'\n[---]\nGreetings, %(foo)s!"
+
+
+def _codes(fspath):
+    return (compile('a = 1', fspath, 'exec'), compile('b = 2', fspath, 'exec'))
+
+def _eval(code):
+    context = {}
+    exec code in context
+    del context['__builtins__']
+    return context
+
+
+def test_bytecode_cache_round_trips(fs):
+    fs.mk(('foo.spt', SIMPLATE),)
+    fspath = fs.resolve('foo.spt')
+    cache = BytecodeCache(fs.resolve('cache'))
+    assert cache.load(fspath, SIMPLATE) is None
+    cache.store(fspath, SIMPLATE, _codes(fspath))
+    one, two = cache.load(fspath, SIMPLATE)
+    assert _eval(one) == {'a': 1}
+    assert _eval(two) == {'b': 2}
+    assert one.co_filename == fspath
+
+def test_bytecode_cache_is_stale_when_mtime_changes(fs):
+    fs.mk(('foo.spt', SIMPLATE),)
+    fspath = fs.resolve('foo.spt')
+    cache = BytecodeCache(fs.resolve('cache'))
+    cache.store(fspath, SIMPLATE, _codes(fspath))
+    os.utime(fspath, (0, 0))
+    assert cache.load(fspath, SIMPLATE) is None
+
+def test_bytecode_cache_is_stale_when_size_changes(fs):
+    fs.mk(('foo.spt', SIMPLATE),)
+    fspath = fs.resolve('foo.spt')
+    cache = BytecodeCache(fs.resolve('cache'))
+    cache.store(fspath, SIMPLATE, _codes(fspath))
+    assert cache.load(fspath, SIMPLATE + ' ') is None
+
+def test_bytecode_cache_ignores_corrupt_files(fs):
+    fs.mk(('foo.spt', SIMPLATE),)
+    fspath = fs.resolve('foo.spt')
+    cache = BytecodeCache(fs.resolve('cache'))
+    cache.store(fspath, SIMPLATE, _codes(fspath))
+    with open(cache.path_for(fspath), 'wb') as fh:
+        fh.write(b'garbage')
+    assert cache.load(fspath, SIMPLATE) is None
+
+
+# Website integration
+# ===================
+
+def test_website_has_no_bytecode_cache_by_default(website):
+    assert website.bytecode_cache is None
+
+def test_website_uses_bytecode_cache(harness, monkeypatch):
+    harness.fs.www.mk(('index.html.spt', SIMPLATE),)
+    harness.client.hydrate_website(bytecode_cache_dir=harness.fs.project.resolve('cache'))
+    assert harness.client.GET('/').body == 'Greetings, bar!'
+    assert len(os.listdir(harness.fs.project.resolve('cache'))) == 1
+
+    # as in a fresh process
+    resources.__cache__.clear()
+    def boom(*a, **kw):
+        raise AssertionError("compiled a cached simplate")
+    monkeypatch.setattr(simplates, 'compile_python_pages', boom)
+    assert harness.client.GET('/').body == 'Greetings, bar!'
+
+def test_precompile_workers_fill_bytecode_cache(harness):
+    harness.fs.www.mk(('index.html.spt', SIMPLATE), ('foo.html.spt', SIMPLATE))
+    website = harness.client.hydrate_website(bytecode_cache_dir=harness.fs.project.resolve('cache'))
+    reports = precompile.precompile(website, processes=2)
+    assert [report.error for report in reports] == [None, None]
+    assert len(os.listdir(harness.fs.project.resolve('cache'))) == 2
@@ -0,0 +1,164 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import time
+
+from pytest import fixture, raises
+
+from aspen.caching import backends
+from aspen.caching.backends import FilesystemBackend, MemoryBackend, MmapBackend, make_backend
+from aspen.configuration import ConfigurationError
+
+
+@fixture(params=['memory', 'mmap', 'filesystem'])
+def backend(request, tmpdir):
+    if request.param == 'memory':
+        return MemoryBackend()
+    elif request.param == 'mmap':
+        backend = MmapBackend(str(tmpdir.join('cache')), nslots=64, slot_size=1024)
+        request.addfinalizer(backend.close)
+        return backend
+    return FilesystemBackend(str(tmpdir.join('cache')))
+
+
+def test_backend_gets_what_it_sets(backend):
+    backend.set('foo', {'bar': [1, 2, 3]})
+    assert backend.get('foo') == {'bar': [1, 2, 3]}
+
+def test_backend_returns_default_for_missing_keys(backend):
+    assert backend.get('foo') is None
+    assert backend.get('foo', 'default') == 'default'
+
+def test_backend_deletes(backend):
+    backend.set('foo', 'bar')
+    backend.delete('foo')
+    assert backend.get('foo') is None
+
+def test_backend_deleting_missing_key_is_fine(backend):
+    backend.delete('foo')
+
+def test_backend_clears(backend):
+    backend.set('foo', 'bar')
+    backend.set('baz', 'buz')
+    backend.clear()
+    assert backend.get('foo') is backend.get('baz') is None
+
+def test_backend_expires_values(backend):
+    backend.set('foo', 'bar', ttl=0.01)
+    assert backend.get('foo') == 'bar'
+    time.sleep(0.02)
+    assert backend.get('foo') is None
+
+def test_backend_reports_ttl(backend):
+    backend.set('foo', 'bar', ttl=60)
+    backend.set('baz', 'buz')
+    assert 59 < backend.ttl('foo') <= 60
+    assert backend.ttl('baz') is None
+    raises(KeyError, backend.ttl, 'missing')
+
+def test_backend_invalidates_tags(backend):
+    backend.set('foo', 'bar', tags=['a'])
+    backend.set('baz', 'buz', tags=['a', 'b'])
+    backend.set('bam', 'boo', tags=['b'])
+    backend.invalidate_tag('a')
+    assert backend.get('foo') is backend.get('baz') is None
+    assert backend.get('bam') == 'boo'
+
+def test_backend_keeps_values_set_after_invalidation(backend):
+    backend.set('foo', 'bar', tags=['a'])
+    backend.invalidate_tag('a')
+    backend.set('foo', 'baz', tags=['a'])
+    assert backend.get('foo') == 'baz'
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert backend.get('a') == 1
+    assert backend.get('b') is None
+    assert backend.evictions == 1
+
+def test_losing_a_tag_version_invalidates_its_values():
+    backend = MemoryBackend(2)
+    backend.set('a', 1, tags=['t'])  # the tag version takes a slot, too
+    backend.set('b', 2)
+    assert backend.get('a') is None
+
+def test_mmap_backend_is_shared_between_instances(tmpdir):
+    path = str(tmpdir.join('cache'))
+    one, two = MmapBackend(path, nslots=64, slot_size=1024), MmapBackend(path, nslots=64, slot_size=1024)
+    one.set('foo', 'bar', tags=['a'])
+    assert two.get('foo') == 'bar'
+    two.invalidate_tag('a')
+    assert one.get('foo') is None
+    one.close()
+    two.close()
+
+def test_mmap_backend_skips_values_too_big_for_a_slot(tmpdir):
+    backend = MmapBackend(str(tmpdir.join('cache')), nslots=64, slot_size=1024)
+    backend.set('foo', 'bar')
+    backend.set('foo', 'x' * 2048)
+    assert backend.get('foo') is None
+    backend.close()
+
+def test_filesystem_backend_is_shared_between_instances(tmpdir):
+    path = str(tmpdir.join('cache'))
+    FilesystemBackend(path).set('foo', 'bar')
+    assert FilesystemBackend(path).get('foo') == 'bar'
+    assert os.listdir(path) == [os.path.basename(FilesystemBackend(path).path_for('foo'))]
+
+
+def test_filesystem_backend_prunes_expired_then_oldest_files(tmpdir):
+    backend = FilesystemBackend(str(tmpdir.join('cache')), max_entries=2)
+    backend.set('expired', 'x', ttl=-1)
+    for i, key in enumerate(['old', 'newer', 'newest']):
+        backend.set(key, key)
+        os.utime(backend.path_for(key), (i, i))
+    backend.prune()
+    assert sorted(os.listdir(backend.directory)) == sorted( os.path.basename(backend.path_for(key))
+                                                            for key in ['newer', 'newest']
+                                                           )
+    assert backend.evictions == 1
+
+def test_filesystem_backend_prunes_every_so_often(tmpdir):
+    backend = FilesystemBackend(str(tmpdir.join('cache')), max_entries=3, prune_every=5)
+    for i in range(4):
+        backend.set(str(i), i)
+    assert len(os.listdir(backend.directory)) == 4
+    backend.set('4', 4)
+    assert len(os.listdir(backend.directory)) == 3
+
+def test_make_backend_makes_backends(tmpdir):
+    assert isinstance(make_backend('memory'), MemoryBackend)
+    assert isinstance(make_backend('filesystem:' + str(tmpdir)), FilesystemBackend)
+
+def test_website_has_a_memory_cache_by_default(harness):
+    assert isinstance(harness.client.website.cache, MemoryBackend)
+    assert harness.client.website.output_cache.backend is harness.client.website.cache
+
+def test_website_can_have_a_filesystem_cache(harness, tmpdir):
+    harness.client.hydrate_website(cache_backend='filesystem:' + str(tmpdir))
+    assert isinstance(harness.client.website.cache, FilesystemBackend)
+
+def test_website_rejects_bad_cache_backend(harness):
+    raises(ConfigurationError, harness.client.hydrate_website, cache_backend='filesystem')
+    raises(ConfigurationError, harness.client.hydrate_website, cache_backend='redis:foo')
+
+def test_simplate_output_is_shared_through_the_backend(harness, tmpdir):
+    harness.fs.www.mk(('foo.spt', "import itertools\ncounter = itertools.count()\n"
+                                  "__cache__ = {'ttl': 60}\n[---]\nn = next(counter)\n"
+                                  "[---] text/plain\n%(n)s"),)
+    harness.client.hydrate_website(cache_backend='filesystem:' + str(tmpdir))
+    assert harness.client.GET('/foo').body == '0'
+    harness.client.hydrate_website(cache_backend='filesystem:' + str(tmpdir))  # "another worker"
+    assert harness.client.GET('/foo').body == '0'
+
+def test_mmap_backend_needs_fcntl(tmpdir, monkeypatch):
+    monkeypatch.setattr(backends, 'fcntl', None)
+    raises(ConfigurationError, MmapBackend, str(tmpdir.join('cache')))
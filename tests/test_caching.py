@@ -0,0 +1,267 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from pytest import raises
+
+from aspen import Response
+from aspen.caching import CachePolicy, OutputCache
+from aspen.caching.backends import MemoryBackend
+from aspen.exceptions import LoadError
+
+
+COUNTER = """\
+import itertools
+counter = itertools.count()
+__cache__ = %s
+[---]
+n = next(counter)
+[---] text/plain
+%%(n)s
+[---] application/json via json_dump
+{'n': n}
+"""
+
+def cached(harness, declaration="{'ttl': 60}", filepath='foo.spt'):
+    harness.fs.www.mk((filepath, COUNTER % declaration),)
+
+def get(harness, path='/foo', **kw):
+    return harness.client.GET(path, **kw).body
+
+
+# CachePolicy
+# ===========
+
+def test_cache_policy_parses_a_declaration():
+    policy = CachePolicy.from_declaration({'ttl': 60, 'querystring': ['page'], 'cookies': 'lang'})
+    assert policy.ttl == 60
+    assert policy.querystring == ('page',)
+    assert policy.cookies == ('lang',)
+
+def test_cache_policy_requires_a_ttl():
+    raises(ValueError, CachePolicy.from_declaration, {})
+    raises(ValueError, CachePolicy.from_declaration, {'ttl': 0})
+
+def test_cache_policy_rejects_unknown_keys():
+    raises(ValueError, CachePolicy.from_declaration, {'ttl': 60, 'tll': 60})
+
+def test_cache_policy_rejects_non_dicts():
+    raises(TypeError, CachePolicy.from_declaration, 60)
+
+def test_bad_cache_policy_fails_to_load(harness):
+    cached(harness, "{'ttl': -1}")
+    raises(LoadError, harness.client.GET, '/foo')
+
+
+# OutputCache
+# ===========
+
+def test_output_cache_evicts_least_recently_used():
+    cache = OutputCache(MemoryBackend(2))
+    cache.set('a', Response(body=b'a'), 60)
+    cache.set('b', Response(body=b'b'), 60)
+    cache.get('a')
+    cache.set('c', Response(body=b'c'), 60)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.backend.evictions == 1
+
+def test_output_cache_expires_entries():
+    cache = OutputCache()
+    cache.set('a', Response(body=b'a'), 0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+def test_output_cache_skips_uncacheable_responses():
+    cache = OutputCache()
+    assert cache.set('a', Response(404), 60) is None
+    assert cache.set('a', Response(body=iter([b'a'])), 60) is None
+    response = Response()
+    response.headers.cookie[str('foo')] = 'bar'
+    assert cache.set('a', response, 60) is None
+    assert len(cache.backend) == 0
+
+def test_output_cache_in_memory_backend_of_size_zero_caches_nothing():
+    cache = OutputCache(MemoryBackend(0))
+    cache.set('a', Response(body=b'a'), 60)
+    assert len(cache.backend) == 0
+
+
+# Simplates
+# =========
+
+def test_simplate_output_is_cached(harness):
+    cached(harness)
+    assert get(harness) == get(harness) == '0\n'
+
+def test_uncached_simplate_output_is_not_cached(harness):
+    harness.fs.www.mk(('foo.spt', (COUNTER % None).replace('__cache__ = None\n', '')),)
+    assert get(harness) == '0\n'
+    assert get(harness) == '1\n'
+
+def test_cached_response_keeps_headers(harness):
+    cached(harness)
+    first = harness.client.GET('/foo')
+    second = harness.client.GET('/foo')
+    assert second.headers['Content-Type'] == first.headers['Content-Type']
+
+def test_cache_key_includes_media_type(harness):
+    cached(harness)
+    assert get(harness, HTTP_ACCEPT=b'text/plain') == '0\n'
+    assert get(harness, HTTP_ACCEPT=b'application/json') == '{\n    "n": 1\n}'
+    assert get(harness, HTTP_ACCEPT=b'application/json') == '{\n    "n": 1\n}'
+
+def test_cache_key_includes_path(harness):
+    cached(harness, filepath='%name.spt')
+    assert get(harness, '/foo') == '0\n'
+    assert get(harness, '/bar') == '1\n'
+    assert get(harness, '/foo') == '0\n'
+
+def test_cache_key_includes_whole_querystring_by_default(harness):
+    cached(harness)
+    assert get(harness, '/foo?a=1') == '0\n'
+    assert get(harness, '/foo?a=2') == '1\n'
+    assert get(harness, '/foo?a=1') == '0\n'
+
+def test_cache_key_can_include_selected_querystring_keys(harness):
+    cached(harness, "{'ttl': 60, 'querystring': ['page']}")
+    assert get(harness, '/foo?page=1&utm=a') == '0\n'
+    assert get(harness, '/foo?page=1&utm=b') == '0\n'
+    assert get(harness, '/foo?page=2&utm=a') == '1\n'
+
+def test_cache_key_can_include_cookies(harness):
+    cached(harness, "{'ttl': 60, 'cookies': ['lang']}")
+    assert get(harness, HTTP_COOKIE=b'lang=en; other=1') == '0\n'
+    assert get(harness, HTTP_COOKIE=b'lang=en; other=2') == '0\n'
+    assert get(harness, HTTP_COOKIE=b'lang=fr') == '1\n'
+
+def test_post_is_not_cached(harness):
+    cached(harness)
+    assert harness.client.POST('/foo').body == '0\n'
+    assert harness.client.POST('/foo').body == '1\n'
+
+def test_cached_simplate_expires(harness):
+    cached(harness, "{'ttl': 0.01}")
+    assert get(harness) == '0\n'
+    time.sleep(0.02)
+    assert get(harness) == '1\n'
+
+
+# Stale-while-revalidate and coalescing
+# =====================================
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.001)
+    assert condition()
+
+def render_concurrently(cache, render, nthreads=5):
+    responses = []
+    threads = [ threading.Thread(target=lambda: responses.append(cache.serve('a', Response(), render, 60)))
+                for i in range(nthreads)
+               ]
+    for thread in threads:
+        thread.start()
+    return threads, responses
+
+def test_concurrent_misses_are_coalesced():
+    cache = OutputCache()
+    release, calls = threading.Event(), []
+    def render(response):
+        calls.append(response)
+        release.wait()
+        response.body = b'rendered'
+        return response
+    threads, responses = render_concurrently(cache, render)
+    wait_for(lambda: cache.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert [r.body for r in responses] == [b'rendered'] * 5
+
+def test_followers_render_for_themselves_if_leader_response_is_uncacheable():
+    cache = OutputCache()
+    release, calls = threading.Event(), []
+    def render(response):
+        calls.append(response)
+        release.wait()
+        response.code = 404
+        return response
+    threads, responses = render_concurrently(cache, render)
+    wait_for(lambda: cache.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 5
+
+def test_stale_response_is_served_while_revalidating(harness):
+    cached(harness, "{'ttl': 0.01, 'stale': 60}")
+    output_cache = harness.client.website.output_cache
+    assert get(harness) == '0\n'
+    time.sleep(0.02)
+    assert get(harness) == '0\n'
+    assert output_cache.stale_hits == 1
+    wait_for(lambda: not output_cache._flights)
+    assert get(harness) == '1\n'
+
+def test_stale_response_is_revalidated_only_once(harness):
+    cached(harness, "{'ttl': 0.01, 'stale': 60}")
+    output_cache = harness.client.website.output_cache
+    get(harness)
+    time.sleep(0.02)
+    flights = []
+    def revalidate(*a):
+        flights.append(a)
+    output_cache._revalidate_in_background = revalidate
+    assert get(harness) == get(harness) == '0\n'
+    assert len(flights) == 1
+
+
+# Tags
+# ====
+
+TAGGED = """\
+import itertools
+counter = itertools.count()
+__cache__ = {'ttl': 60, 'tags': ['posts']}
+[---]
+n = next(counter)
+response.cache_tags.add('post-' + request.line.uri.path['id'])
+[---] text/plain
+%(n)s"""
+
+def test_cache_policy_parses_tags():
+    assert CachePolicy.from_declaration({'ttl': 60, 'tags': 'foo'}).tags == ('foo',)
+
+def test_cache_policy_rejects_tags_with_whitespace():
+    raises(ValueError, CachePolicy.from_declaration, {'ttl': 60, 'tags': ['foo bar']})
+
+def test_tags_go_out_in_surrogate_key(harness):
+    harness.fs.www.mk(('%id.spt', TAGGED),)
+    assert harness.client.GET('/1').headers['Surrogate-Key'] == b'post-1 posts'
+    assert harness.client.GET('/1').headers['Surrogate-Key'] == b'post-1 posts'  # cached
+
+def test_tags_go_out_in_surrogate_key_without_caching(harness):
+    harness.fs.www.mk(('foo.spt', "[---]\nresponse.cache_tags.add('foo')\n[---]\nGreetings!"),)
+    assert harness.client.GET('/foo').headers['Surrogate-Key'] == b'foo'
+
+def test_untagged_responses_have_no_surrogate_key(harness):
+    harness.fs.www.mk(('foo.spt', "[---]\n[---]\nGreetings!"),)
+    assert 'Surrogate-Key' not in harness.client.GET('/foo').headers
+
+def test_website_invalidates_by_tag(harness):
+    harness.fs.www.mk(('%id.spt', TAGGED),)
+    assert get(harness, '/1') == get(harness, '/1') == '0'
+    assert get(harness, '/2') == '1'
+    harness.client.website.invalidate_tags(['post-1'])
+    assert get(harness, '/1') == '2'
+    assert get(harness, '/2') == '1'
+    harness.client.website.invalidate_tags(['posts'])
+    assert get(harness, '/1') == '3'
+    assert get(harness, '/2') == '4'
@@ -0,0 +1,258 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import os
+import zlib
+from io import BytesIO
+
+from aspen import Response, precompress, resources
+from aspen.http import compression
+from aspen.http.compression import gzip_compress, is_compressible, negotiate_encoding
+
+
+CSS = b'body { color: red; }\n' * 100
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=BytesIO(data)).read()
+
+
+# negotiate_encoding
+# ==================
+
+def test_negotiate_encoding_picks_gzip():
+    assert negotiate_encoding(b'gzip, deflate', ['gzip']) == 'gzip'
+
+def test_negotiate_encoding_returns_none_without_a_header():
+    assert negotiate_encoding(None, ['gzip']) is None
+
+def test_negotiate_encoding_returns_none_when_nothing_is_acceptable():
+    assert negotiate_encoding(b'deflate', ['gzip']) is None
+    assert negotiate_encoding(b'gzip;q=0', ['gzip']) is None
+
+def test_negotiate_encoding_respects_qvalues():
+    assert negotiate_encoding(b'gzip;q=0.5, br', ['gzip', 'br']) == 'br'
+
+def test_negotiate_encoding_breaks_ties_with_our_preference():
+    assert negotiate_encoding(b'gzip, br', ['br', 'gzip']) == 'br'
+
+def test_negotiate_encoding_understands_star():
+    assert negotiate_encoding(b'*', ['gzip']) == 'gzip'
+    assert negotiate_encoding(b'*;q=0, gzip', ['br', 'gzip']) == 'gzip'
+
+def test_negotiate_encoding_understands_x_gzip():
+    assert negotiate_encoding(b'x-gzip', ['gzip']) == 'gzip'
+
+def test_negotiate_encoding_prefers_identity_if_asked_to():
+    assert negotiate_encoding(b'gzip;q=0.5, identity', ['gzip']) is None
+
+
+def test_is_compressible():
+    assert is_compressible('text/css')
+    assert is_compressible('application/json; charset=UTF-8')
+    assert is_compressible('application/vnd.api+json')
+    assert not is_compressible('image/png')
+
+def test_gzip_compress_is_deterministic():
+    assert gzip_compress(CSS) == gzip_compress(CSS)
+    assert gunzip(gzip_compress(CSS)) == CSS
+
+def test_compress_defaults_to_a_moderate_level():
+    assert compression.compress('gzip', CSS) == gzip_compress(CSS, compression.LEVELS['gzip'])
+    assert compression.compress('gzip', CSS, 1) == gzip_compress(CSS, 1)
+
+
+# Static
+# ======
+
+def get(harness, **kw):
+    harness.client.hydrate_website(compress_static='yes')
+    return harness.client.GET('/foo.css', **kw)
+
+def test_static_resource_is_gzipped_on_request(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    response = get(harness, HTTP_ACCEPT_ENCODING=b'gzip')
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert response.headers['Vary'] == b'Accept-Encoding'
+    assert gunzip(response.body) == CSS
+
+def test_static_resource_is_compressed_only_once(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    first = get(harness, HTTP_ACCEPT_ENCODING=b'gzip').body
+    resource = resources.get(harness.client.website, harness.fs.www.resolve('foo.css'))
+    assert get(harness, HTTP_ACCEPT_ENCODING=b'gzip').body is first is resource.encoded['gzip']
+
+def test_static_resource_is_not_gzipped_if_not_accepted(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    response = get(harness)
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == b'Accept-Encoding'
+    assert response.body == CSS
+
+def test_gzipped_static_resource_has_its_own_etag(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    plain = get(harness).headers['ETag']
+    gzipped = get(harness, HTTP_ACCEPT_ENCODING=b'gzip').headers['ETag']
+    assert gzipped == plain[:-1] + b'-gzip"'
+    assert get(harness, HTTP_ACCEPT_ENCODING=b'gzip', HTTP_IF_NONE_MATCH=gzipped).code == 304
+    assert get(harness, HTTP_ACCEPT_ENCODING=b'gzip', HTTP_IF_NONE_MATCH=plain).code == 200
+
+def test_static_resource_is_not_gzipped_for_range_requests(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    response = get(harness, HTTP_ACCEPT_ENCODING=b'gzip', HTTP_RANGE=b'bytes=0-3')
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == b'body'
+
+def test_incompressible_static_resource_is_not_gzipped(harness):
+    harness.fs.www.mk(('foo.png', CSS))
+    harness.client.hydrate_website(compress_static='yes')
+    response = harness.client.GET('/foo.png', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
+
+def test_static_resource_is_not_gzipped_by_default(harness):
+    harness.fs.www.mk(('foo.css', CSS))
+    response = harness.client.GET('/foo.css', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert 'Content-Encoding' not in response.headers
+
+def test_static_resource_serves_sidecar(harness):
+    harness.fs.www.mk(('foo.css', CSS), ('foo.css.gz', b'precompressed'))
+    response = get(harness, HTTP_ACCEPT_ENCODING=b'gzip')
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert response.body == b'precompressed'
+
+def test_static_resource_ignores_stale_sidecar(harness):
+    harness.fs.www.mk(('foo.css', CSS), ('foo.css.gz', b'precompressed'))
+    os.utime(harness.fs.www.resolve('foo.css.gz'), (0, 0))
+    response = get(harness, HTTP_ACCEPT_ENCODING=b'gzip')
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert gunzip(response.body) == CSS
+
+def test_static_resource_reloads_when_its_sidecar_changes(harness):
+    harness.fs.www.mk(('foo.css', CSS), ('foo.css.gz', b'precompressed'))
+    assert get(harness, HTTP_ACCEPT_ENCODING=b'gzip').body == b'precompressed'
+    sidecar = harness.fs.www.resolve('foo.css.gz')
+    with open(sidecar, 'wb') as fh:
+        fh.write(b'recompressed')
+    st = os.stat(sidecar)
+    os.utime(sidecar, (st.st_atime, st.st_mtime + 10))
+    assert get(harness, HTTP_ACCEPT_ENCODING=b'gzip').body == b'recompressed'
+
+def test_big_static_resource_streams_sidecar(harness):
+    harness.fs.www.mk(('foo.css', CSS), ('foo.css.gz', b'precompressed'))
+    harness.client.hydrate_website(compress_static='yes', stream_static_above='100')
+    response = harness.client.GET('/foo.css', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert response.headers['Content-Length'] == b'13'
+    assert response.body.read() == b'precompressed'
+    response.body.close()
+
+
+# precompress
+# ===========
+
+def test_precompress_writes_sidecars(harness):
+    harness.fs.www.mk( ('foo.css', CSS)
+                     , ('bar/baz.js', CSS)
+                     , ('tiny.css', b'a{}')
+                     , ('foo.png', CSS)
+                     , ('index.html.spt', CSS)
+                      )
+    written = precompress.precompress(harness.fs.www.root, ['gzip'])
+    assert sorted(written) == [ harness.fs.www.resolve('bar/baz.js.gz')
+                              , harness.fs.www.resolve('foo.css.gz')
+                               ]
+    with open(harness.fs.www.resolve('foo.css.gz'), 'rb') as fh:
+        assert gunzip(fh.read()) == CSS
+
+def test_precompress_compresses_at_the_maximum_level(harness, monkeypatch):
+    levels = []
+    compress = compression.compress
+    def spy(encoding, data, level=None):
+        levels.append(level)
+        return compress(encoding, data, level)
+    monkeypatch.setattr(compression, 'compress', spy)
+    harness.fs.www.mk(('foo.css', CSS),)
+    precompress.precompress(harness.fs.www.root, ['gzip'])
+    assert levels == [compression.MAX_LEVELS['gzip']]
+
+def test_precompress_skips_fresh_sidecars(harness):
+    harness.fs.www.mk(('foo.css', CSS),)
+    assert precompress.precompress(harness.fs.www.root, ['gzip'])
+    assert precompress.precompress(harness.fs.www.root, ['gzip']) == []
+
+def test_precompress_rewrites_stale_sidecars(harness):
+    harness.fs.www.mk(('foo.css', CSS),)
+    precompress.precompress(harness.fs.www.root, ['gzip'])
+    sidecar = harness.fs.www.resolve('foo.css.gz')
+    os.utime(sidecar, (0, 0))
+    assert precompress.precompress(harness.fs.www.root, ['gzip']) == [sidecar]
+
+
+# compress_response_for_client
+# ============================
+
+JSON_SPT = "[---]\n[---] application/json via json_dump\n{'foo': ['bar'] * 1000}"
+
+def get_json(harness, **kw):
+    harness.fs.www.mk(('foo.json.spt', JSON_SPT),)
+    harness.client.hydrate_website(compress_dynamic='yes')
+    return harness.client.GET('/foo.json', **kw)
+
+def test_dynamic_response_is_gzipped(harness):
+    response = get_json(harness, HTTP_ACCEPT_ENCODING=b'gzip')
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert response.headers['Vary'] == b'Accept-Encoding'
+    assert gunzip(response.body).startswith(b'{')
+
+def test_dynamic_response_is_not_gzipped_if_not_accepted(harness):
+    response = get_json(harness)
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == b'Accept-Encoding'
+
+def test_dynamic_response_is_not_gzipped_by_default(harness):
+    harness.fs.www.mk(('foo.json.spt', JSON_SPT),)
+    response = harness.client.GET('/foo.json', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert 'Content-Encoding' not in response.headers
+
+def test_small_dynamic_response_is_not_gzipped(harness):
+    harness.fs.www.mk(('foo.json.spt', "[---]\n[---] application/json via json_dump\n{}"),)
+    harness.client.hydrate_website(compress_dynamic='yes')
+    response = harness.client.GET('/foo.json', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
+
+def test_dynamic_response_of_disallowed_type_is_not_gzipped(harness):
+    harness.fs.www.mk(('foo.json.spt', JSON_SPT),)
+    harness.client.hydrate_website(compress_dynamic='yes', compress_media_types='text/*')
+    response = harness.client.GET('/foo.json', HTTP_ACCEPT_ENCODING=b'gzip')
+    assert 'Content-Encoding' not in response.headers
+
+def test_iterable_dynamic_response_is_gzipped_incrementally(harness):
+    harness.fs.www.mk(('foo.txt.spt', "[---]\n"
+                                      "response.headers['Content-Type'] = 'text/plain'\n"
+                                      "response.body = iter(['Greetings, ', u'program!'])\n"
+                                      "raise response\n"
+                                      "[---]\n"),)
+    harness.client.hydrate_website(compress_dynamic='yes')
+    response = harness.client.GET('/foo.txt', HTTP_ACCEPT_ENCODING=b'gzip', raise_immediately=False)
+    assert response.headers['Content-Encoding'] == b'gzip'
+    assert gunzip(b''.join(response.body)) == b'Greetings, program!'
+
+def test_gzip_stream_compresses_incrementally():
+    chunks = [CSS[:100], CSS[100:]]
+    assert gunzip(b''.join(compression.gzip_stream(iter(chunks)))) == CSS
+
+def test_gzip_stream_flushes_each_chunk():
+    stream = compression.gzip_stream(iter([b'Greetings, ', b'program!']))
+    first = next(stream)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(first) == b'Greetings, '
+
+def test_add_vary_adds_to_existing_vary():
+    response = Response(headers={'Vary': b'Cookie'})
+    compression.add_vary(response.headers, b'Accept-Encoding')
+    compression.add_vary(response.headers, b'Accept-Encoding')
+    assert response.headers['Vary'] == b'Cookie, Accept-Encoding'
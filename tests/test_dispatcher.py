@@ -532,3 +532,76 @@ def test_dont_serve_hidden_files(harness):
 def test_dont_serve_spt_file_source(harness):
     harness.fs.www.mk(('foo.html.spt', "Greetings, program!"),)
     assert_raises_404(harness, '/foo.html.spt')
+
+
+# DispatchTree
+# ============
+
+def test_dispatch_tree_describes_nodes(harness):
+    harness.fs.www.mk( ('index.html', '')
+                     , ('%foo.spt', '')
+                     , ('%bar/baz.spt', '')
+                     , ('.hidden', '')
+                     , ('.git/HEAD', '')
+                      )
+    tree = dispatcher.DispatchTree(harness.fs.www.root, ['index.html'])
+    subnodes, wild_leaf_ns, wild_nonleaf_ns = tree.describe(harness.fs.www.root)
+    assert subnodes == frozenset(['index.html', '%foo.spt', '%bar'])
+    assert wild_leaf_ns == ('%foo.spt',)
+    assert wild_nonleaf_ns == ('%bar',)
+    assert tree.find_index(harness.fs.www.root + os.sep) == harness.fs.www.resolve('index.html')
+    assert tree.is_leaf(harness.fs.www.resolve('%bar/baz.spt'))
+    assert not tree.is_leaf(harness.fs.www.resolve('%bar'))
+    assert not tree.is_leaf(harness.fs.www.resolve('.hidden'))
+
+def test_dispatch_tree_is_stale_only_for_changes_of_structure(harness):
+    harness.fs.www.mk( ('index.html', '')
+                     , ('foo/bar.html', '')
+                     , ('.git/HEAD', '')
+                      )
+    tree = dispatcher.DispatchTree(harness.fs.www.root, ['index.html'])
+    harness.fs.www.mk( ('index.html', 'modified')
+                     , ('.git/ORIG_HEAD', '')
+                      )
+    assert not tree.is_stale(harness.fs.www.resolve('index.html'))
+    assert not tree.is_stale(harness.fs.www.resolve('.git/ORIG_HEAD'))
+    assert not tree.is_stale(harness.fs.www.resolve('never.html'))
+    harness.fs.www.mk(('foo/baz.html', ''),)
+    assert tree.is_stale(harness.fs.www.resolve('foo/baz.html'))
+    os.remove(harness.fs.www.resolve('foo/bar.html'))
+    assert tree.is_stale(harness.fs.www.resolve('foo/bar.html'))
+    assert tree.is_stale(harness.fs.www.resolve('foo'))
+
+def test_dispatch_tree_dispatches_without_touching_the_filesystem(harness, monkeypatch):
+    harness.fs.www.mk( ('index.html', 'Greetings, program!')
+                     , ('foo/%bar.spt', NEGOTIATED_SIMPLATE)
+                      )
+    tree = dispatcher.DispatchTree(harness.fs.www.root, ['index.html'])
+
+    def boom(*a, **kw):
+        raise AssertionError("touched the filesystem")
+    monkeypatch.setattr(os, 'listdir', boom)
+    monkeypatch.setattr(os.path, 'isfile', boom)
+
+    result = dispatcher.dispatch( indices               = ['index.html']
+                                , media_type_default    = ''
+                                , pathparts             = ['foo', 'baz']
+                                , uripath               = '/foo/baz'
+                                , querystring           = ''
+                                , startdir              = harness.fs.www.root
+                                , directory_default     = ''
+                                , favicon_default       = ''
+                                , redirect              = harness.client.website.redirect
+                                , tree                  = tree
+                                 )
+    assert result.match == harness.fs.www.resolve('foo/%bar.spt')
+    assert result.wildcards == {'bar': 'baz'}
+
+def test_precompile_dispatch_builds_a_tree(harness):
+    harness.fs.www.mk(('foo/index.html', 'Greetings, program!'),)
+    website = harness.client.hydrate_website(precompile_dispatch='yes')
+    assert website.dispatch_tree is not None
+    assert_fs(harness, '/foo/', 'foo/index.html')
+
+def test_dispatch_tree_is_off_by_default(harness):
+    assert harness.client.website.dispatch_tree is None
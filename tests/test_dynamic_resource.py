@@ -3,10 +3,13 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+
 from pytest import raises, yield_fixture
 
-from aspen import resources, Response
-from aspen.http.resource import Dynamic
+from aspen import resources, Response, simplates
+from aspen.http.resource import Dynamic, materialize, start_stream
+from aspen.simplates import LazyRenderer
 from aspen.simplates.pagination import Page
 from aspen.simplates.renderers.stdlib_template import Factory as TemplateFactory
 from aspen.simplates.renderers.stdlib_percent import Factory as PercentFactory
@@ -49,6 +52,22 @@ def test_compile_page_compiles_page(get):
     actual = page[0]({}), page[1]
     assert actual == ('foo bar', 'text/html')
 
+def test_compile_page_can_be_lazy(get):
+    renderer, media_type = get().compile_page(Page('foo bar', 'text/html'), lazy=True)
+    assert isinstance(renderer, LazyRenderer)
+    assert renderer.compiled is renderer.raw
+    assert (renderer({}), media_type) == ('foo bar', 'text/html')
+
+def test_lazy_renderer_compiles_only_once_even_if_it_fails():
+    calls = []
+    def make_renderer(*a):
+        calls.append(a)
+        raise SyntaxError("bad page")
+    renderer = LazyRenderer(make_renderer, 'foo.spt', Page('{{', 'text/html'), 'text/html')
+    raises(SyntaxError, renderer, {})
+    raises(SyntaxError, renderer, {})
+    assert len(calls) == 1
+
 
 # _parse_specline
 
@@ -214,6 +233,42 @@ def test_respond_406_gives_list_of_acceptable_types(harness):
     expected = "The following media types are available: text/plain, text/html."
     assert actual == expected
 
+def test_negotiated_content_pages_are_compiled_on_first_use(harness):
+    harness.fs.www.mk(('index.spt', SIMPLATE))
+    state = _get_state(harness, filepath='index.spt', contents=SIMPLATE)
+    state['accept_header'] = 'text/html'
+    _respond(state)
+    renderers = state['resource'].renderers
+    assert renderers['text/html']._renderer is not None
+    assert renderers['text/plain']._renderer is None
+
+def test_single_content_pages_are_compiled_up_front(get):
+    renderer = get().renderers['text/plain']
+    assert not isinstance(renderer, LazyRenderer)
+
+def test_negotiate_remembers_outcomes(monkeypatch):
+    calls = []
+    def best_match(available_types, accept):
+        calls.append(accept)
+        return '' if accept == 'cheese/head' else available_types[0]
+    monkeypatch.setattr(simplates.mimeparse, 'best_match', best_match)
+    monkeypatch.setattr(simplates, '_negotiations', OrderedDict())
+    available_types = ('text/plain', 'text/html')
+    for i in range(2):
+        assert simplates.negotiate(available_types, 'text/*') == 'text/plain'
+        assert simplates.negotiate(available_types, 'cheese/head') == ''
+    assert calls == ['text/*', 'cheese/head']
+
+def test_negotiate_forgets_least_recently_used(monkeypatch):
+    monkeypatch.setattr(simplates, '_negotiations', OrderedDict())
+    monkeypatch.setattr(simplates, 'NEGOTIATION_MEMO_SIZE', 2)
+    available_types = ('text/plain', 'text/html')
+    for accept in ('text/plain', 'text/html', 'text/plain', 'text/*'):
+        simplates.negotiate(available_types, accept)
+    assert list(simplates._negotiations) == [ (available_types, 'text/plain')
+                                            , (available_types, 'text/*')
+                                             ]
+
 
 from aspen.simplates.renderers import Renderer, Factory
 
@@ -319,3 +374,140 @@ def test_dynamic_resource_inside_virtual_path_with_startype_fallback(harness):
     expected = "Unknown request type, program!"
     actual = response.body.strip()
     assert actual == expected
+
+
+# Streaming
+# =========
+
+class Streamer(Renderer):
+    def render_content(self, context):
+        for i in range(3):
+            if context.get('fail_at') == i:
+                raise ZeroDivisionError
+            yield "chunk %d\n" % i
+
+class StreamerFactory(Factory):
+    Renderer = Streamer
+
+def install_streamer(harness):
+    harness.client.website.renderer_factories['streamer'] = StreamerFactory(harness.client.website)
+
+def test_renderers_can_stream(harness):
+    install_streamer(harness)
+    response = harness.simple("[---]\n[---] text/plain via streamer\n")
+    assert not isinstance(response.body, basestring)
+    assert list(response.body) == ["chunk 0\n", "chunk 1\n", "chunk 2\n"]
+
+def test_errors_before_the_first_chunk_get_an_error_response(harness):
+    install_streamer(harness)
+    response = harness.simple( "[---]\nfail_at = 0\n[---] text/plain via streamer\n"
+                             , raise_immediately=False
+                              )
+    assert response.code == 500
+
+def test_errors_after_the_first_chunk_end_the_stream(harness):
+    install_streamer(harness)
+    response = harness.simple("[---]\nfail_at = 1\n[---] text/plain via streamer\n")
+    assert response.code == 200
+    assert next(response.body) == "chunk 0\n"
+    raises(ZeroDivisionError, next, response.body)
+
+def test_streamed_bodies_reach_wsgi_a_chunk_at_a_time():
+    def chunks():
+        yield "foo"
+        yield "b\u00e4r"
+    response = Response(body=start_stream(chunks()))
+    assert list(response({}, lambda status, headers: None)) == [b"foo", "b\u00e4r".encode('utf8')]
+
+def test_closing_the_wsgi_iterable_closes_the_stream():
+    closed = []
+    def chunks():
+        try:
+            yield "foo"
+            yield "bar"
+        finally:
+            closed.append(True)
+    iterable = Response(body=start_stream(chunks()))({}, lambda status, headers: None)
+    assert next(iter(iterable)) == b"foo"
+    iterable.close()
+    assert closed == [True]
+
+def test_start_stream_turns_empty_iterables_into_empty_strings():
+    assert start_stream(iter([])) == b''
+
+def test_materialize_reads_streamed_bodies():
+    response = materialize(Response(body=iter(["foo", "b\u00e4r"])))
+    assert response.body == "foob\u00e4r".encode('utf8')
+
+def test_output_cache_stores_streamed_bodies(harness):
+    install_streamer(harness)
+    harness.fs.www.mk(('foo.spt', "__cache__ = {'ttl': 60}\n[---]\n[---] text/plain via streamer\n"),)
+    assert harness.client.GET('/foo').body == b"chunk 0\nchunk 1\nchunk 2\n"
+    assert harness.client.GET('/foo').body == b"chunk 0\nchunk 1\nchunk 2\n"
+    assert harness.client.website.output_cache.hits == 1
+
+
+# Conditional GET
+# ===============
+
+def test_dynamic_resource_has_no_etag_by_default(harness):
+    response = harness.simple("[---]\n[---]\nGreetings, program!", 'index.html.spt')
+    assert 'ETag' not in response.headers
+
+def test_dynamic_resource_has_weak_etag_with_etag_dynamic(harness):
+    response = harness.simple( "[---]\n[---]\nGreetings, program!", 'index.html.spt'
+                             , website_configuration={'etag_dynamic': 'yes'}
+                              )
+    assert response.headers['ETag'].startswith(b'W/"')
+
+def test_dynamic_resource_returns_304_for_matching_etag(harness):
+    harness.fs.www.mk(('index.html.spt', "[---]\n[---]\nGreetings, program!"),)
+    harness.client.hydrate_website(etag_dynamic='yes')
+    etag = harness.client.GET('/').headers['ETag']
+    response = harness.client.GET('/', HTTP_IF_NONE_MATCH=etag)
+    assert response.code == 304
+    assert response.body == b''
+    assert response.headers['ETag'] == etag
+
+def test_dynamic_resource_returns_200_for_stale_etag(harness):
+    response = harness.simple( "[---]\n[---]\nGreetings, program!", 'index.html.spt'
+                             , website_configuration={'etag_dynamic': 'yes'}
+                             , HTTP_IF_NONE_MATCH=b'W/"nope"'
+                              )
+    assert response.code == 200
+    assert response.body == "Greetings, program!"
+
+ROW_VERSION = """\
+[---]
+response.headers['ETag'] = b'"v42"'
+[---]
+%(never_defined)s"""
+
+def test_etag_from_page_one_skips_rendering_on_match(harness):
+    response = harness.simple(ROW_VERSION, 'index.html.spt', HTTP_IF_NONE_MATCH=b'"v42"')
+    assert response.code == 304
+    assert response.body == b''
+
+def test_etag_from_page_one_is_kept_with_etag_dynamic(harness):
+    response = harness.simple( "[---]\nresponse.headers['ETag'] = b'\"v42\"'\n[---]\nGreetings!"
+                             , 'index.html.spt'
+                             , website_configuration={'etag_dynamic': 'yes'}
+                              )
+    assert response.headers['ETag'] == b'"v42"'
+
+def test_gzipped_etag_matches_with_compress_dynamic(harness):
+    harness.fs.www.mk(('index.html.spt', "[---]\n[---] text/html\n" + "Greetings, program!" * 100),)
+    harness.client.hydrate_website(etag_dynamic='yes', compress_dynamic='yes')
+    etag = harness.client.GET('/', HTTP_ACCEPT_ENCODING=b'gzip').headers['ETag']
+    assert etag.endswith(b'-gzip"')
+    response = harness.client.GET('/', HTTP_ACCEPT_ENCODING=b'gzip', HTTP_IF_NONE_MATCH=etag)
+    assert response.code == 304
+    assert response.body == b''
+
+def test_gzipped_etag_from_page_one_matches_with_compress_dynamic(harness):
+    response = harness.simple( ROW_VERSION, 'index.html.spt'
+                             , website_configuration={'compress_dynamic': 'yes'}
+                             , HTTP_ACCEPT_ENCODING=b'gzip'
+                             , HTTP_IF_NONE_MATCH=b'"v42-gzip"'
+                              )
+    assert response.code == 304
@@ -4,8 +4,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import StringIO
+import datetime
+from collections import OrderedDict
+import json as stdlib_json
+import traceback
+import types
 
-from pytest import raises
+from pytest import raises, yield_fixture
 
 from aspen import json
 
@@ -161,6 +166,219 @@ def test_aspen_json_dumps_dumps():
     "cheese": "puffs"
 }'''
 
+def test_json_dump_compiles_its_expression_once(harness):
+    harness.fs.www.mk(('foo.json.spt', "[---]\n[---] application/json\n{'Greetings': 'program!'}"),)
+    resource = harness.client.GET('/foo.json', want='resource')
+    renderer = resource.renderers['application/json']
+    assert isinstance(renderer.compiled, types.CodeType)
+
+def test_json_dump_tracebacks_point_at_the_simplate(harness):
+    harness.fs.www.mk(('foo.json.spt', "[---]\n[---] application/json\n{'Greetings': 1/0}"),)
+    exc_info = raises(ZeroDivisionError, harness.client.GET, '/foo.json')
+    frame = traceback.extract_tb(exc_info.tb)[-1]
+    assert frame[0].endswith('foo.json.spt')
+    assert frame[1] == 3
+
+def test_json_dump_defers_syntax_errors_until_rendering(harness):
+    harness.fs.www.mk(('foo.json.spt', "[---]\n[---] application/json\n{'Greetings':"),)
+    raises(SyntaxError, harness.client.GET, '/foo.json')
+
+
+# compact and streaming
+
+BIG_SIMPLATE = "[---]\n[---] application/json\n{'b': list(range(5000)), 'a': 'A'}"
+
+def test_aspen_json_dumps_can_be_compact():
+    actual = json.dumps({'cheese': 'puffs', 'bar': [1, 2]}, **json.COMPACT)
+    assert actual in ('{"cheese":"puffs","bar":[1,2]}', '{"bar":[1,2],"cheese":"puffs"}')
+
+def test_aspen_json_iterencode_matches_dumps():
+    obj = {'cheese': 'puffs', 'bar': [1, 2]}
+    assert ''.join(json.iterencode(obj)) == json.dumps(obj)
+
+def test_aspen_json_iterencode_matches_dumps_when_compact():
+    for obj in ( list(range(250)), [], {}, 'cheese', {1: 2}, (1, 2)
+               , OrderedDict(('k%d' % i, i) for i in range(250))
+                ):
+        assert ''.join(json.iterencode(obj, **json.COMPACT)) == json.dumps(obj, **json.COMPACT)
+
+def test_aspen_json_iterencode_encodes_big_containers_in_batches():
+    chunks = list(json.iterencode(list(range(250)), **json.COMPACT))
+    assert len(chunks) == 7  # [, 3 batches with 2 separators, ]
+    obj = dict(('k%d' % i, i) for i in range(250))
+    assert json.loads(''.join(json.iterencode(obj, **json.COMPACT))) == obj
+
+def test_aspen_json_iterencode_splits_nested_containers():
+    records = [{'id': i, 'name': 'Record %d' % i, 'tags': ['a', 'b']} for i in range(20000)]
+    obj = OrderedDict([('count', 20000), ('results', records), ('more', [list(range(500))])])
+    chunks = list(json.iterencode(obj, **json.COMPACT))
+    assert ''.join(chunks) == json.dumps(obj, **json.COMPACT)
+    assert max(len(chunk) for chunk in chunks) < 10000
+
+def test_aspen_json_iterencode_still_catches_circular_references():
+    obj = list(range(200))
+    obj.append(obj)
+    with raises(ValueError):
+        list(json.iterencode(obj, **json.COMPACT))
+
+def test_json_dump_can_be_compact(harness):
+    actual = harness.simple( "[---]\n[---] application/json\n{'Greetings': 'program!'}"
+                           , filepath="foo.json.spt"
+                           , website_configuration={'json_compact': 'yes'}
+                            ).body
+    assert actual == '{"Greetings":"program!"}'
+
+def test_json_dump_can_stream(harness):
+    response = harness.simple( BIG_SIMPLATE
+                             , filepath="foo.json.spt"
+                             , website_configuration={'json_stream': 'yes'}
+                              )
+    chunks = list(response.body)
+    assert len(chunks) > 1
+    assert json.loads(''.join(chunks)) == {'b': list(range(5000)), 'a': 'A'}
+    assert response.headers['Content-Type'] == 'application/json'
+
+def test_json_dump_streams_what_it_would_have_sent(harness):
+    expected = harness.simple(BIG_SIMPLATE, filepath="foo.json.spt").body
+    response = harness.simple( BIG_SIMPLATE
+                             , filepath="foo.json.spt"
+                             , website_configuration={'json_stream': 'yes'}
+                              )
+    assert ''.join(response.body) == expected
+
+def test_json_dump_streams_compact_json(harness):
+    response = harness.simple( BIG_SIMPLATE
+                             , filepath="foo.json.spt"
+                             , website_configuration={'json_stream': 'yes', 'json_compact': 'yes'}
+                              )
+    assert ''.join(response.body) == json.dumps({'b': list(range(5000)), 'a': 'A'}, **json.COMPACT)
+
+def test_json_dump_errors_while_streaming_still_get_an_error_response(harness):
+    response = harness.simple( "[---]\n[---] application/json\n{'Greetings': object()}"
+                             , filepath="foo.json.spt"
+                             , website_configuration={'json_stream': 'yes'}
+                             , raise_immediately=False
+                              )
+    assert response.code == 500
+
+
+# encoders and backends
+
+@yield_fixture
+def restore_json():
+    backends = list(json.backends)
+    encoders = dict(json.encoders)
+    yield
+    json.backends[:] = backends
+    json.encoders.clear()
+    json.encoders.update(encoders)
+    json._resolved.clear()
+    json.use_backend()
+
+class Moment(datetime.datetime):
+    pass
+
+class Shape(object):
+    pass
+
+class Square(Shape):
+    pass
+
+class OldShape:
+    pass
+
+class OldSquare(OldShape):
+    pass
+
+def test_encoders_apply_to_subclasses():
+    moment = Moment(2014, 1, 2, 3, 4, 5)
+    assert json.dumps([moment]) == json.dumps([datetime.datetime(2014, 1, 2, 3, 4, 5)])
+
+def test_the_nearest_encoder_wins(restore_json):
+    json.register_encoder(Shape, lambda obj: 'shape')
+    assert json.dumps(Square()) == '"shape"'
+    json.register_encoder(Square, lambda obj: 'square')
+    assert json.dumps(Square()) == '"square"'
+    json.unregister_encoder(Square)
+    assert json.dumps(Square()) == '"shape"'
+
+def test_encoders_apply_to_subclasses_of_old_style_classes(restore_json):
+    json.register_encoder(OldShape, lambda obj: 'old shape')
+    assert json.dumps(OldSquare()) == '"old shape"'
+
+def test_find_encoder_remembers_what_it_found(restore_json):
+    json.register_encoder(Shape, lambda obj: 'shape')
+    assert json.find_encoder(Square) is json.encoders[Shape]
+    assert json._resolved[Square] is json.encoders[Shape]
+    assert json.find_encoder(OldSquare) is None
+    assert json._resolved[OldSquare] is None
+
+def test_unregistering_an_encoder_stops_it_applying_to_subclasses(restore_json):
+    json.register_encoder(Shape, lambda obj: 'shape')
+    assert json.dumps(Square()) == '"shape"'
+    json.unregister_encoder(Shape)
+    raises(TypeError, json.dumps, Square())
+
+def test_json_prefers_the_first_installed_backend(restore_json):
+    def missing():
+        raise ImportError
+    json.register_backend('missing', missing, 0)
+    json.register_backend('fast', lambda: json.Backend('fast', stdlib_json), 1)
+    assert json.use_backend().name == 'fast'
+    assert json.backend.name == 'fast'
+
+def test_json_can_use_a_faster_decoder(restore_json):
+    decoded = []
+    def loads(s):
+        decoded.append(s)
+        return stdlib_json.loads(s)
+    json.register_backend('fast', lambda: json.Backend('fast', stdlib_json, loads))
+    json.use_backend('fast')
+    assert json.loads('{"cheese": "puffs"}') == {'cheese': 'puffs'}
+    assert json.loads('{"cheese": 1.5}', parse_float=str) == {'cheese': '1.5'}
+    assert decoded == ['{"cheese": "puffs"}']
+
+def test_json_encoders_work_with_any_backend(restore_json):
+    json.register_backend('other', lambda: json.Backend('other', stdlib_json))
+    json.use_backend('other')
+    assert json.dumps(complex(1, 2), indent=None) == '[1.0, 2.0]'
+
+def test_json_can_use_a_faster_encoder_for_compact_json(restore_json):
+    encoded = []
+    def dumps(obj):
+        encoded.append(obj)
+        return stdlib_json.dumps(obj, separators=(',', ':'), default=json.default)
+    json.register_backend('fast', lambda: json.Backend('fast', stdlib_json, dumps=dumps))
+    json.use_backend('fast')
+    assert json.dumps({'cheese': complex(1, 2)}, **json.COMPACT) == '{"cheese":[1.0,2.0]}'
+    numbers = list(range(250))
+    assert ''.join(json.iterencode(numbers, **json.COMPACT)) == dumps(numbers)
+    json.dumps({'cheese': 'puffs'})
+    json.dumps({'cheese': 'puffs'}, cls=json.FriendlyEncoder, **json.COMPACT)
+    assert len(encoded) == 5  # the dict, three batches of the list, and the list
+
+def test_builtin_backends_encode_compact_json_like_an_encoder(restore_json):
+    json.register_encoder(Shape, lambda obj: 'shape')
+    obj = {'shapes': [Square(), datetime.date(2014, 1, 2)], 'n': 1.5}
+    compact = json.dumps(obj, **json.COMPACT)
+    assert compact == json.dumps(obj, cls=json.FriendlyEncoder, **json.COMPACT)
+    raises(TypeError, json.dumps, OldSquare(), **json.COMPACT)
+
+def test_use_backend_raises_for_backends_it_cant_use(restore_json):
+    def missing():
+        raise ImportError
+    json.register_backend('missing', missing)
+    before = json.backend
+    raises(KeyError, json.use_backend, 'unknown')
+    raises(ImportError, json.use_backend, 'missing')
+    assert json.backend is before
+
+def test_json_without_a_backend_raises_ImportError(restore_json):
+    json.backends[:] = []
+    assert json.use_backend() is None
+    raises(ImportError, json.dumps, {})
+
+
 # jsonp
 
 JSONP_SIMPLATE = """[---]\n[---] application/javascript via jsonp_dump
@@ -192,4 +410,10 @@ def test_jsonp_filters_disallowed_chars(harness):
     actual = _jsonp_query(harness, "callback=f+o+o")
     assert actual == JSONP_RESULT, "wanted %r got %r " % (JSONP_RESULT, actual)
 
-
+def test_jsonp_can_stream(harness):
+    response = harness.simple( JSONP_SIMPLATE
+                             , QUERY_STRING="callback=foo"
+                             , website_configuration={'json_stream': 'yes'}
+                              )
+    assert not isinstance(response.body, basestring)
+    assert ''.join(response.body) == JSONP_RESULT
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from pytest import mark
+
+from aspen import precompile, resources
+
+
+SIMPLATE = "[---]\nfoo = 'bar'\n[---]\nGreetings, %(foo)s!"
+
+
+def test_find_simplates_finds_simplates(harness):
+    harness.fs.www.mk( ('index.html.spt', SIMPLATE)
+                     , ('foo/%bar.spt', SIMPLATE)
+                     , ('foo/baz.html', 'Greetings, program!')
+                     , ('.hidden/secret.spt', SIMPLATE)
+                      )
+    harness.fs.project.mk(('error.spt', SIMPLATE),)
+    actual = list(precompile.find_simplates(harness.client.website))
+    assert actual == [ harness.fs.www.resolve('index.html.spt')
+                     , harness.fs.www.resolve('foo/%bar.spt')
+                     , harness.fs.project.resolve('error.spt')
+                      ]
+
+def test_compile_simplate_reports_syntax_errors(harness):
+    harness.fs.www.mk(('index.html.spt', "[---]\nfoo = \n[---]\n"),)
+    fspath, seconds, error, seed = precompile.compile_simplate(harness.fs.www.resolve('index.html.spt'))
+    assert seconds >= 0
+    assert 'SyntaxError' in error
+    assert seed is None
+
+@mark.parametrize('processes', [0, 2])
+def test_precompile_warms_the_resource_cache(harness, processes):
+    harness.fs.www.mk( ('index.html.spt', SIMPLATE)
+                     , ('foo.html.spt', SIMPLATE)
+                     , ('bar.html.spt', "1/0\n[---]\n[---]\n")
+                      )
+    reports = precompile.precompile(harness.client.website, processes=processes)
+    errors = dict((report.fspath, report.error) for report in reports)
+    assert errors[harness.fs.www.resolve('index.html.spt')] is None
+    assert errors[harness.fs.www.resolve('foo.html.spt')] is None
+    assert 'ZeroDivisionError' in errors[harness.fs.www.resolve('bar.html.spt')]
+    assert harness.fs.www.resolve('index.html.spt') in resources.__cache__
+    assert precompile.log_reports(reports) == 1
+
+def test_website_can_precompile_at_startup(harness):
+    harness.fs.www.mk(('index.html.spt', SIMPLATE),)
+    harness.client.hydrate_website(precompile_simplates='yes')
+    assert harness.fs.www.resolve('index.html.spt') in resources.__cache__
+    assert harness.client.GET('/').body == 'Greetings, bar!'
+    assert resources.__cache__.stats()['hits'] == 1
+
+def test_precompile_compiles_every_content_page(harness):
+    harness.fs.www.mk(('index.spt', "[---]\n[---] text/plain\nfoo\n[---] text/html\nbar"),)
+    precompile.precompile(harness.client.website, processes=0)
+    renderers = resources.get(harness.client.website, harness.fs.www.resolve('index.spt')).renderers
+    assert all(renderer._renderer is not None for renderer in renderers.values())
+
+@mark.parametrize('fast_locals', ['no', 'yes'])
+def test_precompile_loads_the_code_objects_it_compiled(harness, monkeypatch, fast_locals):
+    from aspen import simplates
+    harness.fs.www.mk(('index.html.spt', SIMPLATE),)
+    website = harness.client.hydrate_website(simplate_fast_locals=fast_locals)
+    def boom(*a, **kw):
+        raise AssertionError("compiled twice")
+    monkeypatch.setattr(simplates, 'compile_python_pages', boom)
+    reports = precompile.precompile(website, processes=0)
+    assert [report.error for report in reports] == [None]
+    assert harness.client.GET('/').body == 'Greetings, bar!'
+    assert website.bytecode_cache is None
+
+def test_seeded_bytecode_cache_ignores_changed_simplates():
+    seeded = precompile.SeededBytecodeCache()
+    seeded.seeds['foo.spt'] = ('not the hash', b'')
+    assert seeded.load('foo.spt', b'raw') is None
+    assert seeded.seeds == {}
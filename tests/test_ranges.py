@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from aspen.http.ranges import coalesce_ranges, if_range_matches, multipart_byteranges, parse_range
+from aspen.utils import utc
+
+
+# parse_range
+# ===========
+
+def test_parse_range_parses_a_range():
+    assert parse_range(b'bytes=0-9', 100) == [(0, 10)]
+
+def test_parse_range_parses_an_open_range():
+    assert parse_range(b'bytes=90-', 100) == [(90, 100)]
+
+def test_parse_range_parses_a_suffix_range():
+    assert parse_range(b'bytes=-10', 100) == [(90, 100)]
+
+def test_parse_range_clamps_to_size():
+    assert parse_range(b'bytes=90-200', 100) == [(90, 100)]
+    assert parse_range(b'bytes=-200', 100) == [(0, 100)]
+
+def test_parse_range_parses_several_ranges():
+    assert parse_range(b'bytes=0-0, 5-9 ,-1', 100) == [(0, 1), (5, 10), (99, 100)]
+
+def test_parse_range_drops_unsatisfiable_ranges():
+    assert parse_range(b'bytes=0-0,100-', 100) == [(0, 1)]
+
+def test_parse_range_returns_empty_list_when_nothing_is_satisfiable():
+    assert parse_range(b'bytes=100-', 100) == []
+    assert parse_range(b'bytes=-0', 100) == []
+
+def test_coalesce_ranges_merges_overlapping_and_adjacent_ranges():
+    assert coalesce_ranges([(50, 60), (0, 10), (5, 20), (20, 30)]) == [(0, 30), (50, 60)]
+    assert coalesce_ranges([(0, 100)] * 3) == [(0, 100)]
+
+def test_coalesce_ranges_keeps_the_clients_order_otherwise():
+    assert coalesce_ranges([(50, 60), (0, 10)]) == [(50, 60), (0, 10)]
+
+def test_parse_range_ignores_other_units():
+    assert parse_range(b'pages=1-2', 100) is None
+
+def test_parse_range_ignores_garbage():
+    assert parse_range(b'bytes=a-b', 100) is None
+    assert parse_range(b'bytes=5-1', 100) is None
+    assert parse_range(b'bytes=-', 100) is None
+    assert parse_range(b'bytes=', 100) is None
+    assert parse_range(b'bytes', 100) is None
+
+
+# if_range_matches
+# ================
+
+LAST_MODIFIED = datetime.datetime(2014, 1, 28, 12, 34, 56, tzinfo=utc)
+
+def test_if_range_matches_matching_etag():
+    assert if_range_matches(b'"abc"', b'"abc"', LAST_MODIFIED)
+
+def test_if_range_matches_does_not_match_weak_etag():
+    assert not if_range_matches(b'W/"abc"', b'"abc"', LAST_MODIFIED)
+
+def test_if_range_matches_matching_date():
+    assert if_range_matches(b'Tue, 28 Jan 2014 12:34:56 GMT', b'"abc"', LAST_MODIFIED)
+
+def test_if_range_matches_does_not_match_other_date():
+    assert not if_range_matches(b'Tue, 28 Jan 2014 12:34:57 GMT', b'"abc"', LAST_MODIFIED)
+
+def test_if_range_matches_does_not_match_garbage():
+    assert not if_range_matches(b'garbage', b'"abc"', LAST_MODIFIED)
+
+
+# multipart_byteranges
+# ====================
+
+def test_multipart_byteranges_assembles_parts():
+    data = b'0123456789'
+    content_type, length, body = multipart_byteranges( [(0, 2), (8, 10)]
+                                                     , len(data)
+                                                     , 'text/plain'
+                                                     , lambda start, stop: [data[start:stop]]
+                                                      )
+    boundary = content_type.split(b'boundary=')[1]
+    body = b''.join(body)
+    assert body == ( b'--%(b)s\r\n'
+                     b'Content-Type: text/plain\r\n'
+                     b'Content-Range: bytes 0-1/10\r\n'
+                     b'\r\n'
+                     b'01\r\n'
+                     b'--%(b)s\r\n'
+                     b'Content-Type: text/plain\r\n'
+                     b'Content-Range: bytes 8-9/10\r\n'
+                     b'\r\n'
+                     b'89\r\n'
+                     b'--%(b)s--\r\n'
+                    ) % {b'b': boundary}
+    assert length == len(body)
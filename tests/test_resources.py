@@ -4,8 +4,11 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import threading
+import time
 
-from aspen import Response
+from aspen import Response, resources
+from aspen.exceptions import LoadError
 from aspen.simplates.pagination import split
 from pytest import raises
 
@@ -155,3 +158,111 @@ def test_offset_calculation_advanced(harness):
         '\n\n\n\n\n\n[---]\n'
         'Monkey\nHead\n') #Be careful: this is implicit concation, not a tuple
     check_offsets(raw, [0, 4, 6, 13])
+
+
+# Resource cache
+
+def test_resource_cache_counts_hits_and_misses(harness):
+    harness.simple('Greetings, program!', 'index.html')
+    harness.client.GET('/')
+    stats = resources.__cache__.stats()
+    assert stats['entries'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['load_time'] >= 0
+
+def test_resource_cache_reloads_when_mtime_changes(harness):
+    harness.simple('Greetings, program!', 'index.html')
+    fspath = harness.fs.www.resolve('index.html')
+    with open(fspath, 'w') as f:
+        f.write('Greetings, world!')
+    os.utime(fspath, (0, 1))
+    assert harness.client.GET('/').body == 'Greetings, world!'
+    assert resources.__cache__.stats()['misses'] == 2
+
+def test_resource_cache_loads_once_for_concurrent_first_hits(harness, monkeypatch):
+    harness.fs.www.mk(('index.html.spt', '[---]\n[---]\nGreetings, program!'),)
+    website = harness.client.website
+    fspath = harness.fs.www.resolve('index.html.spt')
+
+    loads = []
+    load = resources.load
+    def slow_load(*a, **kw):
+        loads.append(a)
+        time.sleep(0.1)
+        return load(*a, **kw)
+    monkeypatch.setattr(resources, 'load', slow_load)
+
+    results = []
+    threads = [ threading.Thread(target=lambda: results.append(resources.get(website, fspath)))
+                for i in range(8)
+               ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert resources.__cache__.stats()['misses'] == 1
+
+def test_resource_cache_raises_load_errors_on_every_hit(harness):
+    harness.fs.www.mk(('index.html.spt', '1/0\n[---]\n[---]\nGreetings, program!'),)
+    website = harness.client.website
+    fspath = harness.fs.www.resolve('index.html.spt')
+    raises(LoadError, resources.get, website, fspath)
+    raises(LoadError, resources.get, website, fspath)
+
+def test_resource_cache_estimates_sizes(harness):
+    harness.fs.www.mk( ('small.txt', 'x')
+                     , ('big.txt', 'x' * 10000)
+                     , ('page.spt', "[---]\nfoo = 'bar'\n[---]\n%(foo)s")
+                      )
+    website = harness.client.website
+    small = resources.estimate_size(resources.get(website, harness.fs.www.resolve('small.txt')))
+    big = resources.estimate_size(resources.get(website, harness.fs.www.resolve('big.txt')))
+    page = resources.estimate_size(resources.get(website, harness.fs.www.resolve('page.spt')))
+    assert big - small >= 9999
+    assert page > 0
+    assert website.resource_cache.stats()['bytes'] == small + big + page
+
+def test_resource_cache_counts_content_pages_compiled_lazily(harness):
+    harness.fs.www.mk(('page.spt', "[---]\n[---] text/html via aspen_template\n<p>{{ foo }}</p>\n"
+                                   "[---] application/json\n{'foo': foo}"),)
+    website = harness.client.website
+    resource = resources.get(website, harness.fs.www.resolve('page.spt'))
+    before = website.resource_cache.stats()['bytes']
+    resource.compile_renderers()
+    after = website.resource_cache.stats()['bytes']
+    assert after > before
+    assert after == resources.estimate_size(resource)
+
+def test_resource_cache_is_unbounded_by_default(website):
+    assert website.resource_cache.max_bytes == 0
+
+def test_resource_cache_evicts_least_recently_used(harness):
+    harness.fs.www.mk( ('a.txt', 'a' * 1000)
+                     , ('b.txt', 'b' * 1000)
+                     , ('c.txt', 'c' * 1000)
+                      )
+    website = harness.client.hydrate_website(resource_cache_size='2500')
+    harness.client.GET('/a.txt')
+    harness.client.GET('/b.txt')
+    harness.client.GET('/a.txt')  # now b is least recently used
+    harness.client.GET('/c.txt')
+
+    cache = website.resource_cache
+    assert harness.fs.www.resolve('a.txt') in cache
+    assert harness.fs.www.resolve('b.txt') not in cache
+    assert harness.fs.www.resolve('c.txt') in cache
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= 2500
+    assert stats['max_bytes'] == 2500
+
+def test_resource_cache_keeps_entry_bigger_than_budget(harness):
+    harness.fs.www.mk(('a.txt', 'a' * 1000),)
+    website = harness.client.hydrate_website(resource_cache_size='10')
+    assert harness.client.GET('/a.txt').body == 'a' * 1000
+    assert harness.fs.www.resolve('a.txt') in website.resource_cache
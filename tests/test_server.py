@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import tempfile
+from io import BytesIO
+
+from pytest import mark
+
+from aspen import server
+from aspen.server import SendfileHandler
+
+
+class RequestHandler(object):
+    def log_request(self, *a):
+        pass
+
+def serve(harness, stdout):
+    environ = { 'REQUEST_METHOD': b'GET'
+              , 'PATH_INFO': b'/big.txt'
+              , 'SERVER_NAME': b'localhost'
+              , 'SERVER_PORT': b'8080'
+              , 'SERVER_PROTOCOL': b'HTTP/1.1'
+              , 'wsgi.url_scheme': b'http'
+               }
+    handler = SendfileHandler(BytesIO(), stdout, BytesIO(), environ)
+    handler.request_handler = RequestHandler()
+    handler.run(harness.client.website)
+    return handler
+
+BIG = b'Greetings, program!\n' * 10
+
+
+def test_sendfile_handler_falls_back_without_a_real_file(harness):
+    harness.fs.www.mk(('big.txt', BIG))
+    harness.client.hydrate_website(stream_static_above='100')
+    stdout = BytesIO()
+    serve(harness, stdout)
+    assert stdout.getvalue().endswith(b'\r\n\r\n' + BIG)
+
+def test_sendfile_handler_uses_sendfile(harness, monkeypatch):
+    calls = []
+    def sendfile(outfd, infd, offset, count):
+        calls.append((offset, count))
+        os.lseek(infd, offset, os.SEEK_SET)
+        return os.write(outfd, os.read(infd, min(count, 50)))
+    monkeypatch.setattr(server, 'sendfile', sendfile)
+
+    harness.fs.www.mk(('big.txt', BIG))
+    harness.client.hydrate_website(stream_static_above='100')
+    stdout = tempfile.TemporaryFile()
+    serve(harness, stdout)
+    stdout.seek(0)
+    assert stdout.read().endswith(b'\r\n\r\n' + BIG)
+    assert calls == [(0, 200), (50, 150), (100, 100), (150, 50)]
+
+@mark.skipif(server.sendfile is None, reason="no sendfile(2) here")
+def test_sendfile_handler_sends_a_real_file(harness, monkeypatch):
+    sent = []
+    def sendfile(*a):
+        sent.append(real_sendfile(*a))
+        return sent[-1]
+    real_sendfile = server.sendfile
+    monkeypatch.setattr(server, 'sendfile', sendfile)
+
+    harness.fs.www.mk(('big.txt', BIG))
+    harness.client.hydrate_website(stream_static_above='100')
+    stdout = tempfile.TemporaryFile()
+    serve(harness, stdout)
+    stdout.seek(0)
+    assert stdout.read().endswith(b'\r\n\r\n' + BIG)
+    assert sum(sent) == len(BIG)
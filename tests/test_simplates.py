@@ -4,7 +4,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from aspen.simplates import _decode
+from aspen.simplates import _decode, renderers
+from aspen.simplates.context import Context, names_deleted, names_used
 from pytest import raises
 
 
@@ -88,6 +89,92 @@ foo = foo()
     assert response.body == 'baz'
 
 
+def test_page_one_cant_mutate_page_zero(harness):
+    harness.fs.www.mk(('index.spt', "n = 0\n[---]\nn += 1\n[---] via stdlib_format\n{n}"),)
+    assert harness.client.GET('/').body == '1'
+    assert harness.client.GET('/').body == '1'
+
+
+def test_page_one_can_see_page_zero_and_state_dynamically(harness):
+    response = harness.simple("""\
+foo = 'bar'
+[---]
+baz = eval('foo') + globals()['request'].method
+[---] via stdlib_format
+{baz}""")
+    assert response.body == 'barGET'
+
+
+def test_names_used_finds_names_in_nested_code():
+    code = compile("def f():\n    return [g(x) for x in h]\nclass C:\n    y = z\n", '', 'exec')
+    assert set(['f', 'g', 'h', 'C', 'z']) <= names_used(code)
+
+
+def test_names_used_punts_on_dynamic_namespaces():
+    assert names_used(compile("x = globals()", '', 'exec')) is None
+    assert names_used(compile("exec 'x = 1'", '', 'exec')) is None
+
+
+def test_names_deleted_finds_deleted_names():
+    code = compile("del a\ndef f():\n    global b\n    del b\n    c = 1\n    del c\n", '', 'exec')
+    assert names_deleted(code) == frozenset(['a', 'b'])
+
+
+def test_context_prefers_page_one_then_page_zero():
+    context = Context({'a': 1})
+    context.fall_back(({'a': 2, 'b': 2, 'd': 4}, {'c': 3, 'd': 5}), ['d'])
+    assert (context['a'], context['b'], context['c']) == (1, 2, 3)
+    assert 'd' not in context
+    assert context.get('d') is None
+    assert context.copy() == {'a': 1, 'b': 2, 'c': 3}
+    assert type(context.copy()) is dict
+    assert sorted(context) == ['a', 'b', 'c']
+    assert len(context) == 3
+
+
+def test_context_raises_key_error_for_hidden_names():
+    context = Context()
+    context.fall_back(({'d': 4},), ['d'])
+    with raises(KeyError):
+        context['d']
+
+
+def test_renderers_get_a_dict(harness):
+    seen = []
+    class Spy(renderers.Renderer):
+        def render_content(self, context):
+            seen.append(type(context))
+            return ''
+    class Factory(renderers.Factory):
+        Renderer = Spy
+    harness.client.website.renderer_factories['spy'] = Factory(harness.client.website)
+    harness.simple("foo = 1\n[---]\nbar = foo\n[---] text/plain via spy\n")
+    assert issubclass(seen[0], dict)
+
+
+def test_context_does_not_copy_page_zero(harness):
+    sizes = []
+    class Spy(renderers.Renderer):
+        def render_content(self, context):
+            sizes.append(dict.__len__(context))
+            return '%(bar)s %(name_999)s' % context
+    class Factory(renderers.Factory):
+        Renderer = Spy
+    harness.client.website.renderer_factories['spy'] = Factory(harness.client.website)
+    page_zero = ''.join('name_%d = %d\n' % (i, i) for i in range(1000))
+    response = harness.simple(page_zero + "[---]\nbar = name_1\n[---] text/plain via spy\n")
+    assert response.body == '1 999'
+    assert sizes[0] < 10
+
+
+def test_page_one_can_hide_page_zero_names_with_del(harness):
+    response = harness.simple( "secret = 'shh'\n[---]\ndel secret\n[---] via stdlib_format\n"
+                               "{secret}"
+                             , raise_immediately=False
+                              )
+    assert response.code == 500
+
+
 def test_one_page_works(harness):
     response = harness.simple("Template")
     assert response.body == 'Template'
@@ -207,3 +294,73 @@ def test_decode_cant_take_encoding_from_bad_line_formats():
             """.format(fmt)
             raises(UnicodeDecodeError, _decode, raw)
         yield test
+
+
+# fast locals
+
+def fast(harness, content, **kw):
+    harness.fs.www.mk(('index.spt', content),)
+    harness.client.hydrate_website(simplate_fast_locals='yes')
+    return harness.client.GET('/', **kw)
+
+def test_fast_locals_runs_page_one_as_a_function(harness):
+    harness.fs.www.mk(('index.spt', "[---]\nx = 1\n[---]\n%(x)s"),)
+    harness.client.hydrate_website(simplate_fast_locals='yes')
+    simplate = harness.client.GET('/', want='resource')
+    assert simplate.page_one_function.co_varnames[:2] == ('x', '__unbound__')
+
+def test_fast_locals_can_update_page_zero_and_state(harness):
+    response = fast(harness, "n = 0\n[---]\nn += 1\nmethod = request.method * n\n"
+                             "[---] via stdlib_format\n{n} {method}")
+    assert response.body == '1 GET'
+
+def test_fast_locals_supports_closures(harness):
+    response = fast(harness, "[---]\nbar = 'baz'\ndef foo():\n    return bar\nfoo = foo()\n"
+                             "[---] via stdlib_format\n{foo}")
+    assert response.body == 'baz'
+
+def test_fast_locals_respects_all(harness):
+    response = fast(harness, "[---]\nfoo = 'bar'\n__all__ = ['foo']\n"
+                             "[---] via stdlib_format\n{foo}")
+    assert response.body == 'bar'
+
+def test_fast_locals_lets_responses_be_raised(harness):
+    response = fast(harness, "from aspen import Response\n[---]\nraise Response(404)\n[---]\n",
+                    raise_immediately=False)
+    assert response.code == 404
+
+def test_fast_locals_keeps_unassigned_names_unbound(harness):
+    response = fast(harness, "[---]\nif False:\n    x = 1\ny = x\n[---]\n", raise_immediately=False)
+    assert response.code == 500
+
+def test_fast_locals_falls_back_to_exec_for_import_star(harness):
+    harness.fs.www.mk(('index.spt', "[---]\nfrom os.path import *\n[---] via stdlib_format\n{curdir}"),)
+    harness.client.hydrate_website(simplate_fast_locals='yes')
+    assert harness.client.GET('/', want='resource').page_one_function is None
+    assert harness.client.GET('/').body == '.'
+
+def test_fast_locals_closures_see_inherited_values(harness):
+    response = fast(harness, "n = 2\nthings = [3, 1, 2]\n[---]\n"
+                             "out = sorted(things, key=lambda t: t * n)\nn = 5\n"
+                             "[---] via stdlib_format\n{out} {n}")
+    assert response.body == '[1, 2, 3] 5'
+
+def test_fast_locals_closures_can_be_read_before_assignment(harness):
+    response = fast(harness, "n = 3\n[---]\nout = n\ndef f():\n    return n\nn = 7\nlate = f()\n"
+                             "[---] via stdlib_format\n{out} {late}")
+    assert response.body == '3 7'
+
+def test_fast_locals_falls_back_to_exec_for_closures_with_nothing_to_inherit(harness):
+    raises(NameError, fast, harness, "[---]\nout = n\ndef f():\n    return n\nn = 7\n[---]\n")
+
+def test_fast_locals_doesnt_pass_closures_assigned_first(harness):
+    harness.fs.www.mk(('index.spt', "[---]\nbar = 'baz'\nfoo = lambda: bar\n[---]\n"),)
+    harness.client.hydrate_website(simplate_fast_locals='yes')
+    code = harness.client.GET('/', want='resource').page_one_function
+    assert 'bar' in code.co_cellvars
+    assert 'bar' not in code.co_varnames[:code.co_argcount]
+
+def test_fast_locals_can_hide_page_zero_names_with_del(harness):
+    response = fast(harness, "secret = 'shh'\n[---]\ndel secret\n[---] via stdlib_format\n{secret}",
+                    raise_immediately=False)
+    assert response.code == 500
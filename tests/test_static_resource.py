@@ -0,0 +1,203 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from aspen.http.resource import etag_matches
+from aspen.utils import from_rfc822, to_rfc822, utc
+
+
+def test_static_resource_has_etag_and_last_modified(harness):
+    response = harness.simple('Greetings, program!', 'foo.css')
+    assert response.code == 200
+    assert response.headers['ETag'].startswith(b'"')
+    assert from_rfc822(response.headers['Last-Modified']).tzinfo is utc
+
+def test_etag_changes_with_content(harness):
+    first = harness.simple('Greetings, program!', 'foo.css').headers['ETag']
+    second = harness.simple('Goodbye, program!', 'bar.css').headers['ETag']
+    assert first != second
+
+def test_static_resource_returns_304_for_matching_etag(harness):
+    etag = harness.simple('Greetings, program!', 'foo.css').headers['ETag']
+    response = harness.simple(filepath=None, uripath='/foo.css', HTTP_IF_NONE_MATCH=etag)
+    assert response.code == 304
+    assert response.body == b''
+    assert response.headers['ETag'] == etag
+
+def test_static_resource_returns_200_for_stale_etag(harness):
+    response = harness.simple('Greetings, program!', 'foo.css', HTTP_IF_NONE_MATCH=b'"nope"')
+    assert response.code == 200
+    assert response.body == b'Greetings, program!'
+
+def test_static_resource_returns_304_for_star(harness):
+    response = harness.simple('Greetings, program!', 'foo.css', HTTP_IF_NONE_MATCH=b'*')
+    assert response.code == 304
+
+def test_static_resource_returns_304_for_if_modified_since(harness):
+    later = to_rfc822(datetime.datetime.now(utc) + datetime.timedelta(days=1)).encode('ascii')
+    response = harness.simple('Greetings, program!', 'foo.css', HTTP_IF_MODIFIED_SINCE=later)
+    assert response.code == 304
+
+def test_static_resource_returns_200_when_modified_since(harness):
+    response = harness.simple( 'Greetings, program!'
+                             , 'foo.css'
+                             , HTTP_IF_MODIFIED_SINCE=b'Thu, 01 Jan 1970 00:00:00 GMT'
+                              )
+    assert response.code == 200
+
+def test_static_resource_ignores_garbage_if_modified_since(harness):
+    response = harness.simple('Greetings, program!', 'foo.css', HTTP_IF_MODIFIED_SINCE=b'garbage')
+    assert response.code == 200
+
+def test_if_none_match_trumps_if_modified_since(harness):
+    later = to_rfc822(datetime.datetime.now(utc) + datetime.timedelta(days=1)).encode('ascii')
+    response = harness.simple( 'Greetings, program!'
+                             , 'foo.css'
+                             , HTTP_IF_NONE_MATCH=b'"nope"'
+                             , HTTP_IF_MODIFIED_SINCE=later
+                              )
+    assert response.code == 200
+
+
+def test_etag_matches_matches():
+    assert etag_matches(b'"abc"', b'"abc"')
+
+def test_etag_matches_does_weak_comparison():
+    assert etag_matches(b'"abc"', b'W/"abc"')
+
+def test_etag_matches_handles_lists():
+    assert etag_matches(b'"abc"', b'"def", "abc"')
+
+def test_etag_matches_does_not_match_others():
+    assert not etag_matches(b'"abc"', b'"def", "ghi"')
+
+
+def test_from_rfc822_round_trips():
+    dt = datetime.datetime(2014, 1, 28, 12, 34, 56, tzinfo=utc)
+    assert from_rfc822(to_rfc822(dt)) == dt
+
+
+# Streaming
+# =========
+
+BIG = b'Greetings, program!\n' * 10
+
+def test_big_static_resource_is_streamed_from_disk(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '100'})
+    assert hasattr(response.body, 'read')
+    assert response.body.read() == BIG
+    assert response.headers['Content-Length'] == str(len(BIG))
+    response.body.close()
+
+def test_big_static_resource_has_etag_from_mtime_and_size(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '100'})
+    response.body.close()
+    assert response.headers['ETag'].endswith(b'-%x"' % len(BIG))
+
+def test_big_static_resource_still_returns_304(harness):
+    harness.fs.www.mk(('big.txt', BIG))
+    harness.client.hydrate_website(stream_static_above='100')
+    response = harness.client.GET('/big.txt')
+    response.body.close()
+    etag = response.headers['ETag']
+    response = harness.client.GET('/big.txt', HTTP_IF_NONE_MATCH=etag)
+    assert response.code == 304
+
+def test_small_static_resource_is_not_streamed(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '1000'})
+    assert response.body == BIG
+
+def test_zero_turns_off_streaming(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '0'})
+    assert response.body == BIG
+
+def test_streamed_body_goes_through_wsgi_file_wrapper(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '100'})
+    class FileWrapper(object):
+        def __init__(self, filelike, blksize):
+            self.filelike = filelike
+    wrapped = response({'wsgi.file_wrapper': FileWrapper}, lambda status, headers: None)
+    assert isinstance(wrapped, FileWrapper)
+    assert wrapped.filelike is response.body
+    response.body.close()
+
+def test_streamed_body_is_iterable_without_wsgi_file_wrapper(harness):
+    response = harness.simple(BIG, 'big.txt', website_configuration={'stream_static_above': '100'})
+    body = response({}, lambda status, headers: None)
+    assert b''.join(body) == BIG
+    body.close()
+
+
+# Ranges
+# ======
+
+DIGITS = b'0123456789' * 20
+
+def get_range(harness, range_, stream_static_above='0', **kw):
+    harness.fs.www.mk(('digits.txt', DIGITS))
+    harness.client.hydrate_website(stream_static_above=stream_static_above)
+    response = harness.client.GET('/digits.txt', HTTP_RANGE=range_, **kw)
+    if not isinstance(response.body, bytes):
+        response.body = b''.join(response.body)
+    return response
+
+def test_static_resource_advertises_ranges(harness):
+    response = harness.simple(DIGITS, 'digits.txt')
+    assert response.headers['Accept-Ranges'] == b'bytes'
+
+def test_static_resource_serves_a_range(harness):
+    response = get_range(harness, b'bytes=10-14')
+    assert response.code == 206
+    assert response.body == b'01234'
+    assert response.headers['Content-Range'] == b'bytes 10-14/200'
+    assert response.headers['Content-Length'] == b'5'
+
+def test_static_resource_serves_a_range_from_disk(harness):
+    response = get_range(harness, b'bytes=-5', stream_static_above='100')
+    assert response.code == 206
+    assert response.body == b'56789'
+    assert response.headers['Content-Range'] == b'bytes 195-199/200'
+
+def test_static_resource_serves_multiple_ranges(harness):
+    for stream_static_above in ('0', '100'):
+        response = get_range(harness, b'bytes=0-1,198-', stream_static_above)
+        assert response.code == 206
+        assert response.headers['Content-Type'].startswith(b'multipart/byteranges; boundary=')
+        assert response.headers['Content-Length'] == str(len(response.body))
+        assert b'Content-Range: bytes 0-1/200\r\n\r\n01\r\n' in response.body
+        assert b'Content-Range: bytes 198-199/200\r\n\r\n89\r\n' in response.body
+
+def test_static_resource_coalesces_overlapping_ranges(harness):
+    response = get_range(harness, b'bytes=' + b','.join([b'0-'] * 100))
+    assert response.code == 206
+    assert response.body == DIGITS
+    assert response.headers['Content-Range'] == b'bytes 0-199/200'
+
+def test_static_resource_serves_everything_for_too_many_ranges(harness):
+    response = get_range(harness, b'bytes=' + b','.join(b'%d-%d' % (i, i) for i in range(0, 200, 2)))
+    assert response.code == 200
+    assert response.body == DIGITS
+
+def test_static_resource_returns_416_for_unsatisfiable_range(harness):
+    response = get_range(harness, b'bytes=500-')
+    assert response.code == 416
+    assert response.headers['Content-Range'] == b'bytes */200'
+
+def test_static_resource_ignores_bad_range(harness):
+    response = get_range(harness, b'bytes=oops')
+    assert response.code == 200
+    assert response.body == DIGITS
+
+def test_static_resource_serves_range_for_matching_if_range(harness):
+    etag = harness.simple(DIGITS, 'digits.txt').headers['ETag']
+    response = get_range(harness, b'bytes=0-0', HTTP_IF_RANGE=etag)
+    assert response.code == 206
+    assert response.body == b'0'
+
+def test_static_resource_serves_everything_for_stale_if_range(harness):
+    response = get_range(harness, b'bytes=0-0', HTTP_IF_RANGE=b'"stale"')
+    assert response.code == 200
+    assert response.body == DIGITS
@@ -0,0 +1,159 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import time
+
+from pytest import mark
+
+from aspen import resources, watcher
+
+
+def _watch(Watcher, root):
+    calls = []
+    return Watcher([root], calls.append), calls
+
+def _touch(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+    # Make sure a polling watcher can tell, even on filesystems with
+    # one-second mtime granularity.
+    mtime = time.time() + 10
+    os.utime(path, (mtime, mtime))
+
+
+WATCHERS = [watcher.PollingWatcher]
+if watcher.libc is not None:
+    WATCHERS.append(watcher.InotifyWatcher)
+
+
+@mark.parametrize('Watcher', WATCHERS)
+def test_watcher_sees_nothing_when_nothing_changes(fs, Watcher):
+    fs.mk(('foo.html', 'Greetings, program!'),)
+    w, calls = _watch(Watcher, fs.root)
+    assert w.check() == []
+    assert calls == []
+
+@mark.parametrize('Watcher', WATCHERS)
+def test_watcher_sees_modified_file(fs, Watcher):
+    fs.mk(('foo.html', 'Greetings, program!'),)
+    w, calls = _watch(Watcher, fs.root)
+    _touch(fs.resolve('foo.html'), 'Greetings, world!')
+    assert fs.resolve('foo.html') in w.check(timeout=1)
+    assert len(calls) == 1
+
+@mark.parametrize('Watcher', WATCHERS)
+def test_watcher_sees_new_file_in_new_directory(fs, Watcher):
+    fs.mk(('foo.html', 'Greetings, program!'),)
+    w, calls = _watch(Watcher, fs.root)
+    os.mkdir(fs.resolve('bar'))
+    assert fs.resolve('bar') in w.check(timeout=1)
+    _touch(fs.resolve('bar/baz.html'), 'Greetings, program!')
+    assert fs.resolve('bar/baz.html') in w.check(timeout=1)
+
+@mark.parametrize('Watcher', WATCHERS)
+def test_watcher_sees_deleted_file(fs, Watcher):
+    fs.mk(('foo.html', 'Greetings, program!'),)
+    w, calls = _watch(Watcher, fs.root)
+    os.remove(fs.resolve('foo.html'))
+    assert fs.resolve('foo.html') in w.check(timeout=1)
+
+@mark.parametrize('Watcher', WATCHERS)
+def test_watcher_can_start_and_stop(fs, Watcher):
+    w, calls = _watch(Watcher, fs.root)
+    w.interval = 0.01
+    w.start()
+    w.stop()
+
+def test_watcher_covers_its_roots_and_not_others(fs):
+    w = watcher.PollingWatcher([fs.resolve('foo'), fs.resolve('foo/bar')], None)
+    assert w.roots == [fs.resolve('foo')]
+    assert w.covers(fs.resolve('foo'))
+    assert w.covers(fs.resolve('foo/bar/baz.html'))
+    assert not w.covers(fs.resolve('foobar/baz.html'))
+
+def test_make_watcher_makes_a_watcher(fs):
+    w = watcher.make_watcher([fs.root], None)
+    assert isinstance(w, watcher.Watcher)
+    w.stop()
+
+
+# Website integration
+# ===================
+
+def test_website_doesnt_watch_by_default(website):
+    assert website.watcher is None
+
+def test_website_with_watcher_doesnt_stat_cached_resources(harness, monkeypatch):
+    harness.fs.www.mk(('index.html', 'Greetings, program!'),)
+    website = harness.client.hydrate_website(watch_files='yes', precompile_dispatch='yes')
+    try:
+        assert harness.client.GET('/').body == 'Greetings, program!'
+
+        fspath = harness.fs.www.resolve('index.html')
+        stat = os.stat
+        def boom(path):
+            assert path != fspath, "stat'd a watched file"
+            return stat(path)
+        monkeypatch.setattr(os, 'stat', boom)
+        assert harness.client.GET('/').body == 'Greetings, program!'
+    finally:
+        website.watcher.stop()
+
+def test_website_stats_resources_once_the_watcher_stops(harness):
+    harness.fs.www.mk(('index.html', 'Greetings, program!'),)
+    website = harness.client.hydrate_website(watch_files='yes')
+    assert harness.client.GET('/').body == 'Greetings, program!'
+    website.watcher.stop()
+    harness.fs.www.mk(('index.html', 'Greetings, user!'),)
+    os.utime(harness.fs.www.resolve('index.html'), (0, 0))
+    assert harness.client.GET('/').body == 'Greetings, user!'
+
+def test_watcher_isnt_running_in_a_forked_process(fs, monkeypatch):
+    w, calls = _watch(watcher.PollingWatcher, fs.root)
+    w.start()
+    try:
+        assert w.running
+        monkeypatch.setattr(os, 'getpid', lambda: -1)
+        assert not w.running
+    finally:
+        monkeypatch.undo()
+        w.stop()
+    assert not w.running
+
+def test_website_invalidate_paths_drops_cached_resources(harness):
+    harness.fs.www.mk(('index.html', 'Greetings, program!'),)
+    website = harness.client.hydrate_website(watch_files='yes')
+    website.watcher.stop()
+    harness.client.GET('/')
+    fspath = harness.fs.www.resolve('index.html')
+    assert fspath in resources.__cache__
+    website.invalidate_paths([harness.fs.www.root])
+    assert fspath not in resources.__cache__
+
+def test_website_invalidate_paths_drops_the_asset_for_a_sidecar(harness):
+    harness.fs.www.mk(('foo.css', 'body {}'),)
+    website = harness.client.hydrate_website(watch_files='yes', compress_static='yes')
+    website.watcher.stop()
+    harness.client.GET('/foo.css')
+    fspath = harness.fs.www.resolve('foo.css')
+    assert fspath in resources.__cache__
+    website.invalidate_paths([fspath + '.gz'])
+    assert fspath not in resources.__cache__
+
+def test_website_invalidate_paths_keeps_dispatch_tree_for_modified_files(harness):
+    harness.fs.www.mk(('foo.html', 'Greetings, program!'),)
+    website = harness.client.hydrate_website(precompile_dispatch='yes')
+    tree = website.dispatch_tree
+    harness.fs.www.mk(('foo.html', 'Greetings, user!'),)
+    website.invalidate_paths([harness.fs.www.resolve('foo.html')])
+    assert website.dispatch_tree is tree
+
+def test_website_invalidate_paths_rebuilds_dispatch_tree(harness):
+    website = harness.client.hydrate_website(precompile_dispatch='yes')
+    harness.fs.www.mk(('foo.html', 'Greetings, program!'),)
+    assert harness.client.GxT('/foo.html').code == 404
+    website.invalidate_paths([harness.fs.www.resolve('foo.html')])
+    assert harness.client.GET('/foo.html').body == 'Greetings, program!'
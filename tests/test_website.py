@@ -36,7 +36,10 @@ Content-Type: text/html
 
 Greetings, program!
 """.splitlines())
-    actual = harness.client.GET()._to_http('1.1')
+    response = harness.client.GET()
+    for name in ('ETag', 'Last-Modified', 'Accept-Ranges'):
+        response.headers.pop(name)          # see test_static_resource.py
+    actual = response._to_http('1.1')
     assert actual == expected
 
 def test_fatal_error_response_is_returned(harness):